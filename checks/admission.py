@@ -0,0 +1,226 @@
+"""
+Admission control for the ingest endpoints.
+
+Sheds /sms/receive before the validation backlog grows without bound:
+- 503 while `maintenance_mode` is on (onboarding writes too)
+- 503 once the backlog past `last_processed_uuid` reaches `admission_backlog_hard_limit`,
+  or its oldest row is older than `admission_max_lag_seconds`
+- 429 once it reaches `admission_backlog_soft_limit`, or this process has
+  `admission_max_in_flight` requests in progress
+Every rejection carries a Retry-After. A limit of 0 disables that limit.
+
+The backlog is sampled at most every `refresh_interval` seconds, by one
+process for all of them: the sampler takes a short Redis lease and shares the
+sample under `SAMPLE_KEY`, the other ingest workers read it (each samples on
+its own while Redis is unreachable). A sample reads at most `sample_rows`
+entries of the input_sms primary key past `last_processed_uuid`, so its cost
+stays bounded however far the batch processor falls behind. Beyond that the
+backlog is estimated from the uuid span those entries cover: uuids are
+random (gen_random_uuid), so rows past the checkpoint are spread evenly over
+the rest of the uuid space. The lag is the age of the next row the batch
+processor will take (the first past the checkpoint in uuid order). If the
+refresh fails the last known state is kept.
+"""
+import asyncio
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, List, NamedTuple, Optional
+from .duplicate_check import get_redis_client
+
+DEFAULT_SETTINGS = {
+    'maintenance_mode': 'false',
+    'admission_control': 'true',
+    'admission_max_in_flight': '200',
+    'admission_backlog_soft_limit': '20000',
+    'admission_backlog_hard_limit': '100000',
+    'admission_max_lag_seconds': '0',
+    'admission_retry_after': '5',
+    'maintenance_retry_after': '300',
+    'last_processed_uuid': '00000000-0000-0000-0000-000000000000',
+}
+
+# Shared backlog sample, and the lease of the process taking the next one
+SAMPLE_KEY = 'sms_bridge:admission_sample'
+SAMPLE_LEASE_KEY = 'sms_bridge:admission_sample_lease'
+UUID_SPACE = 2 ** 128
+
+class Rejection(NamedTuple):
+    status_code: int
+    reason: str
+    retry_after: int
+
+def _enabled(value: str) -> bool:
+    return str(value).strip().lower() in ('true', '1', 'yes', 'on')
+
+class AdmissionController:
+    def __init__(self, refresh_interval: float = 1.0, sample_rows: int = 1000):
+        self.refresh_interval = refresh_interval
+        self.sample_rows = sample_rows
+        self.settings: Dict[str, str] = dict(DEFAULT_SETTINGS)
+        self.backlog = 0
+        self.backlog_estimated = False
+        self.lag_seconds = 0.0
+        self.in_flight = 0
+        # Reason /sms/receive is currently being shed, or None
+        self.shedding: Optional[str] = None
+        self.rejections: Dict[str, int] = {}
+        self._last_refresh = 0.0
+        self._lock = asyncio.Lock()
+
+    def _int(self, key: str) -> int:
+        try:
+            return int(float(self.settings.get(key) or DEFAULT_SETTINGS[key]))
+        except ValueError:
+            return int(DEFAULT_SETTINGS[key])
+
+    async def refresh(self, pool):
+        """Re-read the settings and the backlog if the snapshot is older than refresh_interval."""
+        if time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        async with self._lock:
+            if time.monotonic() - self._last_refresh < self.refresh_interval:
+                return  # another request refreshed while we waited
+            try:
+                async with pool.acquire() as conn:
+                    rows = await conn.fetch(
+                        "SELECT setting_key, setting_value FROM system_settings WHERE setting_key = ANY($1::varchar[])",
+                        list(DEFAULT_SETTINGS)
+                    )
+                    self.settings = dict(DEFAULT_SETTINGS)
+                    self.settings.update({row['setting_key']: row['setting_value'] for row in rows})
+                    if _enabled(self.settings['admission_control']):
+                        await self._count_backlog(conn)
+            finally:
+                # Also after a failure, so an unreachable database is not retried by every request
+                self._last_refresh = time.monotonic()
+
+    async def _count_backlog(self, conn):
+        limit = max(self._int('admission_backlog_soft_limit'), self._int('admission_backlog_hard_limit'))
+        if limit <= 0 and self._int('admission_max_lag_seconds') <= 0:
+            self.backlog, self.backlog_estimated, self.lag_seconds = 0, False, 0.0
+            return
+        sample = self._shared_sample()
+        if sample is None:
+            sample = await self._sample_backlog(conn)
+            self._share_sample(sample)
+        self.backlog, self.backlog_estimated = sample['backlog'], sample['estimated']
+        oldest = sample['oldest']
+        self.lag_seconds = max(0.0, time.time() - oldest) if oldest is not None else 0.0
+
+    def _shared_sample(self) -> Optional[dict]:
+        """Another process's recent sample, or None if this process should take one."""
+        try:
+            client = get_redis_client()
+            if client.set(SAMPLE_LEASE_KEY, 1, nx=True, px=max(1, int(self.refresh_interval * 1000))):
+                return None
+            raw = client.get(SAMPLE_KEY)
+        except Exception:
+            return None
+        sample = json.loads(raw) if raw else None
+        # Sampled against another checkpoint (settings not re-read yet here or there): take our own
+        if sample is None or sample.get('checkpoint') != self.settings['last_processed_uuid']:
+            return None
+        return sample
+
+    def _share_sample(self, sample: dict):
+        try:
+            get_redis_client().set(SAMPLE_KEY, json.dumps(sample), px=max(1, int(self.refresh_interval * 5000)))
+        except Exception:
+            pass  # the other processes sample on their own
+
+    async def _sample_backlog(self, conn) -> dict:
+        checkpoint = self.settings['last_processed_uuid']
+        row = await conn.fetchrow("""
+            WITH sample AS (
+                SELECT uuid FROM input_sms WHERE uuid > $1::uuid ORDER BY uuid LIMIT $2
+            )
+            SELECT (SELECT count(*) FROM sample) AS counted,
+                   (SELECT uuid FROM sample ORDER BY uuid DESC LIMIT 1) AS last_uuid,
+                   (SELECT created_at FROM input_sms WHERE uuid > $1::uuid ORDER BY uuid LIMIT 1) AS oldest
+        """, checkpoint, self.sample_rows)
+        backlog, estimated = row['counted'], False
+        if backlog >= self.sample_rows:
+            start = uuid.UUID(checkpoint).int
+            span = uuid.UUID(str(row['last_uuid'])).int - start
+            if span > 0:
+                backlog, estimated = int(backlog * (UUID_SPACE - start) / span), True
+        oldest = row['oldest']
+        return {'checkpoint': checkpoint, 'backlog': backlog, 'estimated': estimated,
+                'oldest': oldest.timestamp() if oldest else None}
+
+    def check(self, kind: str = 'sms') -> Optional[Rejection]:
+        """
+        Rejection for a request of the given kind ('sms' for /sms/receive,
+        'onboarding' for onboarding writes), or None to admit it.
+        """
+        rejection = self._evaluate(kind)
+        if kind == 'sms':
+            self.shedding = rejection.reason if rejection else None
+        if rejection is not None:
+            self.rejections[rejection.reason] = self.rejections.get(rejection.reason, 0) + 1
+        return rejection
+
+    def _evaluate(self, kind: str) -> Optional[Rejection]:
+        if _enabled(self.settings['maintenance_mode']):
+            return Rejection(503, 'maintenance', self._int('maintenance_retry_after'))
+        if kind != 'sms' or not _enabled(self.settings['admission_control']):
+            return None
+
+        retry_after = self._int('admission_retry_after')
+        hard_limit = self._int('admission_backlog_hard_limit')
+        if hard_limit > 0 and self.backlog >= hard_limit:
+            return Rejection(503, 'backlog', retry_after)
+        max_lag = self._int('admission_max_lag_seconds')
+        if max_lag > 0 and self.lag_seconds >= max_lag:
+            return Rejection(503, 'lag', retry_after)
+        soft_limit = self._int('admission_backlog_soft_limit')
+        if soft_limit > 0 and self.backlog >= soft_limit:
+            return Rejection(429, 'backlog', retry_after)
+        max_in_flight = self._int('admission_max_in_flight')
+        if max_in_flight > 0 and self.in_flight >= max_in_flight:
+            return Rejection(429, 'in_flight', retry_after)
+        return None
+
+    @asynccontextmanager
+    async def track(self):
+        """Count an admitted request as in flight while it runs."""
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            'shedding': self.shedding,
+            'maintenance_mode': _enabled(self.settings['maintenance_mode']),
+            'backlog': self.backlog,
+            'backlog_estimated': self.backlog_estimated,
+            'lag_seconds': round(self.lag_seconds, 3),
+            'in_flight': self.in_flight,
+            'rejections': dict(self.rejections),
+        }
+
+    def prometheus_lines(self) -> List[str]:
+        """Admission state in the Prometheus text exposition format."""
+        lines = [
+            "# HELP sms_bridge_ingest_backlog Rows past last_processed_uuid (estimated past the sample size)",
+            "# TYPE sms_bridge_ingest_backlog gauge",
+            f"sms_bridge_ingest_backlog {self.backlog}",
+            "# HELP sms_bridge_ingest_lag_seconds Age of the next row the batch processor takes",
+            "# TYPE sms_bridge_ingest_lag_seconds gauge",
+            f"sms_bridge_ingest_lag_seconds {self.lag_seconds:.3f}",
+            "# HELP sms_bridge_ingest_in_flight /sms/receive requests in progress in this process",
+            "# TYPE sms_bridge_ingest_in_flight gauge",
+            f"sms_bridge_ingest_in_flight {self.in_flight}",
+            "# HELP sms_bridge_ingest_rejected_total Requests rejected by admission control",
+            "# TYPE sms_bridge_ingest_rejected_total counter",
+        ]
+        for reason, count in sorted(self.rejections.items()):
+            lines.append(f'sms_bridge_ingest_rejected_total{{reason="{reason}"}} {count}')
+        return lines
+
+# Shared instance used by the ingest endpoints
+admission = AdmissionController()
@@ -0,0 +1,147 @@
+"""
+Per-batch memo of settings and per-sender facts shared by the validation checks.
+
+The batch processor creates one BatchContext per batch and publishes it via
+the `current_batch` context variable. Checks keep their (sms, pool)
+signature: when a context is active they read settings, onboarding rows,
+message counts and duplicate membership from it, so a sender that appears
+many times in a batch is looked up once. Outside a batch (benchmarks,
+ad-hoc calls) `current_batch.get()` is None and the checks query directly.
+
+Message counts are not written by the blacklist check inside a batch.
+It takes the next count from memory and records a +1 per message. The
+batch write-back applies them as one +k per sender, in the same transaction
+as the verdicts, so a failed batch leaves no partial counts behind.
+"""
+import asyncio
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+current_batch: ContextVar[Optional['BatchContext']] = ContextVar('current_batch', default=None)
+# Per-country setting overrides of the message being evaluated (see checks/validation_plan.py)
+current_overrides: ContextVar[Optional[Mapping[str, str]]] = ContextVar('current_overrides', default=None)
+
+_MISSING = object()
+
+class BatchContext:
+    def __init__(self, pool):
+        self.pool = pool
+        self.settings: Dict[str, str] = {}
+        # mobile_number -> active onboarding row (hash, request_timestamp) or None
+        self.onboarding_rows: Dict[str, Optional[dict]] = {}
+        # sender -> message_count as stored before this batch
+        self.base_counts: Dict[str, int] = {}
+        # sender -> increments taken during this batch
+        self.pending_counts: Dict[str, int] = {}
+        # sms uuid -> (sender, country_code, local_mobile) for each +1 taken by that message
+        self.count_deltas: Dict[str, Tuple[str, str, str]] = {}
+        # sms uuid -> (sender, country_code, local_mobile) for messages that tripped the blacklist
+        self.blacklist_trips: Dict[str, Tuple[str, str, str]] = {}
+        self.validated: Set[str] = set()
+        # (fact name, sender) -> task, so concurrent checks share one lookup
+        self._facts: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    async def prefetch(self, messages: Iterable):
+        """Load settings, onboarding rows and message counts for every sender in one connection."""
+        senders = sorted({sms.local_mobile or sms.sender_number for sms in messages})
+        mobiles = sorted({sms.local_mobile for sms in messages if sms.local_mobile})
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("SELECT setting_key, setting_value FROM system_settings")
+            self.settings = {row['setting_key']: row['setting_value'] for row in rows}
+
+            rows = await conn.fetch("""
+                SELECT mobile_number, hash, request_timestamp FROM onboarding_mobile
+                WHERE mobile_number = ANY($1::varchar[]) AND is_active = true
+            """, mobiles)
+            self.onboarding_rows = {mobile: None for mobile in mobiles}
+            self.onboarding_rows.update({row['mobile_number']: dict(row) for row in rows})
+
+            rows = await conn.fetch(
+                "SELECT sender_number, message_count FROM count_sms WHERE sender_number = ANY($1::varchar[])",
+                senders
+            )
+            self.base_counts = {sender: 0 for sender in senders}
+            self.base_counts.update({row['sender_number']: row['message_count'] for row in rows})
+
+    def setting(self, key: str) -> Optional[str]:
+        overrides = current_overrides.get()
+        if overrides and key in overrides:
+            return overrides[key]
+        return self.settings.get(key)
+
+    async def _once(self, key: Tuple[str, str], compute: Callable[[], Awaitable[object]]):
+        task = self._facts.get(key)
+        if task is None:
+            task = self._facts[key] = asyncio.ensure_future(compute())
+        try:
+            return await task
+        except Exception:
+            # Do not cache failures; a retry of the message looks it up again
+            if self._facts.get(key) is task:
+                del self._facts[key]
+            raise
+
+    async def _fetch_onboarding(self, mobile_number: str) -> Optional[dict]:
+        async with self.pool.acquire() as conn:
+            found = await conn.fetchrow(
+                "SELECT hash, request_timestamp FROM onboarding_mobile WHERE mobile_number = $1 AND is_active = true",
+                mobile_number
+            )
+        row = self.onboarding_rows[mobile_number] = dict(found) if found else None
+        return row
+
+    async def onboarding(self, mobile_number: str) -> Optional[dict]:
+        """Active onboarding row for a mobile number, or None."""
+        row = self.onboarding_rows.get(mobile_number, _MISSING)
+        if row is _MISSING:
+            row = await self._once(('onboarding', mobile_number), lambda: self._fetch_onboarding(mobile_number))
+        return row
+
+    async def next_message_count(self, sms_uuid: str, sender: str, country_code: str, local_mobile: str) -> int:
+        """Count including this message, as the sequential count_sms upsert would have returned it."""
+        if sender not in self.base_counts:
+            async with self.pool.acquire() as conn:
+                stored = await conn.fetchval(
+                    "SELECT message_count FROM count_sms WHERE sender_number = $1", sender
+                )
+            self.base_counts[sender] = stored or 0
+        self.pending_counts[sender] = self.pending_counts.get(sender, 0) + 1
+        self.count_deltas[sms_uuid] = (sender, country_code, local_mobile)
+        return self.base_counts[sender] + self.pending_counts[sender]
+
+    def record_blacklist(self, sms_uuid: str, sender: str, country_code: str, local_mobile: str):
+        self.blacklist_trips[sms_uuid] = (sender, country_code, local_mobile)
+
+    async def sender_fact(self, name: str, sender: str, compute: Callable[[], Awaitable[object]]):
+        """Compute a per-sender fact once per batch (concurrent callers share the lookup)."""
+        return await self._once((name, sender), compute)
+
+    def mark_validated(self, sender: str):
+        """A message from this sender passed validation earlier in the batch."""
+        self.validated.add(sender)
+
+    def is_validated(self, sender: str) -> bool:
+        return sender in self.validated
+
+    def count_updates(self, sms_uuids: Iterable[str]) -> List[Tuple[str, int, str, str]]:
+        """Aggregate +1s taken by the given messages into one (sender, k, country_code, local_mobile) per sender."""
+        totals: Dict[str, list] = {}
+        for sms_uuid in sms_uuids:
+            delta = self.count_deltas.get(sms_uuid)
+            if delta is None:
+                continue
+            sender, country_code, local_mobile = delta
+            if sender in totals:
+                totals[sender][1] += 1
+            else:
+                totals[sender] = [sender, 1, country_code, local_mobile]
+        return [tuple(update) for update in totals.values()]
+
+    def blacklist_updates(self, sms_uuids: Iterable[str]) -> List[Tuple[str, str, str]]:
+        """One (sender, country_code, local_mobile) per sender tripped by the given messages."""
+        trips = {}
+        for sms_uuid in sms_uuids:
+            trip = self.blacklist_trips.get(sms_uuid)
+            if trip is not None:
+                trips.setdefault(trip[0], trip)
+        return list(trips.values())
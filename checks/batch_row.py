@@ -0,0 +1,34 @@
+"""
+Row type for messages flowing through the batch pipeline.
+
+Rows come straight from input_sms, whose columns are already typed and
+constrained by the schema, so they are not re-validated: `BatchRow.from_record`
+copies the six fields out of an asyncpg Record into a NamedTuple (no
+per-instance __dict__, attribute reads by index). Checks read the fields
+directly; `country_code` and `local_mobile` are None when ingest could not
+split the sender number.
+"""
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+class BatchRow(NamedTuple):
+    uuid: str
+    sender_number: str
+    sms_message: str
+    received_timestamp: datetime
+    country_code: Optional[str] = None
+    local_mobile: Optional[str] = None
+
+    @classmethod
+    def from_record(cls, record) -> 'BatchRow':
+        """
+        Build a row from an input_sms record (or mapping). Raises ValueError if a
+        NOT NULL column is missing, so the caller can dead-letter the row.
+        """
+        sender_number = record['sender_number']
+        sms_message = record['sms_message']
+        received_timestamp = record['received_timestamp']
+        if sender_number is None or sms_message is None or received_timestamp is None:
+            raise ValueError("input_sms row is missing sender_number, sms_message or received_timestamp")
+        return cls(str(record['uuid']), sender_number, sms_message, received_timestamp,
+                   record['country_code'], record['local_mobile'])
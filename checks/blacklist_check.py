@@ -1,7 +1,19 @@
+from .batch_context import current_batch
+
 async def validate_blacklist_check(sms, pool):
     # Use structured mobile data for blacklist tracking
-    country_code = sms.country_code if hasattr(sms, 'country_code') and sms.country_code else "91"
-    local_mobile = sms.local_mobile if hasattr(sms, 'local_mobile') and sms.local_mobile else sms.sender_number
+    country_code = sms.country_code or "91"
+    local_mobile = sms.local_mobile or sms.sender_number
+    
+    batch = current_batch.get()
+    if batch is not None:
+        # Inside a batch the count is taken in memory and written back as one +k per sender
+        threshold = int(batch.setting('blacklist_threshold'))
+        count = await batch.next_message_count(sms.uuid, local_mobile, country_code, local_mobile)
+        if count > threshold:
+            batch.record_blacklist(sms.uuid, local_mobile, country_code, local_mobile)
+            return 2  # fail
+        return 1  # pass
     
     async with pool.acquire() as conn:
         threshold = int(await conn.fetchval("SELECT setting_value FROM system_settings WHERE setting_key = 'blacklist_threshold'"))
@@ -21,4 +33,7 @@ async def validate_blacklist_check(sms, pool):
                     local_mobile = EXCLUDED.local_mobile
             """, local_mobile, country_code, local_mobile)
             return 2  # fail
-    return 1  # pass
\ No newline at end of file
+    return 1  # pass
+
+# Side effect: takes a count_sms increment, so it never runs speculatively
+validate_blacklist_check.side_effects = True
@@ -0,0 +1,20 @@
+"""
+Time source for the batch processor's waits.
+
+`batch_processor` reads time and sleeps only through a `Clock`, so a
+simulation can run the real batching loop in virtual time
+(tests/bench/simulate.py) by passing its own clock. `system_clock` is the
+default: monotonic seconds for measuring waits and asyncio.sleep for them.
+"""
+import asyncio
+import time
+
+class Clock:
+    def monotonic(self) -> float:
+        """Seconds from an arbitrary origin; only differences are meaningful."""
+        return time.monotonic()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+system_clock = Clock()
@@ -0,0 +1,243 @@
+"""
+asyncpg pool management: sizing, prepared statements and acquire metrics.
+
+Three logical pools are served:
+    ingest  request handlers; connects through pgbouncer (POSTGRES_HOST/PORT)
+    batch   batch processor and background tasks; same pool as ingest unless
+            BATCH_POSTGRES_HOST is set, in which case it connects to Postgres directly
+    export  GET /export; same pool as batch unless EXPORT_POSTGRES_HOST is set
+            (typically a read replica)
+
+Environment:
+    DB_POOL_MIN_SIZE                connections opened at startup and kept warm (default 2)
+    DB_POOL_MAX_SIZE                upper bound (default: the pgbouncer_pool_size setting, else 10)
+    DB_POOL_MAX_INACTIVE_LIFETIME   seconds before idle connections above min_size close (default 300)
+    DB_PREPARED_STATEMENTS          'true' when pgbouncer keeps named prepared statements: session
+                                    pool mode, or pgbouncer >= 1.21 with max_prepared_statements > 0
+                                    (default false: transaction pooling without them)
+    DB_STATEMENT_CACHE_SIZE         prepared statements cached per connection when enabled (default 100)
+    BATCH_POSTGRES_HOST, BATCH_POSTGRES_PORT (default 5432)
+                                    direct Postgres connection for the batch pool
+    BATCH_DB_POOL_MIN_SIZE, BATCH_DB_POOL_MAX_SIZE (defaults 1 and 5)
+    BATCH_DB_PREPARED_STATEMENTS    prepared statements on the direct batch pool (default true)
+    EXPORT_POSTGRES_HOST, EXPORT_POSTGRES_PORT (default 5432)
+                                    direct connection (e.g. a read replica) for the export pool
+    EXPORT_DB_POOL_MIN_SIZE, EXPORT_DB_POOL_MAX_SIZE (defaults 0 and 2)
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+import asyncpg
+
+# Upper bounds (seconds) of the acquire wait histogram
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+class PoolMetrics:
+    """Acquire counters and wait-time histogram for one pool."""
+    def __init__(self):
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_buckets = [0] * len(WAIT_BUCKETS)
+
+    def record_wait(self, seconds: float):
+        self.acquisitions += 1
+        self.wait_seconds_total += seconds
+        if seconds > self.wait_seconds_max:
+            self.wait_seconds_max = seconds
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if seconds <= bound:
+                self.wait_buckets[i] += 1
+                break
+
+class InstrumentedPool:
+    """
+    asyncpg.Pool wrapper whose acquire() records how long callers waited for a
+    connection and how many are checked out. Everything else is delegated.
+    """
+    def __init__(self, name: str, pool: asyncpg.Pool, prepared_statements: bool, direct: bool):
+        self.name = name
+        self.pool = pool
+        self.prepared_statements = prepared_statements
+        self.direct = direct
+        self.metrics = PoolMetrics()
+
+    @asynccontextmanager
+    async def acquire(self, timeout: Optional[float] = None):
+        started = time.perf_counter()
+        try:
+            conn = await self.pool.acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.record_wait(time.perf_counter() - started)
+        self.metrics.in_use += 1
+        try:
+            yield conn
+        finally:
+            self.metrics.in_use -= 1
+            await self.pool.release(conn)
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+    def stats(self) -> dict:
+        metrics = self.metrics
+        size = self.pool.get_size()
+        max_size = self.pool.get_max_size()
+        return {
+            'pool': self.name,
+            'direct': self.direct,
+            'prepared_statements': self.prepared_statements,
+            'size': size,
+            'idle': self.pool.get_idle_size(),
+            'in_use': metrics.in_use,
+            'min_size': self.pool.get_min_size(),
+            'max_size': max_size,
+            'utilization': round(metrics.in_use / max_size, 3) if max_size else 0.0,
+            'acquisitions': metrics.acquisitions,
+            'acquire_timeouts': metrics.timeouts,
+            'acquire_wait_avg_ms': round(metrics.wait_seconds_total / metrics.acquisitions * 1000, 3)
+                                   if metrics.acquisitions else 0.0,
+            'acquire_wait_max_ms': round(metrics.wait_seconds_max * 1000, 3),
+        }
+
+class PoolManager:
+    """Creates the ingest and batch pools on first use and reports their metrics."""
+    def __init__(self, postgres_config: dict):
+        self.postgres_config = dict(postgres_config)
+        self.pools: Dict[str, InstrumentedPool] = {}
+        self._lock = asyncio.Lock()
+
+    async def _configured_pool_size(self) -> int:
+        """pgbouncer_pool_size from system_settings, read over a one-off connection."""
+        try:
+            conn = await asyncpg.connect(**self.postgres_config, statement_cache_size=0)
+            try:
+                value = await conn.fetchval(
+                    "SELECT setting_value FROM system_settings WHERE setting_key = 'pgbouncer_pool_size'"
+                )
+            finally:
+                await conn.close()
+            return int(value) if value else 10
+        except (OSError, asyncpg.PostgresError, ValueError):
+            return 10
+
+    async def _create(self, name: str, config: dict, min_size: int, max_size: int,
+                      prepared_statements: bool, direct: bool) -> InstrumentedPool:
+        statement_cache_size = _env_int('DB_STATEMENT_CACHE_SIZE', 100) if prepared_statements else 0
+        min_size = min(min_size, max_size)
+        pool = await asyncpg.create_pool(
+            **config,
+            min_size=min_size,
+            max_size=max_size,
+            max_inactive_connection_lifetime=float(_env_int('DB_POOL_MAX_INACTIVE_LIFETIME', 300)),
+            # Without prepared statement support (pgbouncer transaction mode) every query is sent unnamed
+            statement_cache_size=statement_cache_size,
+        )
+        return InstrumentedPool(name, pool, prepared_statements, direct)
+
+    async def get(self, name: str = 'ingest') -> InstrumentedPool:
+        pool = self.pools.get(name)
+        if pool is not None:
+            return pool
+        async with self._lock:
+            return await self._get_locked(name)
+
+    async def _get_locked(self, name: str) -> InstrumentedPool:
+        if name in self.pools:
+            return self.pools[name]
+        if name == 'ingest':
+            max_size = _env_int('DB_POOL_MAX_SIZE', None) or await self._configured_pool_size()
+            pool = await self._create(
+                'ingest', self.postgres_config,
+                min_size=_env_int('DB_POOL_MIN_SIZE', 2),
+                max_size=max_size,
+                prepared_statements=_env_bool('DB_PREPARED_STATEMENTS', False),
+                direct=False,
+            )
+        elif name == 'batch' and os.getenv('BATCH_POSTGRES_HOST'):
+            config = dict(self.postgres_config,
+                          host=os.getenv('BATCH_POSTGRES_HOST'),
+                          port=_env_int('BATCH_POSTGRES_PORT', 5432))
+            pool = await self._create(
+                'batch', config,
+                min_size=_env_int('BATCH_DB_POOL_MIN_SIZE', 1),
+                max_size=_env_int('BATCH_DB_POOL_MAX_SIZE', 5),
+                prepared_statements=_env_bool('BATCH_DB_PREPARED_STATEMENTS', True),
+                direct=True,
+            )
+        elif name == 'batch':
+            pool = await self._get_locked('ingest')  # no direct connection configured: share the ingest pool
+        elif name == 'export' and os.getenv('EXPORT_POSTGRES_HOST'):
+            config = dict(self.postgres_config,
+                          host=os.getenv('EXPORT_POSTGRES_HOST'),
+                          port=_env_int('EXPORT_POSTGRES_PORT', 5432))
+            pool = await self._create(
+                'export', config,
+                min_size=_env_int('EXPORT_DB_POOL_MIN_SIZE', 0),
+                max_size=_env_int('EXPORT_DB_POOL_MAX_SIZE', 2),
+                prepared_statements=True,
+                direct=True,
+            )
+        elif name == 'export':
+            pool = await self._get_locked('batch')
+        else:
+            raise ValueError(f"Unknown pool: {name}")
+        self.pools[name] = pool
+        return pool
+
+    async def close(self):
+        for pool in {id(pool): pool for pool in self.pools.values()}.values():
+            await pool.close()
+        self.pools.clear()
+
+    def stats(self) -> List[dict]:
+        return [pool.stats() for pool in {id(pool): pool for pool in self.pools.values()}.values()]
+
+    def prometheus_lines(self) -> List[str]:
+        """Pool metrics in the Prometheus text exposition format."""
+        gauges = [
+            ('sms_bridge_db_pool_size', 'Open connections', 'size'),
+            ('sms_bridge_db_pool_idle', 'Idle connections', 'idle'),
+            ('sms_bridge_db_pool_in_use', 'Connections checked out', 'in_use'),
+            ('sms_bridge_db_pool_max_size', 'Configured maximum connections', 'max_size'),
+            ('sms_bridge_db_pool_utilization', 'Checked-out share of max_size', 'utilization'),
+        ]
+        pools = list({id(pool): pool for pool in self.pools.values()}.values())
+        lines = []
+        for metric, help_text, key in gauges:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+            for pool in pools:
+                lines.append(f'{metric}{{pool="{pool.name}"}} {pool.stats()[key]}')
+
+        lines += ["# HELP sms_bridge_db_pool_acquire_timeouts_total Acquire calls that timed out",
+                  "# TYPE sms_bridge_db_pool_acquire_timeouts_total counter"]
+        for pool in pools:
+            lines.append(f'sms_bridge_db_pool_acquire_timeouts_total{{pool="{pool.name}"}} {pool.metrics.timeouts}')
+
+        metric = 'sms_bridge_db_pool_acquire_wait_seconds'
+        lines += [f"# HELP {metric} Time spent waiting for a pool connection", f"# TYPE {metric} histogram"]
+        for pool in pools:
+            cumulative = 0
+            for bound, count in zip(WAIT_BUCKETS, pool.metrics.wait_buckets):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{pool="{pool.name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{pool="{pool.name}",le="+Inf"}} {pool.metrics.acquisitions}')
+            lines.append(f'{metric}_sum{{pool="{pool.name}"}} {pool.metrics.wait_seconds_total:.6f}')
+            lines.append(f'{metric}_count{{pool="{pool.name}"}} {pool.metrics.acquisitions}')
+        return lines
@@ -1,19 +1,187 @@
-import redis
-import os
-
-# Use the same Redis configuration as main app
-REDIS_CONFIG = {
-    'host': os.getenv('REDIS_HOST', 'localhost'),
-    'port': int(os.getenv('REDIS_PORT', 6379)),
-    'password': os.getenv('REDIS_PASSWORD', None),
-    'db': 0,
-}
-redis_client = redis.StrictRedis(**REDIS_CONFIG)
+import asyncio
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable, Iterable, Optional, Tuple
+from .batch_context import current_batch
+from .bloom_filter import BloomFilter
+from .redis_store import create_redis_client
+
+# Created on first use, so importing the checks opens no client. Single node, cluster
+# or consistent-hashed nodes depending on the environment (see checks/redis_store.py)
+redis_client = None
+
+def get_redis_client():
+    global redis_client
+    if redis_client is None:
+        redis_client = create_redis_client()
+    return redis_client
+
+# One Redis key per validated number, so each expires after out_sms_cache_ttl on its own
+OUT_SMS_KEY_PREFIX = 'out_sms_number:'
+DEFAULT_CACHE_TTL = 604800
+# Re-read a little before the newest out_sms row seen, so rows committed out of order are not missed
+_SYNC_OVERLAP = timedelta(seconds=5)
+
+class ValidatedNumberFilter:
+    """
+    Bloom filter of numbers validated within out_sms_cache_ttl, kept in sync with out_sms.
+
+    - Loaded from out_sms on first use (or at startup) and rebuilt every
+      `full_reload_interval` seconds, which also drops numbers past the TTL.
+    - Rows inserted by other processes are picked up every `sync_interval`
+      seconds with a forwarded_timestamp range scan; numbers validated by this
+      process are added immediately via `remember_validated_number`.
+    - Rebuilt at twice the size once more numbers were added than it was sized for.
+    """
+    def __init__(self, min_capacity: int = 100000, error_rate: float = 0.01,
+                 sync_interval: float = 2.0, full_reload_interval: float = 3600.0):
+        self.min_capacity = min_capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.full_reload_interval = full_reload_interval
+        self.bloom: Optional[BloomFilter] = None
+        self.ttl = DEFAULT_CACHE_TTL
+        self._newest = None
+        self._last_sync = 0.0
+        self._last_full_reload = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _read_ttl(self, conn):
+        value = await conn.fetchval(
+            "SELECT setting_value FROM system_settings WHERE setting_key = 'out_sms_cache_ttl'"
+        )
+        self.ttl = int(value) if value else DEFAULT_CACHE_TTL
+
+    async def _fetch_numbers(self, conn, since=None):
+        if since is None:
+            return await conn.fetch("""
+                SELECT COALESCE(local_mobile, sender_number) AS number, MAX(forwarded_timestamp) AS forwarded_timestamp
+                FROM out_sms
+                WHERE forwarded_timestamp > NOW() - make_interval(secs => $1)
+                GROUP BY 1
+            """, self.ttl)
+        return await conn.fetch("""
+            SELECT COALESCE(local_mobile, sender_number) AS number, MAX(forwarded_timestamp) AS forwarded_timestamp
+            FROM out_sms
+            WHERE forwarded_timestamp > $1
+            GROUP BY 1
+        """, since)
+
+    def _add_rows(self, rows):
+        for row in rows:
+            self.bloom.add(row['number'])
+            if self._newest is None or row['forwarded_timestamp'] > self._newest:
+                self._newest = row['forwarded_timestamp']
+
+    async def _load(self, pool, before_publish: Optional[Callable[[list], object]] = None):
+        async with pool.acquire() as conn:
+            await self._read_ttl(conn)
+            rows = await self._fetch_numbers(conn)
+        capacity = max(self.min_capacity, 2 * len(rows))
+        if self.bloom is not None and self.bloom.saturated:
+            capacity = max(capacity, 2 * self.bloom.capacity)
+        if before_publish is not None:
+            before_publish(rows)
+        self.bloom = BloomFilter(capacity, self.error_rate)
+        self._newest = None
+        self._add_rows(rows)
+        self._last_sync = self._last_full_reload = time.monotonic()
+        return rows
+
+    async def load(self, pool):
+        """Rebuild the filter from out_sms; returns the (number, forwarded_timestamp) rows loaded."""
+        async with self._lock:
+            return await self._load(pool)
+
+    async def warm(self, get_pool: Callable[[], Awaitable], before_publish: Callable[[list], object]) -> list:
+        """
+        Startup load. The lock is taken before the first await, so duplicate checks started
+        after this task wait for the whole warmup; `before_publish(rows)` (the Redis caching)
+        runs before the filter goes live, so a filter hit for a loaded number always finds
+        its Redis key.
+        """
+        async with self._lock:
+            return await self._load(await get_pool(), before_publish)
+
+    def _needs_reload(self) -> bool:
+        return (self.bloom is None or self.bloom.saturated
+                or time.monotonic() - self._last_full_reload >= self.full_reload_interval)
+
+    async def sync(self, pool):
+        """Pick up numbers validated elsewhere if the filter is stale."""
+        if not self._needs_reload() and time.monotonic() - self._last_sync < self.sync_interval:
+            return
+        async with self._lock:
+            if self._needs_reload():
+                await self._load(pool)
+                return
+            if time.monotonic() - self._last_sync < self.sync_interval:
+                return  # another task synced while we waited
+            async with pool.acquire() as conn:
+                if self._newest is None:
+                    rows = await self._fetch_numbers(conn)
+                else:
+                    rows = await self._fetch_numbers(conn, self._newest - _SYNC_OVERLAP)
+            self._add_rows(rows)
+            self._last_sync = time.monotonic()
+
+    def add(self, number: str):
+        if self.bloom is not None:
+            self.bloom.add(number)
+
+    def might_contain(self, number: str) -> bool:
+        # Without a filter nothing can be ruled out locally
+        return self.bloom is None or number in self.bloom
+
+# Shared instance used by the check and the batch processor
+validated_numbers = ValidatedNumberFilter()
+
+def remember_validated_number(number: str):
+    """Record a number whose SMS was just validated: local filter plus Redis key with TTL."""
+    validated_numbers.add(number)
+    get_redis_client().set(OUT_SMS_KEY_PREFIX + number, 1, ex=validated_numbers.ttl)
+
+def cache_validated_numbers(rows: Iterable[Tuple[str, object]], now, chunk_size: int = 1000) -> int:
+    """
+    Write (number, forwarded_timestamp) pairs to Redis with their remaining TTL, pipelined.
+    Returns the number of keys written.
+    """
+    written = 0
+    pipe = get_redis_client().pipeline(transaction=False)
+    for number, forwarded_timestamp in rows:
+        remaining = validated_numbers.ttl - int((now - forwarded_timestamp).total_seconds())
+        if remaining <= 0:
+            continue
+        pipe.set(OUT_SMS_KEY_PREFIX + number, 1, ex=remaining)
+        written += 1
+        if written % chunk_size == 0:
+            pipe.execute()
+    pipe.execute()
+    return written
+
+async def _previously_validated(local_mobile: str, pool) -> bool:
+    await validated_numbers.sync(pool)
+    if not validated_numbers.might_contain(local_mobile):
+        return False  # definitely not validated within out_sms_cache_ttl, no Redis round-trip
+    # Possible positive: confirm in Redis
+    return bool(get_redis_client().exists(OUT_SMS_KEY_PREFIX + local_mobile))
 
 async def validate_duplicate_check(sms, pool):
     # Use structured mobile data for duplicate tracking
-    local_mobile = sms.local_mobile if hasattr(sms, 'local_mobile') and sms.local_mobile else sms.sender_number
-    
-    if redis_client.sismember('out_sms_numbers', local_mobile):
+    local_mobile = sms.local_mobile or sms.sender_number
+
+    batch = current_batch.get()
+    if batch is not None:
+        # An earlier message from this sender in the same batch already passed
+        if batch.is_validated(local_mobile):
+            return 2  # fail
+        seen = await batch.sender_fact('duplicate', local_mobile, lambda: _previously_validated(local_mobile, pool))
+    else:
+        seen = await _previously_validated(local_mobile, pool)
+
+    if seen:
         return 2  # fail
-    return 1  # pass
\ No newline at end of file
+    return 1  # pass
+
+# Pure read: may run concurrently with, or speculatively ahead of, other checks
+validate_duplicate_check.side_effects = False
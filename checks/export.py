@@ -0,0 +1,106 @@
+"""
+Streaming export of validation results.
+
+Rows are read in keyset pages on the input_sms uuid (`uuid > after ORDER BY
+uuid LIMIT page_size`); each page runs in its own short transaction and is
+read through a server-side cursor `fetch_size` rows at a time. So memory is
+bounded by one fetch whatever the export size, no transaction stays open for
+the whole export, and an interrupted export resumes with `after` set to the
+last uuid received.
+
+Sources:
+    monitor   sms_monitor joined with input_sms; since/until filter input_sms.created_at
+    out_sms   validated messages; since/until filter out_sms.forwarded_timestamp
+
+The time range is a filter, not the scan order: a page walks the uuid index
+until it has page_size matching rows.
+"""
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+EXPORT_SOURCES = {
+    'monitor': {
+        'columns': [
+            'uuid', 'sender_number', 'sms_message', 'received_timestamp', 'created_at',
+            'country_code', 'local_mobile', 'overall_status', 'failed_at_check',
+            'blacklist_check', 'duplicate_check', 'foreign_number_check', 'header_hash_check',
+            'mobile_check', 'time_window_check', 'retry_count', 'processing_completed_at',
+        ],
+        'select': """
+            SELECT i.uuid, i.sender_number, i.sms_message, i.received_timestamp, i.created_at,
+                   i.country_code, i.local_mobile, m.overall_status, m.failed_at_check,
+                   m.blacklist_check, m.duplicate_check, m.foreign_number_check, m.header_hash_check,
+                   m.mobile_check, m.time_window_check, m.retry_count, m.processing_completed_at
+            FROM input_sms i JOIN sms_monitor m ON m.uuid = i.uuid
+        """,
+        'key': 'i.uuid',
+        'time': 'i.created_at',
+    },
+    'out_sms': {
+        'columns': [
+            'uuid', 'sender_number', 'sms_message', 'country_code', 'local_mobile', 'forwarded_timestamp',
+        ],
+        'select': """
+            SELECT o.uuid, o.sender_number, o.sms_message, o.country_code, o.local_mobile, o.forwarded_timestamp
+            FROM out_sms o
+        """,
+        'key': 'o.uuid',
+        'time': 'o.forwarded_timestamp',
+    },
+}
+
+def export_value(value):
+    """JSON/CSV friendly form of a column value."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+def _page_query(source: str, since: Optional[datetime], until: Optional[datetime]):
+    spec = EXPORT_SOURCES[source]
+    conditions = [f"{spec['key']} > $1::uuid"]
+    args = []
+    for bound, operator in ((since, '>='), (until, '<')):
+        if bound is not None:
+            args.append(bound)
+            conditions.append(f"{spec['time']} {operator} ${len(args) + 2}")
+    query = f"""
+        {spec['select']}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {spec['key']}
+        LIMIT $2
+    """
+    return query, args
+
+async def iter_export_chunks(pool, source: str, after: Optional[str] = None, since: Optional[datetime] = None,
+                             until: Optional[datetime] = None, limit: int = 0, page_size: int = 10000,
+                             fetch_size: int = 1000) -> AsyncIterator[List]:
+    """
+    Yield lists of at most fetch_size rows in uuid order, starting after `after`,
+    until `limit` rows (0: all) have been produced or the source is exhausted.
+    """
+    if source not in EXPORT_SOURCES:
+        raise ValueError(f"source must be one of {', '.join(EXPORT_SOURCES)}")
+    last_key = str(uuid.UUID(after)) if after else '00000000-0000-0000-0000-000000000000'
+    query, args = _page_query(source, since, until)
+    produced = 0
+    while True:
+        page_limit = page_size if not limit else min(page_size, limit - produced)
+        if page_limit <= 0:
+            return
+        page_rows = 0
+        async with pool.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                cursor = await conn.cursor(query, last_key, page_limit, *args)
+                while True:
+                    rows = await cursor.fetch(fetch_size)
+                    if not rows:
+                        break
+                    page_rows += len(rows)
+                    last_key = str(rows[-1]['uuid'])
+                    yield rows
+        produced += page_rows
+        if page_rows < page_limit:
+            return
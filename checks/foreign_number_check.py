@@ -1,5 +1,6 @@
 import json
 import re
+from .batch_context import current_batch
 from .mobile_utils import normalize_mobile_number
 
 async def validate_foreign_number_check(sms, pool):
@@ -12,19 +13,26 @@ async def validate_foreign_number_check(sms, pool):
     - 3: skip (validation disabled)
     """
     try:
-        # Get foreign number validation setting
-        async with pool.acquire() as conn:
-            foreign_validation_enabled = await conn.fetchval(
-                "SELECT setting_value FROM system_settings WHERE setting_key = 'foreign_number_validation'"
-            )
-            
+        batch = current_batch.get()
+        if batch is not None:
+            foreign_validation_enabled = batch.setting('foreign_number_validation')
             if foreign_validation_enabled != 'true':
                 return 3  # skip validation
-            
-            # Get allowed country codes
-            allowed_codes_json = await conn.fetchval(
-                "SELECT setting_value FROM system_settings WHERE setting_key = 'allowed_country_codes'"
-            )
+            allowed_codes_json = batch.setting('allowed_country_codes')
+        else:
+            # Get foreign number validation setting
+            async with pool.acquire() as conn:
+                foreign_validation_enabled = await conn.fetchval(
+                    "SELECT setting_value FROM system_settings WHERE setting_key = 'foreign_number_validation'"
+                )
+                
+                if foreign_validation_enabled != 'true':
+                    return 3  # skip validation
+                
+                # Get allowed country codes
+                allowed_codes_json = await conn.fetchval(
+                    "SELECT setting_value FROM system_settings WHERE setting_key = 'allowed_country_codes'"
+                )
         
         # Parse allowed country codes
         try:
@@ -33,7 +41,7 @@ async def validate_foreign_number_check(sms, pool):
             allowed_codes = ["91"]  # Default to India if parsing fails
         
         # Use structured country code or extract from sender number
-        if hasattr(sms, 'country_code') and sms.country_code:
+        if sms.country_code:
             country_code = sms.country_code
         else:
             country_code, local_number = await normalize_mobile_number(sms.sender_number, pool)
@@ -49,3 +57,6 @@ async def validate_foreign_number_check(sms, pool):
         # Log error and fail safely
         print(f"Error in foreign_number_check: {e}")
         return 2  # fail on error
+
+# Pure read: may run concurrently with, or speculatively ahead of, other checks
+validate_foreign_number_check.side_effects = False
@@ -2,73 +2,127 @@ import os
 import hmac
 import hashlib
 import re
+from functools import lru_cache
+from typing import Optional, Tuple
+from .batch_context import current_batch
+from .mobile_utils import get_local_mobile_number
+from .onboarding_cache import active_onboarding
+from .onboarding_hash import verify_onboarding_hash
+
+# Allowed gap between an HMAC token's issue epoch and the registration's request_timestamp
+HMAC_EPOCH_TOLERANCE_SECONDS = 300
+
+class HeaderHashMatcher:
+    """
+    Compiled parser for <PERMITTED_HEADER>:<hash> messages.
+    Built once per permitted_headers value; a single anchored regex finds the
+    header and validates the 64-hex SHA256 hash in one pass.
+    """
+    def __init__(self, permitted_headers_str: str):
+        # Keep settings order so the first configured header wins, as before
+        self.headers = [h.strip() for h in permitted_headers_str.split(',')]
+        alternation = '|'.join(re.escape(h) for h in self.headers)
+        self.pattern = re.compile(rf'({alternation}):\s*([a-fA-F0-9]{{64}})\Z')
+    
+    def parse(self, message: str) -> Optional[Tuple[str, str]]:
+        """Return (header, hash) for a well-formed message, otherwise None."""
+        match = self.pattern.match(message.strip())
+        if not match:
+            return None
+        return match.group(1), match.group(2)
+
+@lru_cache(maxsize=8)
+def get_header_matcher(permitted_headers_str: str) -> Optional[HeaderHashMatcher]:
+    """Matcher for a permitted_headers setting value, compiled once per distinct value."""
+    if not permitted_headers_str:
+        return None
+    return HeaderHashMatcher(permitted_headers_str)
+
+async def fetch_header_hash_settings(pool) -> Tuple[Optional[str], str]:
+    """Return (permitted_headers, hash_scheme) with one settings query (none inside a batch)."""
+    batch = current_batch.get()
+    if batch is not None:
+        return batch.setting('permitted_headers'), batch.setting('hash_scheme') or 'stored'
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT setting_key, setting_value FROM system_settings WHERE setting_key = ANY($1::text[])",
+            ['permitted_headers', 'hash_scheme']
+        )
+    settings = {row['setting_key']: row['setting_value'] for row in rows}
+    return settings.get('permitted_headers'), settings.get('hash_scheme') or 'stored'
 
 async def validate_header_hash_check(sms, pool):
     """
     Combined header and hash validation check.
     Validates SMS message format: <PERMITTED_HEADER>:<hash>
     
+    With hash_scheme = 'hmac' the hash is verified statelessly against
+    HASH_SECRET_KEY and the active flag comes from the in-process onboarding
+    cache; with the default 'stored' scheme it is compared to onboarding_mobile.hash.
+    
     Returns:
     - 1: pass (valid header and hash)
     - 2: fail (invalid header or hash)
     """
     try:
-        message = sms.sms_message.strip()
+        # Get permitted headers and hash scheme from settings
+        permitted_headers_str, hash_scheme = await fetch_header_hash_settings(pool)
+        matcher = get_header_matcher(permitted_headers_str)
         
-        # Get permitted headers from settings
-        async with pool.acquire() as conn:
-            permitted_headers_str = await conn.fetchval(
-                "SELECT setting_value FROM system_settings WHERE setting_key = 'permitted_headers'"
-            )
-        
-        if not permitted_headers_str:
+        if matcher is None:
             return 2  # fail - no permitted headers configured
         
-        # Parse permitted headers (comma-separated list)
-        permitted_headers = [h.strip() for h in permitted_headers_str.split(',')]
-        
-        # Check if message starts with any permitted header pattern
-        header_found = None
-        for header in permitted_headers:
-            header_pattern = f"{header}:"
-            if message.startswith(header_pattern):
-                header_found = header
-                break
-        
-        if not header_found:
-            return 2  # fail - invalid header format
-        
-        # Extract hash from <HEADER>:<hash> format
-        try:
-            provided_hash = message.split(f"{header_found}:", 1)[1].strip()
-        except IndexError:
-            return 2  # fail - no hash after header
+        # Header, separator and 64-hex hash format validated in a single pass
+        parsed = matcher.parse(sms.sms_message)
+        if parsed is None:
+            return 2  # fail - invalid header or hash format
         
-        # Basic hash format validation (should be 64 character hex for SHA256)
-        if not re.match(r'^[a-fA-F0-9]{64}$', provided_hash):
-            return 2  # fail - invalid hash format
+        header_found, provided_hash = parsed
         
         # Use structured mobile data or fallback to normalization
-        if hasattr(sms, 'local_mobile') and sms.local_mobile:
+        if sms.local_mobile:
             local_mobile = sms.local_mobile
         else:
-            from .mobile_utils import get_local_mobile_number
             local_mobile = await get_local_mobile_number(sms.sender_number, pool)
         
+        if hash_scheme == 'hmac':
+            # Stateless verification: authentic token for this mobile and header...
+            issued_epoch = verify_onboarding_hash(provided_hash, local_mobile, header_found)
+            if issued_epoch is None:
+                return 2  # fail - hash mismatch
+            
+            # ...issued for the current, still active registration
+            batch = current_batch.get()
+            if batch is not None:
+                onboarding_row = await batch.onboarding(local_mobile)
+                request_timestamp = onboarding_row['request_timestamp'] if onboarding_row else None
+            else:
+                request_timestamp = await active_onboarding.get(local_mobile, pool)
+            if request_timestamp is None:
+                return 2  # fail - mobile number not found in onboarding table
+            if issued_epoch < request_timestamp.timestamp() - HMAC_EPOCH_TOLERANCE_SECONDS:
+                return 2  # fail - token from an earlier registration
+            
+            return 1  # pass - all validations successful
+        
         # Check if mobile number exists in onboarding table and get stored hash
-        async with pool.acquire() as conn:
-            onboarding_result = await conn.fetchrow(
-                "SELECT hash FROM onboarding_mobile WHERE mobile_number = $1 AND is_active = true",
-                local_mobile
-            )
+        batch = current_batch.get()
+        if batch is not None:
+            onboarding_result = await batch.onboarding(local_mobile)
+        else:
+            async with pool.acquire() as conn:
+                onboarding_result = await conn.fetchrow(
+                    "SELECT hash FROM onboarding_mobile WHERE mobile_number = $1 AND is_active = true",
+                    local_mobile
+                )
         
         if not onboarding_result:
             return 2  # fail - mobile number not found in onboarding table
         
         stored_hash = onboarding_result['hash']
         
-        # Compare provided hash with stored hash
-        if provided_hash.lower() != stored_hash.lower():
+        # Compare provided hash with stored hash in constant time
+        if not hmac.compare_digest(provided_hash.lower(), stored_hash.lower()):
             return 2  # fail - hash mismatch
         
         return 1  # pass - all validations successful
@@ -77,3 +131,6 @@ async def validate_header_hash_check(sms, pool):
         # Log error and fail safely
         print(f"Error in header_hash_check: {e}")
         return 2  # fail on error
+
+# Pure read: may run concurrently with, or speculatively ahead of, other checks
+validate_header_hash_check.side_effects = False
@@ -1,5 +1,5 @@
-import re
-from .mobile_utils import get_local_mobile_number, normalize_mobile_number
+from .batch_context import current_batch
+from .mobile_utils import MOBILE_NUMBER_PATTERN, get_local_mobile_number, normalize_mobile_number
 
 async def validate_mobile_check(sms, pool):
     """
@@ -13,21 +13,25 @@ async def validate_mobile_check(sms, pool):
     """
     try:
         # Use structured mobile data or fallback to normalization
-        if hasattr(sms, 'local_mobile') and sms.local_mobile:
+        if sms.local_mobile:
             local_mobile = sms.local_mobile
         else:
             local_mobile = await get_local_mobile_number(sms.sender_number, pool)
         
         # Basic mobile number format validation
-        if not re.match(r'^\d{10,15}$', local_mobile):
+        if not MOBILE_NUMBER_PATTERN.match(local_mobile):
             return 2  # fail - invalid mobile number format
         
         # Check if sender mobile number exists in onboarding_mobile table and is active
-        async with pool.acquire() as conn:
-            exists = await conn.fetchval(
-                "SELECT EXISTS(SELECT 1 FROM onboarding_mobile WHERE mobile_number = $1 AND is_active = true)",
-                local_mobile
-            )
+        batch = current_batch.get()
+        if batch is not None:
+            exists = await batch.onboarding(local_mobile) is not None
+        else:
+            async with pool.acquire() as conn:
+                exists = await conn.fetchval(
+                    "SELECT EXISTS(SELECT 1 FROM onboarding_mobile WHERE mobile_number = $1 AND is_active = true)",
+                    local_mobile
+                )
         
         if exists:
             return 1  # pass
@@ -37,4 +41,7 @@ async def validate_mobile_check(sms, pool):
     except Exception as e:
         # Log error and fail safely
         print(f"Error in mobile_check: {e}")
-        return 2  # fail on error
\ No newline at end of file
+        return 2  # fail on error
+
+# Pure read: may run concurrently with, or speculatively ahead of, other checks
+validate_mobile_check.side_effects = False
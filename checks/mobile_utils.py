@@ -1,7 +1,13 @@
 """
 Mobile number utilities for consistent handling across validation checks
 """
+import json
 import re
+from .batch_context import current_batch
+
+# Compiled once at import; used per message by the checks and the onboarding endpoint
+MOBILE_NUMBER_PATTERN = re.compile(r'^\d{10,15}$')
+_NON_DIGITS = re.compile(r'[^\d]')
 
 async def normalize_mobile_number(mobile_number: str, pool, default_country_code: str = "91") -> tuple:
     """
@@ -17,16 +23,19 @@ async def normalize_mobile_number(mobile_number: str, pool, default_country_code
         Example: ("91", "9699511296")
     """
     # Remove all non-digit characters
-    clean_number = re.sub(r'[^\d]', '', mobile_number)
+    clean_number = _NON_DIGITS.sub('', mobile_number)
     
-    # Get allowed country codes from settings
-    async with pool.acquire() as conn:
-        allowed_codes_json = await conn.fetchval(
-            "SELECT setting_value FROM system_settings WHERE setting_key = 'allowed_country_codes'"
-        )
+    # Get allowed country codes from settings (memoized per batch when one is active)
+    batch = current_batch.get()
+    if batch is not None:
+        allowed_codes_json = batch.setting('allowed_country_codes')
+    else:
+        async with pool.acquire() as conn:
+            allowed_codes_json = await conn.fetchval(
+                "SELECT setting_value FROM system_settings WHERE setting_key = 'allowed_country_codes'"
+            )
     
     try:
-        import json
         allowed_codes = json.loads(allowed_codes_json) if allowed_codes_json else ["91"]
     except:
         allowed_codes = ["91"]  # Default to India
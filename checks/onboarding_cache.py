@@ -0,0 +1,170 @@
+"""
+In-process cache of active onboarding registrations.
+
+Keeps mobile_number -> request_timestamp for every active row in
+onboarding_mobile, so checks can answer "is this sender onboarded and
+active?" without a per-SMS database query.
+
+- A full snapshot is loaded on first use and re-synced every
+  `full_refresh_interval` seconds (this also picks up deactivations made
+  by other processes).
+- In between, new and reactivated registrations are picked up every
+  `refresh_interval` seconds with an indexed request_timestamp range scan.
+- A miss falls back to a primary-key lookup, so a sender who registered
+  moments ago is never rejected because of cache staleness.
+- Registrations older than `onboarding_expiry_hours` are popped off a
+  min-heap ordered by request_timestamp and remembered as expired, so
+  checks can reject them without a query (see `known_expired`).
+"""
+import asyncio
+import heapq
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Re-read a little before the newest timestamp seen, so rows committed out of order are not missed
+_INCREMENTAL_OVERLAP = timedelta(seconds=5)
+
+class ActiveOnboardingCache:
+    def __init__(self, refresh_interval: float = 2.0, full_refresh_interval: float = 300.0,
+                 max_expired: int = 100000):
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.max_expired = max_expired
+        self.entries: Dict[str, datetime] = {}
+        # Expired registrations, oldest first: mobile_number -> request_timestamp
+        self.expired: "OrderedDict[str, datetime]" = OrderedDict()
+        self.expiry: Optional[timedelta] = None
+        self._heap: List[Tuple[datetime, str]] = []
+        self._newest: Optional[datetime] = None
+        # Wall-clock time up to which registrations are guaranteed to be in `entries`
+        self._synced_until: Optional[datetime] = None
+        self._last_refresh = 0.0
+        self._last_full_refresh = 0.0
+        self._lock = asyncio.Lock()
+
+    def set_expiry(self, hours: Optional[float]):
+        """Apply the onboarding_expiry_hours setting (None or <= 0 disables expiry tracking)."""
+        self.expiry = timedelta(hours=hours) if hours and hours > 0 else None
+        self._expire()
+
+    async def _full_refresh(self, conn):
+        rows = await conn.fetch(
+            "SELECT mobile_number, request_timestamp FROM onboarding_mobile WHERE is_active = true"
+        )
+        self.entries = {row['mobile_number']: row['request_timestamp'] for row in rows}
+        self._heap = [(request_timestamp, mobile_number) for mobile_number, request_timestamp in self.entries.items()]
+        heapq.heapify(self._heap)
+        for mobile_number in self.entries:
+            self.expired.pop(mobile_number, None)
+        self._newest = max(self.entries.values(), default=None)
+
+    async def _incremental_refresh(self, conn):
+        if self._newest is None:
+            rows = await conn.fetch(
+                "SELECT mobile_number, request_timestamp FROM onboarding_mobile WHERE is_active = true"
+            )
+        else:
+            rows = await conn.fetch("""
+                SELECT mobile_number, request_timestamp FROM onboarding_mobile
+                WHERE is_active = true AND request_timestamp > $1
+            """, self._newest - _INCREMENTAL_OVERLAP)
+        for row in rows:
+            self._remember(row['mobile_number'], row['request_timestamp'])
+
+    def _remember(self, mobile_number: str, request_timestamp: datetime):
+        if self.entries.get(mobile_number) != request_timestamp:
+            heapq.heappush(self._heap, (request_timestamp, mobile_number))
+        self.entries[mobile_number] = request_timestamp
+        self.expired.pop(mobile_number, None)
+        if self._newest is None or request_timestamp > self._newest:
+            self._newest = request_timestamp
+
+    def _mark_expired(self, mobile_number: str, request_timestamp: datetime):
+        self.expired[mobile_number] = request_timestamp
+        self.expired.move_to_end(mobile_number)
+        while len(self.expired) > self.max_expired:
+            self.expired.popitem(last=False)
+
+    def _expire(self, now: Optional[datetime] = None):
+        """Move registrations older than the expiry from `entries` to `expired`."""
+        if self.expiry is None:
+            return
+        cutoff = (now or datetime.now(timezone.utc)) - self.expiry
+        heap = self._heap
+        while heap and heap[0][0] <= cutoff:
+            request_timestamp, mobile_number = heapq.heappop(heap)
+            # Skip heap entries superseded by a re-registration or a deactivation
+            if self.entries.get(mobile_number) == request_timestamp:
+                del self.entries[mobile_number]
+                self._mark_expired(mobile_number, request_timestamp)
+
+    async def refresh(self, pool, force_full: bool = False):
+        """Bring the snapshot up to date if it is stale."""
+        now = time.monotonic()
+        if not force_full and now - self._last_refresh < self.refresh_interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            full = force_full or now - self._last_full_refresh >= self.full_refresh_interval
+            if not full and now - self._last_refresh < self.refresh_interval:
+                return  # another task refreshed while we waited
+            started = datetime.now(timezone.utc)
+            async with pool.acquire() as conn:
+                if full:
+                    await self._full_refresh(conn)
+                    self._last_full_refresh = now
+                else:
+                    await self._incremental_refresh(conn)
+            self._last_refresh = now
+            self._synced_until = started - _INCREMENTAL_OVERLAP
+            self._expire(started)
+
+    def known_expired(self, mobile_number: str, received_timestamp: datetime) -> bool:
+        """
+        True when the sender's registration is known to have expired and no newer
+        registration could have been made before `received_timestamp`.
+        Pure in-memory: never queries the database.
+        """
+        if mobile_number not in self.expired:
+            return False
+        self._expire()
+        # A re-registration made before the SMS would already have been picked up
+        return self._synced_until is not None and received_timestamp <= self._synced_until
+
+    async def get(self, mobile_number: str, pool) -> Optional[datetime]:
+        """Return request_timestamp if the mobile number has an active registration, otherwise None."""
+        await self.refresh(pool)
+        request_timestamp = self.entries.get(mobile_number)
+        if request_timestamp is not None:
+            return request_timestamp
+
+        # Registered since the last refresh?
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(
+                "SELECT request_timestamp FROM onboarding_mobile WHERE mobile_number = $1 AND is_active = true",
+                mobile_number
+            )
+        if row is None:
+            return None
+        self._remember(mobile_number, row['request_timestamp'])
+        return row['request_timestamp']
+
+    def update(self, mobile_number: str, request_timestamp: datetime):
+        """Record a registration made by this process."""
+        self._remember(mobile_number, request_timestamp)
+
+    def discard(self, mobile_number: str):
+        """Forget a registration deactivated by this process."""
+        self.entries.pop(mobile_number, None)
+
+    def mark_expired(self, mobile_numbers: Iterable[str]):
+        """Record registrations deactivated by the expiry sweeper."""
+        for mobile_number in mobile_numbers:
+            request_timestamp = self.entries.pop(mobile_number, None)
+            if request_timestamp is not None:
+                self._mark_expired(mobile_number, request_timestamp)
+
+# Shared instance used by the checks and the onboarding endpoints
+active_onboarding = ActiveOnboardingCache()
@@ -0,0 +1,133 @@
+"""
+Stateless onboarding hashes keyed by HASH_SECRET_KEY.
+
+With the 'hmac' hash scheme the onboarding hash is a self-describing token
+with the same shape as the stored SHA256 scheme (64 hex characters), so
+the SMS format <HEADER>:<hash> does not change:
+
+    kk eeeeeeee mmmmmmmm...   (2 + 8 + 54 hex characters)
+
+    kk  key id used to sign the token
+    ee  issue epoch (unix seconds)
+    mm  first 54 hex characters of HMAC-SHA256(key, "<mobile>|<header>|<epoch>")
+
+Verification is pure CPU: no stored hash needs to be fetched from Postgres.
+
+Keys are configured through environment variables:
+    HASH_SECRET_KEYS     comma-separated "<id>:<secret>" pairs, e.g. "1:old-secret,2:new-secret"
+    HASH_SIGNING_KEY_ID  id of the key used to issue new tokens (default: highest id)
+    HASH_SECRET_KEY      single secret, used as key id 0 when HASH_SECRET_KEYS is not set
+
+To rotate keys, add the new key, point HASH_SIGNING_KEY_ID at it and remove
+the old key once tokens signed with it are older than the validation window.
+
+`compute_onboarding_hash` issues the hash for either scheme and is shared by
+the single and bulk registration endpoints.
+"""
+import hashlib
+import hmac
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+TOKEN_LENGTH = 64
+_KEY_ID_HEX = 2
+_EPOCH_HEX = 8
+_MAC_HEX = TOKEN_LENGTH - _KEY_ID_HEX - _EPOCH_HEX
+
+class KeyRing:
+    """Signing key plus all keys still accepted for verification."""
+    def __init__(self, keys: Dict[int, bytes], signing_key_id: Optional[int] = None):
+        for key_id in keys:
+            if not 0 <= key_id <= 0xFF:
+                raise ValueError(f"Hash key id {key_id} must be between 0 and 255")
+        self.keys = keys
+        if signing_key_id is None and keys:
+            signing_key_id = max(keys)
+        if signing_key_id is not None and signing_key_id not in keys:
+            raise ValueError(f"Signing key id {signing_key_id} is not configured")
+        self.signing_key_id = signing_key_id
+
+    @property
+    def can_sign(self) -> bool:
+        return self.signing_key_id is not None
+
+def load_key_ring() -> KeyRing:
+    """Build the key ring from HASH_SECRET_KEYS / HASH_SIGNING_KEY_ID / HASH_SECRET_KEY."""
+    keys = {}
+    for entry in os.getenv('HASH_SECRET_KEYS', '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        key_id, _, secret = entry.partition(':')
+        if not secret:
+            raise ValueError("HASH_SECRET_KEYS entries must look like <id>:<secret>")
+        keys[int(key_id)] = secret.encode('utf-8')
+
+    if not keys and os.getenv('HASH_SECRET_KEY'):
+        keys[0] = os.getenv('HASH_SECRET_KEY').encode('utf-8')
+
+    signing_key_id = os.getenv('HASH_SIGNING_KEY_ID')
+    return KeyRing(keys, int(signing_key_id) if signing_key_id else None)
+
+_key_ring = None
+
+def get_key_ring() -> KeyRing:
+    global _key_ring
+    if _key_ring is None:
+        _key_ring = load_key_ring()
+    return _key_ring
+
+def _mac(key: bytes, mobile_number: str, header: str, epoch: int) -> str:
+    message = f"{mobile_number}|{header}|{epoch}".encode('utf-8')
+    return hmac.new(key, message, hashlib.sha256).hexdigest()[:_MAC_HEX]
+
+def issue_onboarding_hash(mobile_number: str, header: str, epoch: Optional[int] = None,
+                          key_ring: Optional[KeyRing] = None) -> str:
+    """Create a token for a mobile number and header, signed with the current signing key."""
+    key_ring = key_ring or get_key_ring()
+    if not key_ring.can_sign:
+        raise RuntimeError("No hash secret key configured (set HASH_SECRET_KEY or HASH_SECRET_KEYS)")
+    epoch = int(time.time()) if epoch is None else int(epoch)
+    key_id = key_ring.signing_key_id
+    mac = _mac(key_ring.keys[key_id], mobile_number, header, epoch)
+    return f"{key_id:0{_KEY_ID_HEX}x}{epoch:0{_EPOCH_HEX}x}{mac}"
+
+def parse_onboarding_hash(token: str) -> Optional[Tuple[int, int, str]]:
+    """Split a token into (key_id, epoch, mac); None if it is not 64 hex characters."""
+    if len(token) != TOKEN_LENGTH:
+        return None
+    try:
+        key_id = int(token[:_KEY_ID_HEX], 16)
+        epoch = int(token[_KEY_ID_HEX:_KEY_ID_HEX + _EPOCH_HEX], 16)
+    except ValueError:
+        return None
+    return key_id, epoch, token[_KEY_ID_HEX + _EPOCH_HEX:].lower()
+
+def verify_onboarding_hash(token: str, mobile_number: str, header: str,
+                           key_ring: Optional[KeyRing] = None) -> Optional[int]:
+    """
+    Verify a token for a mobile number and header.
+    Returns the issue epoch when the token is authentic, otherwise None.
+    """
+    parsed = parse_onboarding_hash(token)
+    if parsed is None:
+        return None
+    key_id, epoch, provided_mac = parsed
+    key = (key_ring or get_key_ring()).keys.get(key_id)
+    if key is None:
+        return None  # unknown or retired key
+    if not hmac.compare_digest(provided_mac, _mac(key, mobile_number, header, epoch)):
+        return None
+    return epoch
+
+def stored_onboarding_hash(mobile_number: str, header: str, salt: str) -> str:
+    """'stored' scheme: SHA256 of header + mobile + salt, kept in onboarding_mobile.hash."""
+    return hashlib.sha256(f"{header}{mobile_number}{salt}".encode('utf-8')).hexdigest()
+
+def compute_onboarding_hash(hash_scheme: str, mobile_number: str, header: str, salt: str,
+                            epoch: Optional[int] = None, key_ring: Optional[KeyRing] = None) -> str:
+    """Onboarding hash for a registration under the given hash_scheme setting."""
+    if hash_scheme == 'hmac':
+        return issue_onboarding_hash(mobile_number, header, epoch=epoch, key_ring=key_ring)
+    return stored_onboarding_hash(mobile_number, header, salt)
@@ -0,0 +1,171 @@
+"""
+Shared Redis access for duplicate tracking and the result feed.
+
+`create_redis_client()` picks one of three layouts from the environment:
+
+    REDIS_CLUSTER=true   Redis Cluster; REDIS_HOST/REDIS_PORT is any seed node and
+                         redis-py's RedisCluster routes each key to its slot
+    REDIS_NODES=h1:p1,h2:p2,...
+                         independent nodes, keys spread by client-side consistent
+                         hashing (`ShardedRedis`)
+    otherwise            a single node at REDIS_HOST/REDIS_PORT (REDIS_DB, default 0)
+
+REDIS_PASSWORD applies to every node.
+
+Validated numbers are stored one key per number (`out_sms_number:<mobile>`),
+so membership is already spread over many small keys. They carry no hash tag,
+so each lands on its own slot or shard. Adding a node to REDIS_NODES moves
+about 1/N of the keys. Numbers that move read as "not seen" until the
+startup warmup re-caches them from out_sms.
+
+Pub/sub (the result feed) is not sharded: `pubsub_node()` gives the one node
+it publishes and subscribes on, so every replica meets on the same channel.
+That is the first node of a `ShardedRedis` and the default node of a Redis
+Cluster (cluster pipelines refuse PUBLISH).
+"""
+import bisect
+import hashlib
+import os
+from typing import Dict, List, Sequence, Tuple
+import redis
+
+# Points per node on the hash ring; more points give a more even spread
+RING_REPLICAS = 160
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+def _key_str(key) -> str:
+    return key.decode('utf-8') if isinstance(key, bytes) else str(key)
+
+class HashRing:
+    """Consistent hashing of keys onto node indexes."""
+    def __init__(self, node_names: Sequence[str], replicas: int = RING_REPLICAS):
+        if not node_names:
+            raise ValueError("HashRing needs at least one node")
+        points = sorted((_hash(f"{name}#{i}"), index)
+                        for index, name in enumerate(node_names) for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [index for _, index in points]
+
+    def node_for(self, key) -> int:
+        position = bisect.bisect(self._hashes, _hash(_key_str(key)))
+        return self._nodes[position % len(self._nodes)]
+
+class ShardedPipeline:
+    """Non-transactional pipeline that queues commands per shard and returns results in call order."""
+    def __init__(self, sharded: 'ShardedRedis'):
+        self.sharded = sharded
+        self.pipes: Dict[int, object] = {}
+        # (shard index, position within that shard's pipeline) per queued command
+        self.order: List[Tuple[int, int]] = []
+        self.counts: Dict[int, int] = {}
+
+    def _queue(self, index: int, command: str, *args, **kwargs):
+        pipe = self.pipes.get(index)
+        if pipe is None:
+            pipe = self.pipes[index] = self.sharded.nodes[index].pipeline(transaction=False)
+        getattr(pipe, command)(*args, **kwargs)
+        self.order.append((index, self.counts.get(index, 0)))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        return self
+
+    def publish(self, channel, message):
+        return self._queue(0, 'publish', channel, message)
+
+    def __getattr__(self, command):
+        # Single-key commands: routed by their first argument
+        def queue(key, *args, **kwargs):
+            return self._queue(self.sharded.ring.node_for(key), command, key, *args, **kwargs)
+        return queue
+
+    def execute(self) -> list:
+        results = {index: pipe.execute() for index, pipe in self.pipes.items()}
+        ordered = [results[index][position] for index, position in self.order]
+        self.pipes.clear()
+        self.order.clear()
+        self.counts.clear()
+        return ordered
+
+class ShardedRedis:
+    """
+    The subset of the redis.Redis interface the bridge uses, spread over
+    independent nodes by consistent hashing of the key.
+    """
+    def __init__(self, nodes: Sequence, node_names: Sequence[str] = None):
+        self.nodes = list(nodes)
+        self.ring = HashRing(node_names or [str(i) for i in range(len(self.nodes))])
+
+    def node(self, key):
+        return self.nodes[self.ring.node_for(key)]
+
+    def exists(self, *keys) -> int:
+        return sum(self._split(keys, 'exists'))
+
+    def delete(self, *keys) -> int:
+        return sum(self._split(keys, 'delete'))
+
+    def _split(self, keys, command: str) -> list:
+        by_node: Dict[int, list] = {}
+        for key in keys:
+            by_node.setdefault(self.ring.node_for(key), []).append(key)
+        return [getattr(self.nodes[index], command)(*node_keys) for index, node_keys in by_node.items()]
+
+    def pipeline(self, transaction: bool = False) -> ShardedPipeline:
+        if transaction:
+            raise ValueError("ShardedRedis pipelines cannot be transactional")
+        return ShardedPipeline(self)
+
+    def publish(self, channel, message):
+        return self.nodes[0].publish(channel, message)
+
+    def pubsub(self, **kwargs):
+        return self.nodes[0].pubsub(**kwargs)
+
+    def ping(self) -> bool:
+        return all(node.ping() for node in self.nodes)
+
+    def __getattr__(self, command):
+        # Single-key commands (get, set, expire, ttl, ...): routed by their first argument
+        def route(key, *args, **kwargs):
+            return getattr(self.node(key), command)(key, *args, **kwargs)
+        return route
+
+def pubsub_node(client):
+    """Single-node client the result feed publishes and subscribes on (see module docstring)."""
+    if isinstance(client, ShardedRedis):
+        return client.nodes[0]
+    if hasattr(client, 'get_default_node'):
+        # RedisCluster: always the same node, so publishers and the listener meet there
+        return client.get_redis_connection(client.get_default_node())
+    return client
+
+def parse_nodes(value: str) -> List[Tuple[str, int]]:
+    """'host1:6379,host2' -> [('host1', 6379), ('host2', 6379)]"""
+    nodes = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(':') if ':' in item else (item, '', '6379')
+        nodes.append((host, int(port)))
+    return nodes
+
+def create_redis_client():
+    """Redis client for the layout configured in the environment (see module docstring)."""
+    password = os.getenv('REDIS_PASSWORD', None)
+    if os.getenv('REDIS_CLUSTER', '').strip().lower() in ('1', 'true', 'yes', 'on'):
+        from redis.cluster import RedisCluster
+        return RedisCluster(host=os.getenv('REDIS_HOST', 'localhost'), port=int(os.getenv('REDIS_PORT', 6379)),
+                            password=password)
+    nodes = parse_nodes(os.getenv('REDIS_NODES', ''))
+    if nodes:
+        return ShardedRedis([redis.StrictRedis(host=host, port=port, password=password, db=0)
+                             for host, port in nodes],
+                            [f"{host}:{port}" for host, port in nodes])
+    return redis.StrictRedis(
+        host=os.getenv('REDIS_HOST', 'localhost'),
+        port=int(os.getenv('REDIS_PORT', 6379)),
+        password=password,
+        db=int(os.getenv('REDIS_DB', 0)),
+    )
@@ -0,0 +1,135 @@
+"""
+Live feed of validation results.
+
+The batch processor publishes one event per finished message (uuid,
+local_mobile, country_code, overall_status, failed_at_check) after its
+verdict is committed. `ResultHub` delivers it to subscribers in this process
+and publishes it on the Redis channel `RESULT_CHANNEL`, so subscribers
+connected to other replicas (the ingest processes, in a split deployment)
+get it too. Each process listens on the channel from its first subscriber
+on, in a thread using the shared synchronous Redis client, and skips events
+it published itself. Publishing and listening both go through
+`redis_store.pubsub_node`, one fixed node for every Redis layout.
+
+Subscribers register by local mobile number and get a bounded queue; a
+consumer that falls `queue_size` events behind loses the oldest ones. Delivery
+is best effort: events published while a replica's listener is down are not
+replayed, and `GET /onboarding/status` stays the source of truth.
+"""
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set
+from .duplicate_check import get_redis_client
+from .redis_store import pubsub_node
+
+RESULT_CHANNEL = 'sms_bridge:validation_results'
+
+logger = logging.getLogger(__name__)
+
+class ResultHub:
+    def __init__(self, queue_size: int = 100, reconnect_delay: float = 1.0):
+        self.queue_size = queue_size
+        self.reconnect_delay = reconnect_delay
+        # Distinguishes this process's own events on the shared channel
+        self.origin = uuid.uuid4().hex
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def publish(self, events: List[dict]):
+        """
+        Deliver events locally and to the other replicas (one pipelined round-trip).
+        Redis failures are logged, not raised.
+        """
+        if not events:
+            return
+        self.published += len(events)
+        for event in events:
+            self._deliver(event)
+        try:
+            pipe = pubsub_node(get_redis_client()).pipeline(transaction=False)
+            for event in events:
+                pipe.publish(RESULT_CHANNEL, json.dumps({'origin': self.origin, 'event': event}))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to publish {len(events)} validation results to Redis: {e}")
+
+    def _deliver(self, event: dict):
+        for queue in self.subscribers.get(event.get('local_mobile'), ()):
+            if queue.full():
+                queue.get_nowait()  # slow consumer: keep the newest events
+                self.dropped += 1
+            queue.put_nowait(event)
+            self.delivered += 1
+
+    @contextmanager
+    def subscribe(self, local_mobile: str):
+        """Queue receiving the events for one mobile number while the block runs."""
+        self._ensure_listener()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(local_mobile, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self.subscribers.get(local_mobile)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self.subscribers[local_mobile]
+
+    def _ensure_listener(self):
+        if self._listener is not None and self._listener.is_alive():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._stopping.clear()
+        self._listener = threading.Thread(target=self._listen, name='result-feed-listener', daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        while not self._stopping.is_set():
+            try:
+                pubsub = pubsub_node(get_redis_client()).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(RESULT_CHANNEL)
+                try:
+                    while not self._stopping.is_set():
+                        message = pubsub.get_message(timeout=1.0)
+                        if message is not None:
+                            self._receive(message['data'])
+                finally:
+                    pubsub.close()
+            except Exception as e:
+                logger.warning(f"Validation result listener lost Redis, reconnecting: {e}")
+                self._stopping.wait(self.reconnect_delay)
+
+    def _receive(self, data):
+        try:
+            payload = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if payload.get('origin') == self.origin:
+            return  # already delivered locally by publish()
+        self._loop.call_soon_threadsafe(self._deliver, payload['event'])
+
+    def stop(self):
+        self._stopping.set()
+
+    def stats(self) -> dict:
+        return {
+            'subscribers': sum(len(queues) for queues in self.subscribers.values()),
+            'mobile_numbers': len(self.subscribers),
+            'published': self.published,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'listening': self._listener is not None and self._listener.is_alive(),
+        }
+
+# Shared instance used by the batch processor and the feed endpoints
+result_hub = ResultHub()
@@ -0,0 +1,124 @@
+"""
+Pre-aggregated validation statistics.
+
+sms_stats_rollup keeps one counter per (granularity, bucket_start,
+overall_status, failed_at_check, country_code) for final sms_monitor rows,
+bucketed by processing_completed_at into UTC minutes and hours. A missing
+failed_at_check or country_code is stored as ''.
+
+The counters change in the same transaction as sms_monitor:
+- `retract(conn, uuids)` before a final row is overwritten or reset
+  (replays, re-verdicts) takes its old contribution back out
+- `record(conn, uuids)` after the verdicts are written adds them in
+So the rollup always equals a GROUP BY over the final sms_monitor rows,
+and `GET /stats` reads a few hundred rows from it instead of scanning
+sms_monitor. Minute buckets older than `stats_minute_retention_hours`
+are pruned by `prune_minute_buckets`; hour buckets are kept.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Sequence
+
+GRANULARITIES = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+}
+# Range served when the query gives no `since`
+DEFAULT_WINDOW = {
+    'minute': timedelta(hours=1),
+    'hour': timedelta(days=1),
+}
+# Largest time range one /stats query may cover, in buckets
+MAX_BUCKETS = {
+    'minute': 7 * 24 * 60,
+    'hour': 366 * 24,
+}
+DIMENSIONS = ('overall_status', 'failed_at_check', 'country_code')
+
+_APPLY_SQL = """
+    WITH final AS (
+        SELECT processing_completed_at, overall_status,
+               COALESCE(failed_at_check, '') AS failed_at_check, COALESCE(country_code, '') AS country_code
+        FROM sms_monitor
+        WHERE uuid = ANY($1::uuid[])
+        AND overall_status IN ('valid', 'invalid', 'dead_letter')
+        AND processing_completed_at IS NOT NULL
+        FOR UPDATE
+    )
+    INSERT INTO sms_stats_rollup (granularity, bucket_start, overall_status, failed_at_check, country_code,
+                                  message_count)
+    SELECT g.granularity,
+           date_trunc(g.granularity, f.processing_completed_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           f.overall_status, f.failed_at_check, f.country_code, $2 * count(*)
+    FROM final f CROSS JOIN (VALUES ('minute'), ('hour')) AS g(granularity)
+    GROUP BY 1, 2, 3, 4, 5
+    ORDER BY 1, 2, 3, 4, 5
+    ON CONFLICT (granularity, bucket_start, overall_status, failed_at_check, country_code) DO UPDATE SET
+        message_count = sms_stats_rollup.message_count + EXCLUDED.message_count
+"""
+
+async def record(conn, uuids: Sequence):
+    """Add the final sms_monitor rows among `uuids` to their buckets (inside the writing transaction)."""
+    if uuids:
+        await conn.execute(_APPLY_SQL, list(uuids), 1)
+
+async def retract(conn, uuids: Sequence):
+    """Take the final sms_monitor rows among `uuids` out of their buckets before they are overwritten."""
+    if uuids:
+        await conn.execute(_APPLY_SQL, list(uuids), -1)
+
+async def prune_minute_buckets(conn, retention_hours: float) -> int:
+    """Delete minute buckets older than retention_hours; returns the rows removed."""
+    result = await conn.execute("""
+        DELETE FROM sms_stats_rollup
+        WHERE granularity = 'minute' AND bucket_start < date_trunc('minute', NOW()) - make_interval(secs => $1)
+    """, retention_hours * 3600)
+    return int(result.split()[-1])
+
+async def query_series(conn, granularity: str, since: datetime, until: datetime, group_by: Sequence[str],
+                       overall_status: Optional[str] = None, failed_at_check: Optional[str] = None,
+                       country_code: Optional[str] = None) -> List[dict]:
+    """
+    Counts per bucket in [since, until), split by the `group_by` dimensions and
+    filtered by the given ones. `since` is rounded down to the start of its
+    bucket; buckets without messages are omitted.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    unknown = [name for name in group_by if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown group_by dimension(s): {', '.join(unknown)}")
+    if until <= since:
+        raise ValueError("until must be after since")
+    if (until - since) / GRANULARITIES[granularity] > MAX_BUCKETS[granularity]:
+        raise ValueError(f"At most {MAX_BUCKETS[granularity]} {granularity} buckets per query")
+
+    since = since.astimezone(timezone.utc).replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        since = since.replace(minute=0)
+    conditions = ["granularity = $1", "bucket_start >= $2", "bucket_start < $3"]
+    args = [granularity, since, until]
+    for name, value in (('overall_status', overall_status), ('failed_at_check', failed_at_check),
+                        ('country_code', country_code)):
+        if value is not None:
+            args.append(value)
+            conditions.append(f"{name} = ${len(args)}")
+
+    # Column names come from DIMENSIONS only
+    columns = ''.join(f", {name}" for name in group_by)
+    rows = await conn.fetch(f"""
+        SELECT bucket_start{columns}, sum(message_count) AS count
+        FROM sms_stats_rollup
+        WHERE {' AND '.join(conditions)}
+        GROUP BY bucket_start{columns}
+        HAVING sum(message_count) <> 0
+        ORDER BY bucket_start{columns}
+    """, *args)
+
+    series = []
+    for row in rows:
+        point = {'bucket': row['bucket_start'].isoformat()}
+        for name in group_by:
+            point[name] = row[name] or None  # '' is stored for "none"
+        point['count'] = int(row['count'])
+        series.append(point)
+    return series
@@ -1,5 +1,7 @@
 from datetime import datetime, timezone
-import re
+from .batch_context import current_batch
+from .mobile_utils import MOBILE_NUMBER_PATTERN, get_local_mobile_number
+from .onboarding_cache import active_onboarding
 
 async def validate_time_window_check(sms, pool):
     """
@@ -13,27 +15,35 @@ async def validate_time_window_check(sms, pool):
     """
     try:
         # Use structured mobile data or fallback to normalization
-        if hasattr(sms, 'local_mobile') and sms.local_mobile:
+        if sms.local_mobile:
             local_mobile = sms.local_mobile
         else:
-            from .mobile_utils import get_local_mobile_number
             local_mobile = await get_local_mobile_number(sms.sender_number, pool)
         
         # Basic mobile number format validation
-        if not re.match(r'^\d{10,15}$', local_mobile):
+        if not MOBILE_NUMBER_PATTERN.match(local_mobile):
             return 2  # fail - invalid mobile number format
         
-        async with pool.acquire() as conn:
-            # Get validation time window from settings
-            window_seconds = int(await conn.fetchval(
-                "SELECT setting_value FROM system_settings WHERE setting_key = 'validation_time_window'"
-            ))
-            
-            # Get onboarding request timestamp for this mobile number
-            onboarding_result = await conn.fetchrow(
-                "SELECT request_timestamp FROM onboarding_mobile WHERE mobile_number = $1 AND is_active = true",
-                local_mobile
-            )
+        # Registration already expired (onboarding_expiry_hours): reject without a query
+        if active_onboarding.known_expired(local_mobile, sms.received_timestamp):
+            return 2  # fail - onboarding expired
+        
+        batch = current_batch.get()
+        if batch is not None:
+            window_seconds = int(batch.setting('validation_time_window'))
+            onboarding_result = await batch.onboarding(local_mobile)
+        else:
+            async with pool.acquire() as conn:
+                # Get validation time window from settings
+                window_seconds = int(await conn.fetchval(
+                    "SELECT setting_value FROM system_settings WHERE setting_key = 'validation_time_window'"
+                ))
+                
+                # Get onboarding request timestamp for this mobile number
+                onboarding_result = await conn.fetchrow(
+                    "SELECT request_timestamp FROM onboarding_mobile WHERE mobile_number = $1 AND is_active = true",
+                    local_mobile
+                )
         
         if not onboarding_result:
             return 2  # fail - mobile number not found in onboarding table
@@ -53,4 +63,7 @@ async def validate_time_window_check(sms, pool):
     except Exception as e:
         # Log error and fail safely
         print(f"Error in time_window_check: {e}")
-        return 2  # fail on error
\ No newline at end of file
+        return 2  # fail on error
+
+# Pure read: may run concurrently with, or speculatively ahead of, other checks
+validate_time_window_check.side_effects = False
@@ -0,0 +1,113 @@
+"""
+Compiled validation pipelines.
+
+`PipelineCompiler.plans(settings)` turns check_sequence, check_enabled and
+check_overrides into a `PlanSet` of immutable `ValidationPlan`s: one default
+plan plus one per country_code with overrides. The raw values of those three
+settings are the settings version: while they are unchanged every batch gets
+the same PlanSet back, and a change compiles a new one that replaces the old
+by a single assignment, so a batch always runs against one consistent plan.
+
+A plan lists only the enabled checks, in order, with their function, result
+column and side-effect flag resolved, plus the initial result row (3 for
+disabled checks in the sequence, 0 for the rest). Evaluating a message is a
+walk over `steps`; nothing is looked up by name.
+
+check_overrides maps a country code to any of:
+    check_sequence   replaces the sequence for that country
+    check_enabled    merged over the global check_enabled
+    settings         setting values the checks see for that country's messages,
+                     e.g. {"blacklist_threshold": "50"} (see BatchContext.setting)
+Example: {"91": {"check_enabled": {"foreign_number": false}}}
+An override that cannot be parsed is logged and ignored.
+"""
+import json
+import logging
+from types import MappingProxyType
+from typing import Callable, Dict, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+PLAN_SETTINGS = ('check_sequence', 'check_enabled', 'check_overrides')
+
+class CheckStep(NamedTuple):
+    name: str
+    # Position in the result row (CHECK_NAMES order), or None for a check without a column
+    index: Optional[int]
+    column: str
+    # None for a name with no registered check: the step fails the message
+    func: Optional[Callable]
+    side_effects: bool
+
+class ValidationPlan(NamedTuple):
+    steps: Tuple[CheckStep, ...]
+    initial_results: Tuple[int, ...]
+    settings: Mapping[str, str]
+
+class PlanSet(NamedTuple):
+    version: Tuple[Optional[str], ...]
+    default: ValidationPlan
+    by_country: Mapping[str, ValidationPlan]
+
+    def for_country(self, country_code: Optional[str]) -> ValidationPlan:
+        return self.by_country.get(country_code, self.default)
+
+def _load_json(value, default):
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+class PipelineCompiler:
+    def __init__(self, functions: Mapping[str, Callable], check_names: Sequence[str]):
+        self.functions = dict(functions)
+        self.check_names = tuple(check_names)
+        self.compiled: Optional[PlanSet] = None
+
+    def plans(self, settings: Mapping[str, str]) -> PlanSet:
+        """PlanSet for these settings; compiled only when the plan settings changed."""
+        version = tuple(settings.get(key) for key in PLAN_SETTINGS)
+        compiled = self.compiled
+        if compiled is None or compiled.version != version:
+            compiled = self.compiled = self.compile(version)
+        return compiled
+
+    def compile(self, version: Tuple[Optional[str], ...]) -> PlanSet:
+        raw_sequence, raw_enabled, raw_overrides = version
+        sequence = _load_json(raw_sequence, [])
+        enabled = _load_json(raw_enabled, {})
+        default = self._plan(sequence, enabled, {})
+
+        by_country: Dict[str, ValidationPlan] = {}
+        try:
+            overrides = _load_json(raw_overrides, {})
+            for country_code, override in overrides.items():
+                by_country[str(country_code)] = self._plan(
+                    override.get('check_sequence', sequence),
+                    {**enabled, **override.get('check_enabled', {})},
+                    {key: str(value) for key, value in override.get('settings', {}).items()},
+                )
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.error(f"Ignoring invalid check_overrides: {e}")
+            by_country = {}
+        logger.info(f"Compiled validation plan: {[step.name for step in default.steps]}"
+                    f"{f', overrides for {sorted(by_country)}' if by_country else ''}")
+        return PlanSet(version, default, MappingProxyType(by_country))
+
+    def _plan(self, sequence: Sequence[str], enabled: Mapping[str, bool],
+              settings: Mapping[str, str]) -> ValidationPlan:
+        results = [0] * len(self.check_names)
+        steps = []
+        for name in sequence:
+            index = self.check_names.index(name) if name in self.check_names else None
+            if not enabled.get(name, False):
+                if index is not None:
+                    results[index] = 3  # skipped
+                continue
+            func = self.functions.get(name)
+            # Checks that change state when they run declare side_effects = True (the default);
+            # they never run speculatively and their results are kept on the claim for retries
+            steps.append(CheckStep(name, index, f'{name}_check', func,
+                                   func is None or getattr(func, 'side_effects', True)))
+        return ValidationPlan(tuple(steps), tuple(results), MappingProxyType(dict(settings)))
@@ -157,4 +157,92 @@ WHERE setting_key = 'check_sequence';
 
 UPDATE system_settings 
 SET setting_value = '{"blacklist":true, "duplicate":true, "foreign_number":true, "header_hash":true, "mobile":true, "time_window":true}'
-WHERE setting_key = 'check_enabled';
\ No newline at end of file
+WHERE setting_key = 'check_enabled';
+
+-- 8. dead_letter_sms: messages that kept failing validation with a non-transient error
+CREATE TABLE IF NOT EXISTS dead_letter_sms (
+    uuid UUID PRIMARY KEY REFERENCES input_sms(uuid),
+    sender_number VARCHAR(15),
+    sms_message TEXT,
+    received_timestamp TIMESTAMPTZ,
+    error TEXT NOT NULL,
+    failed_stage VARCHAR(20),
+    retry_count INTEGER DEFAULT 0,
+    dead_lettered_at TIMESTAMPTZ DEFAULT NOW(),
+    replayed_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_dead_letter_pending ON dead_letter_sms (dead_lettered_at) WHERE replayed_at IS NULL;
+
+-- Onboarding hash scheme: 'stored' (sha256 of header+mobile+salt kept in onboarding_mobile.hash)
+-- or 'hmac' (stateless token signed with HASH_SECRET_KEY, verified without a database lookup)
+INSERT INTO system_settings (setting_key, setting_value)
+SELECT 'hash_scheme', 'stored'
+WHERE NOT EXISTS (SELECT 1 FROM system_settings WHERE setting_key = 'hash_scheme');
+
+-- Onboarding expiry sweeper: deactivates registrations older than onboarding_expiry_hours
+INSERT INTO system_settings (setting_key, setting_value)
+SELECT setting_key, setting_value FROM (VALUES
+    ('onboarding_sweep_interval', '60'),
+    ('onboarding_sweep_batch_size', '1000')
+) AS new_settings(setting_key, setting_value)
+WHERE NOT EXISTS (
+    SELECT 1 FROM system_settings WHERE system_settings.setting_key = new_settings.setting_key
+);
+
+-- Partial index over the active set only; used by the sweeper and the active-onboarding cache refresh
+CREATE INDEX IF NOT EXISTS idx_onboarding_active_request_timestamp
+    ON onboarding_mobile (request_timestamp) WHERE is_active = true;
+
+-- Run independent pure-read checks of a message concurrently (verdicts are unchanged)
+INSERT INTO system_settings (setting_key, setting_value)
+SELECT 'concurrent_checks', 'false'
+WHERE NOT EXISTS (SELECT 1 FROM system_settings WHERE setting_key = 'concurrent_checks');
+
+-- Admission control for /sms/receive (0 disables a limit); maintenance_mode rejects ingest and onboarding writes
+INSERT INTO system_settings (setting_key, setting_value)
+SELECT setting_key, setting_value FROM (VALUES
+    ('admission_control', 'true'),
+    ('admission_max_in_flight', '200'),
+    ('admission_backlog_soft_limit', '20000'),
+    ('admission_backlog_hard_limit', '100000'),
+    ('admission_max_lag_seconds', '0'),
+    ('admission_retry_after', '5'),
+    ('maintenance_retry_after', '300')
+) AS new_settings(setting_key, setting_value)
+WHERE NOT EXISTS (
+    SELECT 1 FROM system_settings WHERE system_settings.setting_key = new_settings.setting_key
+);
+
+-- 9. sms_stats_rollup: per-minute and per-hour counts of final sms_monitor rows, kept in step with
+-- sms_monitor by the batch write-back (checks/stats_rollup.py) and read by GET /stats
+CREATE TABLE IF NOT EXISTS sms_stats_rollup (
+    granularity VARCHAR(6) NOT NULL,
+    bucket_start TIMESTAMPTZ NOT NULL,
+    overall_status VARCHAR(20) NOT NULL,
+    failed_at_check VARCHAR(20) NOT NULL DEFAULT '',
+    country_code VARCHAR(5) NOT NULL DEFAULT '',
+    message_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, bucket_start, overall_status, failed_at_check, country_code)
+);
+
+-- One-off backfill from sms_monitor when the rollup is first created
+INSERT INTO sms_stats_rollup (granularity, bucket_start, overall_status, failed_at_check, country_code, message_count)
+SELECT g.granularity,
+       date_trunc(g.granularity, m.processing_completed_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+       m.overall_status, COALESCE(m.failed_at_check, ''), COALESCE(m.country_code, ''), count(*)
+FROM sms_monitor m CROSS JOIN (VALUES ('minute'), ('hour')) AS g(granularity)
+WHERE m.overall_status IN ('valid', 'invalid', 'dead_letter')
+AND m.processing_completed_at IS NOT NULL
+AND NOT EXISTS (SELECT 1 FROM sms_stats_rollup)
+GROUP BY 1, 2, 3, 4, 5;
+
+-- Minute buckets are kept this long; hour buckets are kept
+INSERT INTO system_settings (setting_key, setting_value)
+SELECT 'stats_minute_retention_hours', '48'
+WHERE NOT EXISTS (SELECT 1 FROM system_settings WHERE setting_key = 'stats_minute_retention_hours');
+
+-- Per-country validation plan overrides, e.g. {"91": {"check_enabled": {"foreign_number": false}}}
+INSERT INTO system_settings (setting_key, setting_value)
+SELECT 'check_overrides', '{}'
+WHERE NOT EXISTS (SELECT 1 FROM system_settings WHERE setting_key = 'check_overrides');
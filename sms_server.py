@@ -1,14 +1,19 @@
 import os
+import io
+import csv
 import json
+import time
 import asyncio
 import logging
 import secrets
-import hashlib
+import uuid
 from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
 from typing import List, Dict, Optional
 import asyncpg
 import redis
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi import APIRouter, FastAPI, HTTPException, BackgroundTasks, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import requests
 
@@ -18,14 +23,6 @@ class SMSInput(BaseModel):
     sms_message: str
     received_timestamp: datetime
 
-class BatchSMSData(BaseModel):
-    uuid: str
-    sender_number: str
-    sms_message: str
-    received_timestamp: datetime
-    country_code: Optional[str] = None
-    local_mobile: Optional[str] = None
-
 # New models for onboarding functionality
 class OnboardingRequest(BaseModel):
     mobile_number: str
@@ -46,7 +43,18 @@ except (FileNotFoundError, json.JSONDecodeError):
 CF_BACKEND_URL = os.getenv('CF_BACKEND_URL', config.get('cf_endpoint', 'https://default-url-if-not-set'))
 API_KEY = os.getenv('CF_API_KEY', config.get('cf_api_key', ''))
 
-HASH_SECRET_KEY = os.getenv('HASH_SECRET_KEY', '')  # Added for hash validation
+# HASH_SECRET_KEY / HASH_SECRET_KEYS are read by checks.onboarding_hash for the 'hmac' hash scheme
+
+# Seconds between SSE keepalive comments on the live result feed
+RESULT_FEED_KEEPALIVE = float(os.getenv('RESULT_FEED_KEEPALIVE', 15))
+
+# GET /export: rows per keyset page (one short transaction each), and per cursor fetch
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', 10000))
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', 1000))
+
+# Bulk onboarding: numbers per request, and per COPY + merge transaction
+BULK_ONBOARDING_MAX_NUMBERS = int(os.getenv('BULK_ONBOARDING_MAX_NUMBERS', 100000))
+BULK_ONBOARDING_CHUNK_SIZE = int(os.getenv('BULK_ONBOARDING_CHUNK_SIZE', 5000))
 
 POSTGRES_CONFIG = {
     'host': os.getenv('POSTGRES_HOST', 'localhost'),
@@ -56,67 +64,79 @@ POSTGRES_CONFIG = {
     'port': int(os.getenv('POSTGRES_PORT', 6432)),  # pgbouncer port
 }
 
-REDIS_CONFIG = {
-    'host': os.getenv('REDIS_HOST', 'localhost'),
-    'port': int(os.getenv('REDIS_PORT', 6379)),
-    'password': os.getenv('REDIS_PASSWORD', None),
-    'db': 0,
-}
+# REDIS_HOST / REDIS_PORT / REDIS_PASSWORD (and REDIS_CLUSTER / REDIS_NODES) are read by
+# checks.redis_store; checks.duplicate_check owns the Redis client
+
+# Process role:
+#   all        HTTP endpoints plus the batch pipeline in one process (single-process default)
+#   ingest     HTTP endpoints only; scale with uvicorn --workers (WEB_CONCURRENCY)
+#   validator  batch processor, expiry sweeper and duplicate filter warmup; HTTP serves health/metrics
+SERVER_ROLE = os.getenv('SMS_SERVER_ROLE', 'all').strip().lower()
 
-app = FastAPI()
-redis_client = redis.StrictRedis(**REDIS_CONFIG)
-pool = None
+router = APIRouter()
 
 # Logging setup with file handlers for persistent logging
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
 LOG_DIR = os.getenv('LOG_DIR', '/app/logs')
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
-# Ensure log directory exists
-os.makedirs(LOG_DIR, exist_ok=True)
-
-# Configure logging with both file and console handlers
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()  # Console output for Docker logs
-    ]
-)
-
-# Add rotating file handlers for persistent logging
-from logging.handlers import RotatingFileHandler
-
-# Create rotating file handler for general logs
-rotating_handler = RotatingFileHandler(
-    f'{LOG_DIR}/sms_server.log',
-    maxBytes=50*1024*1024,  # 50MB
-    backupCount=5
-)
-rotating_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+logger = logging.getLogger(__name__)
+_logging_configured = False
 
-# Create rotating file handler for errors
-error_handler = RotatingFileHandler(
-    f'{LOG_DIR}/sms_server_errors.log',
-    maxBytes=50*1024*1024,  # 50MB
-    backupCount=5
-)
-error_handler.setLevel(logging.ERROR)
-error_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+def configure_logging():
+    """Console plus rotating file handlers; called by create_app, not at import."""
+    global _logging_configured
+    if _logging_configured:
+        return
+    _logging_configured = True
+    
+    # Ensure log directory exists
+    os.makedirs(LOG_DIR, exist_ok=True)
+    
+    # Configure logging with both file and console handlers
+    logging.basicConfig(
+        level=getattr(logging, LOG_LEVEL),
+        format=LOG_FORMAT,
+        handlers=[
+            logging.StreamHandler()  # Console output for Docker logs
+        ]
+    )
+    
+    # Create rotating file handler for general logs
+    rotating_handler = RotatingFileHandler(
+        f'{LOG_DIR}/sms_server.log',
+        maxBytes=50*1024*1024,  # 50MB
+        backupCount=5
+    )
+    rotating_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    
+    # Create rotating file handler for errors
+    error_handler = RotatingFileHandler(
+        f'{LOG_DIR}/sms_server_errors.log',
+        maxBytes=50*1024*1024,  # 50MB
+        backupCount=5
+    )
+    error_handler.setLevel(logging.ERROR)
+    error_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    
+    # Add handlers to root logger
+    logging.getLogger().addHandler(rotating_handler)
+    logging.getLogger().addHandler(error_handler)
+    
+    logger.info(f"SMS Server starting with log level: {LOG_LEVEL}, role: {SERVER_ROLE} (pid {os.getpid()})")
+    logger.info(f"Logs will be written to: {LOG_DIR}")
 
-# Add handlers to root logger
-logging.getLogger().addHandler(rotating_handler)
-logging.getLogger().addHandler(error_handler)
+async def get_db_pool():
+    """Pool used by request handlers (through pgbouncer); sizing is described in checks/db_pool.py."""
+    return await pool_manager.get('ingest')
 
-logger = logging.getLogger(__name__)
-logger.info(f"SMS Server starting with log level: {LOG_LEVEL}")
-logger.info(f"Logs will be written to: {LOG_DIR}")
+async def get_batch_pool():
+    """Pool used by the batch processor and background tasks (the ingest pool unless BATCH_POSTGRES_HOST is set)."""
+    return await pool_manager.get('batch')
 
-async def get_db_pool():
-    global pool
-    if pool is None:
-        # Disable statement cache for PgBouncer compatibility
-        pool = await asyncpg.create_pool(**POSTGRES_CONFIG, min_size=1, max_size=10, statement_cache_size=0)
-    return pool
+async def get_export_pool():
+    """Pool used by GET /export (the batch pool unless EXPORT_POSTGRES_HOST is set)."""
+    return await pool_manager.get('export')
 
 async def get_setting(key: str):
     pool = await get_db_pool()
@@ -130,108 +150,424 @@ async def get_setting(key: str):
         except (json.JSONDecodeError, TypeError):
             return result
 
-async def run_validation_checks(batch_sms_data: List[BatchSMSData]):
-    check_sequence = await get_setting('check_sequence')
-    check_enabled = await get_setting('check_enabled')
-    pool = await get_db_pool()
+# Batch processor waits (seconds): input_sms polls while a partial batch waits for
+# batch_timeout, the pause between batches, and the backoff after an error
+BATCH_POLL_INTERVAL = 0.1
+BATCH_PAUSE = 0.1
+BATCH_ERROR_BACKOFF = 5.0
+# How often the batch processor looks for dead-lettered messages queued for replay
+REPLAY_POLL_INTERVAL = 5.0
+
+# Validation check names in sms_monitor column order
+CHECK_NAMES = ['blacklist', 'duplicate', 'foreign_number', 'header_hash', 'mobile', 'time_window']
+
+# sms_monitor statuses that mean a message needs no further processing
+FINAL_STATUSES = ('valid', 'invalid', 'dead_letter')
+
+# Infrastructure errors: the whole batch is retried later instead of blaming a single message
+TRANSIENT_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.TooManyConnectionsError,
+    redis.exceptions.ConnectionError,
+    redis.exceptions.TimeoutError,
+)
+
+class MessageProcessingError(Exception):
+    """A single message failed at `stage` for a reason that is not transient."""
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"{stage}: {error!r}")
+        self.stage = stage
+        self.error = error
+
+async def claim_batch(batch_sms_data: List['BatchRow'], pool) -> Dict[str, dict]:
+    """
+    Record a processing attempt for every message in the batch and return the
+    existing sms_monitor state per uuid. Messages seen before get retry_count
+    incremented (unless already finished), so a retried batch can skip finished
+    messages and reuse check results recorded by the previous attempt.
+    """
+    batch_id = uuid.uuid4()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("""
+            INSERT INTO sms_monitor (uuid, overall_status, processing_started_at, batch_id, country_code, local_mobile)
+            SELECT u, 'processing', NOW(), $2, c, l
+            FROM unnest($1::uuid[], $3::varchar[], $4::varchar[]) AS t(u, c, l)
+            ON CONFLICT (uuid) DO UPDATE SET
+                retry_count = sms_monitor.retry_count +
+                    CASE WHEN sms_monitor.overall_status IN ('valid', 'invalid', 'dead_letter') THEN 0 ELSE 1 END,
+                batch_id = EXCLUDED.batch_id
+            RETURNING uuid, overall_status, retry_count, blacklist_check, duplicate_check, foreign_number_check,
+                      header_hash_check, mobile_check, time_window_check
+        """, [sms.uuid for sms in batch_sms_data], batch_id,
+            [sms.country_code for sms in batch_sms_data], [sms.local_mobile for sms in batch_sms_data])
+    return {str(row['uuid']): dict(row) for row in rows}
+
+async def dead_letter_message(pool, sms_uuid, sender_number, sms_message, received_timestamp,
+                              error: str, stage: str, retry_count: int):
+    """
+    Move a message that keeps failing to dead_letter_sms and mark it final in
+    sms_monitor, so the rest of the queue keeps flowing.
+    """
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("""
+                INSERT INTO dead_letter_sms (uuid, sender_number, sms_message, received_timestamp,
+                                             error, failed_stage, retry_count)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
+                ON CONFLICT (uuid) DO UPDATE SET
+                    error = EXCLUDED.error,
+                    failed_stage = EXCLUDED.failed_stage,
+                    retry_count = EXCLUDED.retry_count,
+                    dead_lettered_at = NOW(),
+                    replayed_at = NULL
+            """, sms_uuid, sender_number, sms_message, received_timestamp, error[:1000], stage, retry_count)
+            await stats_rollup.retract(conn, [sms_uuid])
+            await conn.execute("""
+                INSERT INTO sms_monitor (uuid, overall_status, failed_at_check, processing_completed_at, retry_count)
+                VALUES ($1, 'dead_letter', $2, NOW(), $3)
+                ON CONFLICT (uuid) DO UPDATE SET
+                    overall_status = EXCLUDED.overall_status,
+                    failed_at_check = EXCLUDED.failed_at_check,
+                    processing_completed_at = EXCLUDED.processing_completed_at,
+                    retry_count = EXCLUDED.retry_count
+            """, sms_uuid, stage, retry_count)
+            await stats_rollup.record(conn, [sms_uuid])
+    logger.error(f"SMS {sms_uuid} moved to dead letter queue after {retry_count} attempts at {stage}: {error}")
+
+async def evaluate_message(sms: 'BatchRow', claim: dict, plan: 'ValidationPlan', batch: 'BatchContext',
+                           concurrent: bool = False) -> dict:
+    """
+    Run the validation plan for one message and return its verdict; nothing is written here.
+    Transient infrastructure errors propagate unchanged; anything else is
+    wrapped in MessageProcessingError with the stage that failed.
     
-    for sms in batch_sms_data:
-        # Initialize all check results to 0 (not run)
-        results = {
-            'blacklist_check': 0,
-            'duplicate_check': 0,
-            'foreign_number_check': 0,
-            'header_hash_check': 0,
-            'mobile_check': 0,
-            'time_window_check': 0
-        }
+    With concurrent=True every enabled pure-read check is started up front and
+    runs alongside the others. Side-effecting checks still run only after all
+    checks before them have passed. Results are consumed in plan order, so the
+    verdict matches sequential early exit exactly: checks after the first
+    failure are reported as not run and their errors are ignored.
+    """
+    stage = 'validation'
+    speculative = {}
+    # Country-specific settings (check_overrides) seen by the checks of this message
+    overrides_token = current_overrides.set(plan.settings)
+    try:
+        if concurrent:
+            for step in plan.steps:
+                if not step.side_effects and not claim.get(step.column):
+                    speculative[step.name] = asyncio.ensure_future(step.func(sms, batch.pool))
+        
+        results = list(plan.initial_results)
         overall_status = 'valid'
         failed_check = None
         
-        for check_name in check_sequence:
-            if not check_enabled.get(check_name, False):
-                results[f'{check_name}_check'] = 3  # skipped
-                continue
-            
-            # Use explicit function mapping instead of globals() to prevent code injection
-            if check_name not in VALIDATION_FUNCTIONS:
-                logger.error(f"Unknown validation check: {check_name}")
-                results[f'{check_name}_check'] = 2  # fail
+        for step in plan.steps:
+            if step.func is None:
+                logger.error(f"Unknown validation check: {step.name}")
                 overall_status = 'invalid'
-                failed_check = check_name
+                failed_check = step.name
                 break
             
-            check_func = VALIDATION_FUNCTIONS[check_name]
-            result = await check_func(sms, pool)
-            results[f'{check_name}_check'] = result
+            # Reuse a result from a previous attempt instead of re-running the check
+            stage = step.name
+            result = claim.get(step.column) or 0
+            if not result:
+                if step.name in speculative:
+                    result = await speculative.pop(step.name)
+                else:
+                    result = await step.func(sms, batch.pool)
+                if step.side_effects:
+                    claim[step.column] = result
+            if step.index is not None:
+                results[step.index] = result
             
             if result == 2:  # fail
                 overall_status = 'invalid'
-                failed_check = check_name
+                failed_check = step.name
                 break
-            elif result == 3:  # skipped
-                continue
-        
-        # Update sms_monitor with country code and local mobile
-        async with pool.acquire() as conn:
-            await conn.execute("""
-                INSERT INTO sms_monitor (uuid, overall_status, failed_at_check, processing_completed_at, 
-                                         blacklist_check, duplicate_check, foreign_number_check, header_hash_check, 
-                                         mobile_check, time_window_check, country_code, local_mobile)
-                VALUES ($1, $2, $3, NOW(), $4, $5, $6, $7, $8, $9, $10, $11)
-                ON CONFLICT (uuid) DO UPDATE SET 
-                    overall_status = EXCLUDED.overall_status,
-                    failed_at_check = EXCLUDED.failed_at_check,
-                    processing_completed_at = EXCLUDED.processing_completed_at,
-                    blacklist_check = EXCLUDED.blacklist_check,
-                    duplicate_check = EXCLUDED.duplicate_check,
-                    foreign_number_check = EXCLUDED.foreign_number_check,
-                    header_hash_check = EXCLUDED.header_hash_check,
-                    mobile_check = EXCLUDED.mobile_check,
-                    time_window_check = EXCLUDED.time_window_check,
-                    country_code = EXCLUDED.country_code,
-                    local_mobile = EXCLUDED.local_mobile
-            """, sms.uuid, overall_status, failed_check, *results.values(), sms.country_code, sms.local_mobile)
         
         if overall_status == 'valid':
-            # Insert to out_sms and Redis using structured mobile data
-            async with pool.acquire() as conn:
+            # Later messages from this sender in the batch are duplicates
+            batch.mark_validated(sms.local_mobile or sms.sender_number)
+        
+        # results is in CHECK_NAMES (sms_monitor column) order
+        return {'sms': sms, 'overall_status': overall_status, 'failed_check': failed_check, 'results': results}
+    except TRANSIENT_ERRORS:
+        raise
+    except Exception as e:
+        raise MessageProcessingError(stage, e) from e
+    finally:
+        if speculative:
+            # Checks sequential order would not have reached: wait for them and discard the outcome
+            await asyncio.gather(*speculative.values(), return_exceptions=True)
+        current_overrides.reset(overrides_token)
+
+async def write_back_verdicts(pool, batch: 'BatchContext', verdicts: List[dict], counted_uuids) -> set:
+    """
+    Write verdicts plus the count_sms/blacklist_sms changes taken by `counted_uuids` in one
+    transaction: counts as one +k per sender, sms_monitor and out_sms rows in bulk, and the
+    verdicts added to the sms_stats_rollup counters.
+    Returns the uuids newly inserted into out_sms.
+    """
+    count_updates = batch.count_updates(counted_uuids)
+    blacklist_updates = batch.blacklist_updates(counted_uuids)
+    valid = [v['sms'] for v in verdicts if v['overall_status'] == 'valid']
+    inserted = set()
+    
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if count_updates:
+                senders, increments, country_codes, local_mobiles = (list(c) for c in zip(*count_updates))
+                await conn.execute("""
+                    INSERT INTO count_sms (sender_number, message_count, country_code, local_mobile)
+                    SELECT * FROM unnest($1::varchar[], $2::int[], $3::varchar[], $4::varchar[])
+                    ON CONFLICT (sender_number) DO UPDATE SET 
+                        message_count = count_sms.message_count + EXCLUDED.message_count,
+                        country_code = EXCLUDED.country_code,
+                        local_mobile = EXCLUDED.local_mobile
+                """, senders, increments, country_codes, local_mobiles)
+            
+            if blacklist_updates:
+                senders, country_codes, local_mobiles = (list(c) for c in zip(*blacklist_updates))
                 await conn.execute("""
-                    INSERT INTO out_sms (uuid, sender_number, sms_message, country_code, local_mobile) 
-                    VALUES ($1, $2, $3, $4, $5)
-                """, sms.uuid, sms.sender_number, sms.sms_message, sms.country_code, sms.local_mobile)
-            redis_client.sadd('out_sms_numbers', sms.local_mobile)
+                    INSERT INTO blacklist_sms (sender_number, country_code, local_mobile)
+                    SELECT * FROM unnest($1::varchar[], $2::varchar[], $3::varchar[])
+                    ON CONFLICT (sender_number) DO UPDATE SET
+                        country_code = EXCLUDED.country_code,
+                        local_mobile = EXCLUDED.local_mobile
+                """, senders, country_codes, local_mobiles)
+            
+            if verdicts:
+                verdict_uuids = [v['sms'].uuid for v in verdicts]
+                await stats_rollup.retract(conn, verdict_uuids)
+                # Update sms_monitor with country code and local mobile
+                await conn.executemany("""
+                    INSERT INTO sms_monitor (uuid, overall_status, failed_at_check, processing_completed_at, 
+                                             blacklist_check, duplicate_check, foreign_number_check, header_hash_check, 
+                                             mobile_check, time_window_check, country_code, local_mobile)
+                    VALUES ($1, $2, $3, NOW(), $4, $5, $6, $7, $8, $9, $10, $11)
+                    ON CONFLICT (uuid) DO UPDATE SET 
+                        overall_status = EXCLUDED.overall_status,
+                        failed_at_check = EXCLUDED.failed_at_check,
+                        processing_completed_at = EXCLUDED.processing_completed_at,
+                        blacklist_check = EXCLUDED.blacklist_check,
+                        duplicate_check = EXCLUDED.duplicate_check,
+                        foreign_number_check = EXCLUDED.foreign_number_check,
+                        header_hash_check = EXCLUDED.header_hash_check,
+                        mobile_check = EXCLUDED.mobile_check,
+                        time_window_check = EXCLUDED.time_window_check,
+                        country_code = EXCLUDED.country_code,
+                        local_mobile = EXCLUDED.local_mobile
+                """, [
+                    (v['sms'].uuid, v['overall_status'], v['failed_check'], *v['results'],
+                     v['sms'].country_code, v['sms'].local_mobile)
+                    for v in verdicts
+                ])
+                await stats_rollup.record(conn, verdict_uuids)
             
-            # Forward to cloud backend only after validation passes
-            if CF_BACKEND_URL and API_KEY:
+            if valid:
+                # Valid messages go to out_sms in the same transaction so a retry can never see one without the other
+                rows = await conn.fetch("""
+                    INSERT INTO out_sms (uuid, sender_number, sms_message, country_code, local_mobile)
+                    SELECT * FROM unnest($1::uuid[], $2::varchar[], $3::text[], $4::varchar[], $5::varchar[])
+                    ON CONFLICT (uuid) DO NOTHING
+                    RETURNING uuid
+                """, [sms.uuid for sms in valid], [sms.sender_number for sms in valid],
+                    [sms.sms_message for sms in valid], [sms.country_code for sms in valid],
+                    [sms.local_mobile for sms in valid])
+                inserted = {str(row['uuid']) for row in rows}
+    return inserted
+
+def result_event(sms: 'BatchRow', overall_status: str, failed_at_check: Optional[str]) -> dict:
+    """Live feed event for a message whose outcome was just committed."""
+    return {
+        'uuid': sms.uuid,
+        'local_mobile': sms.local_mobile or sms.sender_number,
+        'country_code': sms.country_code,
+        'overall_status': overall_status,
+        'failed_at_check': failed_at_check,
+        'completed_at': datetime.now(timezone.utc).isoformat(),
+    }
+
+def publish_validated(sms: 'BatchRow'):
+    """Post-commit work for a newly validated message; failures here never re-validate it."""
+    try:
+        remember_validated_number(sms.local_mobile or sms.sender_number)
+    except Exception as e:
+        logger.warning(f"Failed to cache validated number for SMS {sms.uuid}: {e}")
+    
+    # Forward to cloud backend only after validation passes
+    if CF_BACKEND_URL and API_KEY:
+        try:
+            # Convert datetime to string for JSON serialization
+            sms_dict = {
+                'sender_number': sms.sender_number,
+                'sms_message': sms.sms_message,
+                'received_timestamp': sms.received_timestamp.isoformat()
+            }
+            response = requests.post(CF_BACKEND_URL, json=sms_dict, headers={'Authorization': f'Bearer {API_KEY}'}, timeout=5)
+            logger.info(f"Forwarded validated SMS to cloud, status: {response.status_code}")
+        except Exception as e:
+            logger.warning(f"Cloud forwarding failed for validated SMS: {e}")
+
+async def run_validation_checks(batch_sms_data: List['BatchRow']):
+    try:
+        max_retries = max(1, int(await get_setting('max_database_retries')))
+    except (TypeError, ValueError):
+        max_retries = 3
+    pool = await get_batch_pool()
+    
+    claims = await claim_batch(batch_sms_data, pool)
+    resumed = sum(1 for claim in claims.values() if claim['retry_count'] > 0)
+    if resumed:
+        logger.info(f"Resuming {resumed}/{len(batch_sms_data)} messages from a previous attempt")
+    
+    pending = []
+    for sms in batch_sms_data:
+        claim = claims.setdefault(sms.uuid, {})
+        if claim.get('overall_status') in FINAL_STATUSES:
+            logger.debug(f"Skipping already processed SMS {sms.uuid} ({claim['overall_status']})")
+            continue
+        pending.append(sms)
+    if not pending:
+        return
+    
+    # Settings, onboarding rows and counts are looked up once per batch / per sender
+    batch = BatchContext(pool)
+    await batch.prefetch(pending)
+    
+    # Optional: run independent pure-read checks of a message concurrently
+    concurrent = batch.setting('concurrent_checks') == 'true'
+    
+    # Compiled once per settings version; every message of this batch uses the same plans
+    plans = pipeline_compiler.plans(batch.settings)
+    
+    verdicts = []
+    dead_lettered = []
+    token = current_batch.set(batch)
+    try:
+        for sms in pending:
+            claim = claims[sms.uuid]
+            # Isolate failures per message: retry a bad message a bounded number of
+            # times, then dead-letter it instead of stalling the whole batch
+            attempt = 0
+            while True:
                 try:
-                    # Convert datetime to string for JSON serialization
-                    sms_dict = {
-                        'sender_number': sms.sender_number,
-                        'sms_message': sms.sms_message,
-                        'received_timestamp': sms.received_timestamp.isoformat()
-                    }
-                    response = requests.post(CF_BACKEND_URL, json=sms_dict, headers={'Authorization': f'Bearer {API_KEY}'}, timeout=5)
-                    logger.info(f"Forwarded validated SMS to cloud, status: {response.status_code}")
-                except Exception as e:
-                    logger.warning(f"Cloud forwarding failed for validated SMS: {e}")
+                    verdicts.append(await evaluate_message(sms, claim, plans.for_country(sms.country_code), batch,
+                                                           concurrent))
+                    break
+                except MessageProcessingError as e:
+                    attempt += 1
+                    if attempt >= max_retries:
+                        await dead_letter_message(
+                            pool, sms.uuid, sms.sender_number, sms.sms_message, sms.received_timestamp,
+                            repr(e.error), e.stage, claim.get('retry_count', 0) + attempt
+                        )
+                        dead_lettered.append(result_event(sms, 'dead_letter', e.stage))
+                        break
+                    logger.warning(f"SMS {sms.uuid} failed at {e.stage} (attempt {attempt}/{max_retries}): {e.error!r}")
+                    await asyncio.sleep(0.1 * 2 ** (attempt - 1))
+    finally:
+        current_batch.reset(token)
+    
+    # One transaction for the whole batch; if a single verdict cannot be written,
+    # fall back to one transaction per message so only that message is dead-lettered.
+    # Counts are written only with a verdict: a dead-lettered message records no
+    # blacklist_check, so its replay runs the blacklist check (and takes its count) again
+    try:
+        inserted = await write_back_verdicts(pool, batch, verdicts, [v['sms'].uuid for v in verdicts])
+    except TRANSIENT_ERRORS:
+        raise
+    except Exception as e:
+        logger.warning(f"Batch write-back failed ({e!r}), writing {len(verdicts)} verdicts individually")
+        inserted = set()
+        for verdict in verdicts:
+            sms = verdict['sms']
+            try:
+                inserted |= await write_back_verdicts(pool, batch, [verdict], [sms.uuid])
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception as write_error:
+                await dead_letter_message(
+                    pool, sms.uuid, sms.sender_number, sms.sms_message, sms.received_timestamp,
+                    repr(write_error), 'write', claims[sms.uuid].get('retry_count', 0) + 1
+                )
+                verdict['overall_status'] = 'dead_letter'
+    
+    for verdict in verdicts:
+        claims[verdict['sms'].uuid]['overall_status'] = verdict['overall_status']
+        if verdict['sms'].uuid in inserted:
+            publish_validated(verdict['sms'])
+    
+    # Live feed for subscribers waiting on these senders
+    result_hub.publish(dead_lettered + [
+        result_event(v['sms'], v['overall_status'], 'write' if v['overall_status'] == 'dead_letter' else v['failed_check'])
+        for v in verdicts
+    ])
 
-async def batch_processor():
+async def rows_to_batch(rows, pool) -> List['BatchRow']:
+    """Convert input_sms records to BatchRows, dead-lettering rows that cannot be decoded."""
+    batch_data = []
+    for row in rows:
+        try:
+            batch_data.append(BatchRow.from_record(row))
+        except Exception as e:
+            # Malformed rows can never validate; dead-letter them straight away
+            await dead_letter_message(
+                pool, str(row['uuid']), row['sender_number'], row['sms_message'],
+                row['received_timestamp'], repr(e), 'decode', 1
+            )
+    return batch_data
+
+async def process_replay_queue(pool, limit: int) -> int:
+    """
+    Validate up to `limit` dead-lettered messages queued by the replay endpoints, oldest
+    replay first, and return how many were taken. They sit behind the checkpoint, so the
+    input_sms scan never sees them again. A message stays queued (status 'pending') until
+    it gets a final status, so a failed attempt is simply picked up on the next poll.
+    """
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT i.uuid, i.sender_number, i.sms_message, i.received_timestamp, i.country_code, i.local_mobile
+            FROM sms_monitor m
+            JOIN dead_letter_sms d ON d.uuid = m.uuid
+            JOIN input_sms i ON i.uuid = m.uuid
+            WHERE m.overall_status = 'pending' AND d.replayed_at IS NOT NULL
+            ORDER BY d.replayed_at, m.uuid
+            LIMIT $1
+        """, limit)
+    if rows:
+        logger.info(f"Replaying {len(rows)} dead-lettered SMS messages")
+        batch_data = await rows_to_batch(rows, pool)
+        if batch_data:
+            await run_validation_checks(batch_data)
+    return len(rows)
+
+async def batch_processor(clock: Optional['Clock'] = None):
     """
     Advanced batch processor with timeout-based batching logic.
     
     Process flow:
     1. Read batch size and timeout settings from the settings table
-    2. Query input_sms for new rows where uuid > last processed UUID
-    3. If rows < batch_size: wait for batch_timeout or more rows
-    4. Process available batch (1 to batch_size rows)
-    5. Update last processed UUID and repeat
+    2. Every REPLAY_POLL_INTERVAL seconds, validate dead-lettered messages queued for replay
+    3. Query input_sms for new rows where uuid > last processed UUID
+    4. If rows < batch_size: wait for batch_timeout or more rows
+    5. Process available batch (1 to batch_size rows)
+    6. Update last processed UUID and repeat
+    
+    All waits go through `clock` (checks/clock.py, the system clock by default),
+    so tests/bench/simulate.py can run this loop in virtual time.
     """
+    clock = clock or system_clock
     logger.info("Starting advanced batch processor...")
+    next_replay_poll = clock.monotonic()
     
     while True:
         try:
-            pool = await get_db_pool()
+            pool = await get_batch_pool()
             
             # Read batch size and timeout settings
             try:
@@ -253,11 +589,20 @@ async def batch_processor():
                 last_uuid = await get_setting('last_processed_uuid')
             except Exception as e:
                 logger.error(f"Failed to read batch processor settings: {e}")
-                await asyncio.sleep(5)
+                await clock.sleep(BATCH_ERROR_BACKOFF)
                 continue
             
             logger.debug(f"Batch processor config: size={batch_size}, timeout={batch_timeout}s, last_uuid={last_uuid}")
             
+            # Dead-lettered messages queued for replay; a failure here must not stall new messages
+            if clock.monotonic() >= next_replay_poll:
+                next_replay_poll = clock.monotonic() + REPLAY_POLL_INTERVAL
+                try:
+                    if await process_replay_queue(pool, batch_size) >= batch_size:
+                        next_replay_poll = clock.monotonic()  # more are queued
+                except Exception as e:
+                    logger.error(f"Dead letter replay failed, retrying in {REPLAY_POLL_INTERVAL}s: {e}")
+            
             # Query for new rows
             async with pool.acquire() as conn:
                 rows = await conn.fetch("""
@@ -274,18 +619,18 @@ async def batch_processor():
             # If no rows, wait and continue
             if initial_row_count == 0:
                 logger.debug("No new SMS messages found, waiting...")
-                await asyncio.sleep(batch_timeout)
+                await clock.sleep(batch_timeout)
                 continue
             
             # If we have fewer rows than batch_size, wait for timeout
             if initial_row_count < batch_size:
                 logger.debug(f"Only {initial_row_count}/{batch_size} rows available, starting {batch_timeout}s timeout...")
                 
-                timeout_start = asyncio.get_event_loop().time()
+                timeout_start = clock.monotonic()
                 
                 # Poll during timeout period
                 while True:
-                    current_time = asyncio.get_event_loop().time()
+                    current_time = clock.monotonic()
                     elapsed = current_time - timeout_start
                     
                     if elapsed >= batch_timeout:
@@ -311,21 +656,17 @@ async def batch_processor():
                         rows = updated_rows
                     
                     # Short sleep to avoid tight polling
-                    await asyncio.sleep(0.1)
+                    await clock.sleep(BATCH_POLL_INTERVAL)
             
             # Process the batch if we have any rows
             if rows:
                 logger.info(f"Processing batch of {len(rows)} SMS messages")
                 
-                # Convert UUID objects to strings for Pydantic model
-                batch_data = []
-                for row in rows:
-                    row_dict = dict(row)
-                    row_dict['uuid'] = str(row_dict['uuid'])  # Convert UUID to string
-                    batch_data.append(BatchSMSData(**row_dict))
+                batch_data = await rows_to_batch(rows, pool)
                 
                 # Run validation checks
-                await run_validation_checks(batch_data)
+                if batch_data:
+                    await run_validation_checks(batch_data)
                 
                 # Update last_processed_uuid to the highest UUID in this batch
                 new_last_uuid = rows[-1]['uuid']
@@ -337,29 +678,174 @@ async def batch_processor():
                 logger.info(f"Batch processing completed. Updated last_processed_uuid to: {new_last_uuid}")
             
             # Brief pause before next iteration
-            await asyncio.sleep(0.1)
+            await clock.sleep(BATCH_PAUSE)
             
         except Exception as e:
             logger.error(f"Error in batch processor: {e}")
-            await asyncio.sleep(5)  # Wait longer on error
+            await clock.sleep(BATCH_ERROR_BACKOFF)  # Wait longer on error
 
-@app.on_event("startup")
-async def startup_event():
-    # Cache warmup with local mobile numbers for consistency
-    pool = await get_db_pool()
+async def expire_onboarding_batch(pool, expiry_hours: float, batch_size: int) -> List[str]:
+    """
+    Deactivate up to batch_size registrations older than expiry_hours, oldest first.
+    Uses the partial index on active request_timestamps; SKIP LOCKED lets several
+    server replicas sweep concurrently without blocking each other or registrations.
+    """
     async with pool.acquire() as conn:
-        numbers = await conn.fetch("SELECT local_mobile FROM out_sms WHERE local_mobile IS NOT NULL")
-        for row in numbers:
-            redis_client.sadd('out_sms_numbers', row['local_mobile'])
+        rows = await conn.fetch("""
+            WITH expired AS (
+                SELECT mobile_number FROM onboarding_mobile
+                WHERE is_active = true
+                AND request_timestamp < NOW() - make_interval(secs => $1)
+                ORDER BY request_timestamp
+                LIMIT $2
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE onboarding_mobile o SET is_active = false
+            FROM expired
+            WHERE o.mobile_number = expired.mobile_number
+            RETURNING o.mobile_number
+        """, expiry_hours * 3600, batch_size)
+    return [row['mobile_number'] for row in rows]
+
+async def onboarding_expiry_sweeper():
+    """
+    Background task that deactivates onboarding registrations older than
+    onboarding_expiry_hours, in batches, so the active set stays small.
+    Also keeps the in-process onboarding cache (and its expiry heap) current.
+    """
+    logger.info("Starting onboarding expiry sweeper...")
+    
+    while True:
+        sweep_interval = 60.0
+        try:
+            pool = await get_batch_pool()
+            expiry_hours = float(await get_setting('onboarding_expiry_hours') or 0)
+            batch_size = int(await get_setting('onboarding_sweep_batch_size') or 1000)
+            sweep_interval = float(await get_setting('onboarding_sweep_interval') or 60)
+            
+            active_onboarding.set_expiry(expiry_hours)
+            await active_onboarding.refresh(pool)
+            
+            if expiry_hours > 0:
+                total = 0
+                while True:
+                    expired = await expire_onboarding_batch(pool, expiry_hours, batch_size)
+                    active_onboarding.mark_expired(expired)
+                    total += len(expired)
+                    if len(expired) < batch_size:
+                        break
+                    await asyncio.sleep(0)  # let validation work interleave between batches
+                if total:
+                    logger.info(f"Deactivated {total} onboarding registrations older than {expiry_hours}h")
+        except Exception as e:
+            logger.error(f"Error in onboarding expiry sweeper: {e}")
+        
+        await asyncio.sleep(sweep_interval)
+
+async def stats_rollup_pruner():
+    """Background task that drops minute rollup buckets older than stats_minute_retention_hours."""
+    logger.info("Starting stats rollup pruner...")
+    
+    while True:
+        try:
+            retention_hours = float(await get_setting('stats_minute_retention_hours') or 48)
+            if retention_hours > 0:
+                pool = await get_batch_pool()
+                async with pool.acquire() as conn:
+                    pruned = await stats_rollup.prune_minute_buckets(conn, retention_hours)
+                if pruned:
+                    logger.info(f"Pruned {pruned} minute stats buckets older than {retention_hours}h")
+        except Exception as e:
+            logger.error(f"Error in stats rollup pruner: {e}")
+        
+        await asyncio.sleep(3600)
+
+async def warm_db_pool():
+    """Open the request pool ahead of the first request; a failure is retried by that request."""
+    try:
+        await get_db_pool()
+    except Exception as e:
+        logger.warning(f"Database pool warmup failed, will retry on first use: {e}")
+
+async def warm_duplicate_filter():
+    """Duplicate filter and Redis warmup with numbers validated within out_sms_cache_ttl."""
+    cached = 0
+    
+    def cache(rows):
+        nonlocal cached
+        cached = cache_validated_numbers(
+            ((row['number'], row['forwarded_timestamp']) for row in rows), datetime.now(timezone.utc)
+        )
+    
+    try:
+        # Redis keys are written before the filter goes live (see ValidatedNumberFilter.warm)
+        rows = await validated_numbers.warm(get_batch_pool, cache)
+        logger.info(f"Duplicate filter warmed with {len(rows)} numbers, {cached} cached in Redis "
+                    f"(ttl {validated_numbers.ttl}s)")
+    except Exception as e:
+        # The duplicate check loads the filter on first use and falls back to Redis until then
+        logger.error(f"Duplicate filter warmup failed: {e}")
+
+async def startup_event():
+    # Nothing here blocks readiness: pool and cache warmups run as background tasks
+    asyncio.create_task(warm_db_pool())
+    
+    if SERVER_ROLE == 'ingest':
+        # Validation runs in the validator process
+        logger.info("Ingest role: batch processor and expiry sweeper run in the validator process")
+        return
+    
+    # The warmup takes the filter lock before the batch processor task first runs; the
+    # duplicate check waits on it while the out_sms scan and Redis caching run, so the
+    # batch processor can start straight away
+    asyncio.create_task(warm_duplicate_filter())
     
     # Start batch processor
     asyncio.create_task(batch_processor())
+    
+    # Start onboarding expiry sweeper
+    asyncio.create_task(onboarding_expiry_sweeper())
+    
+    # Start minute stats bucket pruning
+    asyncio.create_task(stats_rollup_pruner())
 
-@app.post("/sms/receive")
+async def shutdown_event():
+    result_hub.stop()
+    await pool_manager.close()
+
+async def admit(kind: str):
+    """
+    Admission control (checks/admission.py): raise 429/503 with Retry-After when
+    the request must be shed. kind is 'sms' or 'onboarding'.
+    """
+    try:
+        await admission.refresh(await get_db_pool())
+    except Exception as e:
+        logger.warning(f"Admission state refresh failed, using last known state: {e}")
+    
+    shedding = admission.shedding
+    rejection = admission.check(kind)
+    if kind == 'sms' and admission.shedding != shedding:
+        if admission.shedding:
+            logger.warning(f"Shedding /sms/receive ({admission.shedding}): backlog {admission.backlog}, "
+                           f"lag {admission.lag_seconds:.0f}s, in flight {admission.in_flight}")
+        else:
+            logger.info("Admission control: accepting /sms/receive again")
+    if rejection is not None:
+        detail = "Maintenance mode" if rejection.reason == 'maintenance' else f"Overloaded ({rejection.reason}), retry later"
+        raise HTTPException(status_code=rejection.status_code, detail=detail,
+                            headers={'Retry-After': str(rejection.retry_after)})
+
+@router.post("/sms/receive")
 async def receive_sms(request: Request, background_tasks: BackgroundTasks):
     """
     Handle SMS reception from both JSON and form-encoded data
     """
+    await admit('sms')
+    async with admission.track():
+        return await store_sms(request)
+
+async def store_sms(request: Request):
     content_type = request.headers.get("content-type", "").lower()
     
     try:
@@ -397,7 +883,6 @@ async def receive_sms(request: Request, background_tasks: BackgroundTasks):
             raise HTTPException(status_code=400, detail="Content-Type must be application/json or application/x-www-form-urlencoded")
         
         # Extract country code and local mobile for structured storage
-        from checks.mobile_utils import normalize_mobile_number
         pool = await get_db_pool()
         country_code, local_mobile = await normalize_mobile_number(sms_data.sender_number, pool)
         
@@ -423,19 +908,19 @@ async def receive_sms(request: Request, background_tasks: BackgroundTasks):
         logger.error(f"Error processing SMS: {e}")
         raise HTTPException(status_code=400, detail=f"Error processing SMS: {str(e)}")
 
-@app.post("/onboarding/register", response_model=OnboardingResponse)
+@router.post("/onboarding/register", response_model=OnboardingResponse)
 async def register_mobile(request: OnboardingRequest):
     """
     Register a mobile number for onboarding and generate hash.
     Returns the mobile number, hash, and instruction message.
     """
+    await admit('onboarding')
     try:
         pool = await get_db_pool()
         mobile_number = request.mobile_number.strip()
         
         # Validate mobile number format
-        import re
-        if not re.match(r'^\d{10,15}$', mobile_number):
+        if not MOBILE_NUMBER_PATTERN.match(mobile_number):
             raise HTTPException(status_code=400, detail="Invalid mobile number format")
         
         # Generate salt
@@ -446,7 +931,24 @@ async def register_mobile(request: OnboardingRequest):
         
         salt = secrets.token_hex(salt_length // 2)  # hex gives 2 chars per byte
         
-        # Check if mobile number already exists and is active
+        # Get permitted header and hash scheme from settings (use first header for generation)
+        permitted_headers_str, hash_scheme = await fetch_header_hash_settings(pool)
+        
+        if not permitted_headers_str:
+            raise HTTPException(status_code=500, detail="No permitted headers configured in system settings")
+        if hash_scheme == 'hmac' and not get_key_ring().can_sign:
+            raise HTTPException(status_code=500, detail="No hash secret key configured (set HASH_SECRET_KEY or HASH_SECRET_KEYS)")
+        
+        # Use the first permitted header for hash generation
+        demo_header = permitted_headers_str.split(',')[0].strip()
+        try:
+            # 'hmac' issues a stateless token verifiable without a database lookup
+            computed_hash = compute_onboarding_hash(hash_scheme, mobile_number, demo_header, salt)
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        
+        # Check if mobile number already exists and is active; the row is written only
+        # once the hash is known, so a failed request leaves no record behind
         async with pool.acquire() as conn:
             existing = await conn.fetchrow(
                 "SELECT mobile_number, is_active FROM onboarding_mobile WHERE mobile_number = $1",
@@ -459,38 +961,22 @@ async def register_mobile(request: OnboardingRequest):
             # Insert or update onboarding record
             if existing:
                 # Reactivate existing record with new salt
-                await conn.execute("""
+                request_timestamp = await conn.fetchval("""
                     UPDATE onboarding_mobile 
-                    SET salt = $1, request_timestamp = NOW(), is_active = true 
-                    WHERE mobile_number = $2
-                """, salt, mobile_number)
+                    SET salt = $1, hash = $2, request_timestamp = NOW(), is_active = true 
+                    WHERE mobile_number = $3
+                    RETURNING request_timestamp
+                """, salt, computed_hash, mobile_number)
             else:
                 # Create new record
-                await conn.execute("""
+                request_timestamp = await conn.fetchval("""
                     INSERT INTO onboarding_mobile (mobile_number, salt, hash) 
                     VALUES ($1, $2, $3)
-                """, mobile_number, salt, "")  # hash will be computed below
-        
-        # Get permitted header from settings (use first one for generation)
-        async with pool.acquire() as conn:
-            permitted_headers_str = await conn.fetchval(
-                "SELECT setting_value FROM system_settings WHERE setting_key = 'permitted_headers'"
-            )
-        
-        if not permitted_headers_str:
-            raise HTTPException(status_code=500, detail="No permitted headers configured in system settings")
-        
-        # Use the first permitted header for hash generation
-        demo_header = permitted_headers_str.split(',')[0].strip()
-        data_to_hash = f"{demo_header}{mobile_number}{salt}"
-        computed_hash = hashlib.sha256(data_to_hash.encode('utf-8')).hexdigest()
-        
-        # Update the hash in database
-        async with pool.acquire() as conn:
-            await conn.execute(
-                "UPDATE onboarding_mobile SET hash = $1 WHERE mobile_number = $2",
-                computed_hash, mobile_number
-            )
+                    RETURNING request_timestamp
+                """, mobile_number, salt, computed_hash)
+        # The cache is read by the checks only; an ingest process never refreshes it, so it would just grow
+        if SERVER_ROLE != 'ingest':
+            active_onboarding.update(mobile_number, request_timestamp)
         
         message = f"{demo_header}:{computed_hash}"
         
@@ -506,7 +992,163 @@ async def register_mobile(request: OnboardingRequest):
         logger.error(f"Error in register_mobile: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@app.get("/onboarding/status/{mobile_number}")
+async def read_bulk_mobile_numbers(request: Request) -> List[str]:
+    """
+    Mobile numbers from a bulk registration request: a JSON list (or {"mobile_numbers": [...]}),
+    a text/CSV body, or an uploaded file in form field "file". CSV input uses the
+    mobile_number column when there is a header row, otherwise the first column.
+    """
+    content_type = request.headers.get("content-type", "").lower()
+    if "application/json" in content_type:
+        body = await request.json()
+        numbers = body.get('mobile_numbers') if isinstance(body, dict) else body
+        if not isinstance(numbers, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON list of mobile numbers or {\"mobile_numbers\": [...]}")
+        return [str(number) for number in numbers]
+    
+    if "multipart/form-data" in content_type:
+        form = await request.form()
+        upload = form.get('file')
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Upload the numbers in form field 'file'")
+        raw = await upload.read()
+    elif content_type.startswith("text/"):
+        raw = await request.body()
+    else:
+        raise HTTPException(status_code=400, detail="Content-Type must be application/json, text/csv, text/plain or multipart/form-data")
+    
+    rows = [row for row in csv.reader(io.StringIO(raw.decode('utf-8-sig'))) if any(field.strip() for field in row)]
+    column = 0
+    if rows and 'mobile_number' in [field.strip().lower() for field in rows[0]]:
+        column = [field.strip().lower() for field in rows.pop(0)].index('mobile_number')
+    # Rows without a value in the mobile number column are skipped, like blank lines
+    return [row[column] for row in rows if column < len(row) and row[column].strip()]
+
+async def register_bulk_chunk(pool, chunk: List[str], header: str, hash_scheme: str, salt_length: int) -> List[dict]:
+    """
+    Register one chunk of validated, de-duplicated numbers: salts and hashes are
+    generated in one pass, COPYed into a transaction-scoped staging table and
+    merged into onboarding_mobile in one statement. Active registrations are left
+    untouched, like the single endpoint's 409.
+    """
+    # One random draw for the whole chunk, sliced into per-number hex salts
+    salt_chars = (salt_length // 2) * 2
+    random_hex = secrets.token_hex(salt_chars // 2 * len(chunk))
+    salts = [random_hex[i * salt_chars:(i + 1) * salt_chars] for i in range(len(chunk))]
+    key_ring = get_key_ring() if hash_scheme == 'hmac' else None
+    epoch = int(time.time())
+    hashes = [compute_onboarding_hash(hash_scheme, mobile_number, header, salt, epoch=epoch, key_ring=key_ring)
+              for mobile_number, salt in zip(chunk, salts)]
+    
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("""
+                CREATE TEMP TABLE onboarding_stage (
+                    mobile_number VARCHAR(15), salt VARCHAR(32), hash VARCHAR(64)
+                ) ON COMMIT DROP
+            """)
+            await conn.copy_records_to_table(
+                'onboarding_stage', records=list(zip(chunk, salts, hashes)),
+                columns=['mobile_number', 'salt', 'hash']
+            )
+            rows = await conn.fetch("""
+                INSERT INTO onboarding_mobile AS o (mobile_number, salt, hash, request_timestamp, is_active)
+                SELECT mobile_number, salt, hash, NOW(), true FROM onboarding_stage
+                ON CONFLICT (mobile_number) DO UPDATE
+                SET salt = EXCLUDED.salt, hash = EXCLUDED.hash,
+                    request_timestamp = EXCLUDED.request_timestamp, is_active = true
+                WHERE o.is_active = false
+                RETURNING o.mobile_number, o.request_timestamp, (o.xmax = 0) AS inserted
+            """)
+    
+    merged = {row['mobile_number']: row for row in rows}
+    results = []
+    for mobile_number, computed_hash in zip(chunk, hashes):
+        row = merged.get(mobile_number)
+        if row is None:
+            results.append({'mobile_number': mobile_number, 'status': 'already_active'})
+            continue
+        if SERVER_ROLE != 'ingest':  # see register_mobile
+            active_onboarding.update(mobile_number, row['request_timestamp'])
+        results.append({
+            'mobile_number': mobile_number,
+            'status': 'registered' if row['inserted'] else 'reactivated',
+            'hash': computed_hash,
+            'message': f"{header}:{computed_hash}",
+        })
+    return results
+
+@router.post("/onboarding/register/bulk")
+async def register_mobiles_bulk(request: Request):
+    """
+    Register many mobile numbers in one call (campaign pre-enrollment).
+    Streams NDJSON: one 'result' line per input number, in input order
+    (status registered, reactivated, already_active, invalid or duplicate; registered
+    and reactivated lines carry hash and the HEADER:hash message), then a 'summary' line.
+    """
+    await admit('onboarding')
+    numbers = [number.strip() for number in await read_bulk_mobile_numbers(request)]
+    if len(numbers) > BULK_ONBOARDING_MAX_NUMBERS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_ONBOARDING_MAX_NUMBERS} numbers per request")
+    
+    try:
+        pool = await get_db_pool()
+        permitted_headers_str, hash_scheme = await fetch_header_hash_settings(pool)
+        async with pool.acquire() as conn:
+            salt_length = int(await conn.fetchval(
+                "SELECT setting_value FROM system_settings WHERE setting_key = 'hash_salt_length'"
+            ))
+    except Exception as e:
+        logger.error(f"Error in register_mobiles_bulk: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    if not permitted_headers_str:
+        raise HTTPException(status_code=500, detail="No permitted headers configured in system settings")
+    if hash_scheme == 'hmac' and not get_key_ring().can_sign:
+        raise HTTPException(status_code=500, detail="No hash secret key configured (set HASH_SECRET_KEY or HASH_SECRET_KEYS)")
+    header = permitted_headers_str.split(',')[0].strip()
+    
+    async def generate():
+        started = time.monotonic()
+        counts: Dict[str, int] = {}
+        seen = set()
+        # Results in input order since the last flush; the chunk's entries are filled in on registration
+        pending: List[dict] = []
+        chunk: Dict[str, dict] = {}
+        
+        async def flush() -> str:
+            if chunk:
+                for result in await register_bulk_chunk(pool, list(chunk), header, hash_scheme, salt_length):
+                    chunk[result['mobile_number']].update(result)
+                chunk.clear()
+            for result in pending:
+                counts[result['status']] = counts.get(result['status'], 0) + 1
+            lines = ''.join(json.dumps({'type': 'result', **result}) + '\n' for result in pending)
+            pending.clear()
+            return lines
+        
+        try:
+            for mobile_number in numbers:
+                if not MOBILE_NUMBER_PATTERN.match(mobile_number):
+                    pending.append({'mobile_number': mobile_number, 'status': 'invalid'})
+                elif mobile_number in seen:
+                    pending.append({'mobile_number': mobile_number, 'status': 'duplicate'})
+                else:
+                    seen.add(mobile_number)
+                    chunk[mobile_number] = {'mobile_number': mobile_number}
+                    pending.append(chunk[mobile_number])
+                    if len(chunk) >= BULK_ONBOARDING_CHUNK_SIZE:
+                        yield await flush()
+            yield await flush()
+        except Exception as e:
+            logger.error(f"Error in register_mobiles_bulk: {e}")
+            yield json.dumps({'type': 'error', 'error': 'Internal server error'}) + '\n'
+        elapsed = time.monotonic() - started
+        logger.info(f"Bulk onboarding: {len(numbers)} numbers in {elapsed:.2f}s {counts}")
+        yield json.dumps({'type': 'summary', 'received': len(numbers), **counts, 'seconds': round(elapsed, 3)}) + '\n'
+    
+    return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+@router.get("/onboarding/status/{mobile_number}")
 async def get_onboarding_status(mobile_number: str):
     """
     Get onboarding status for a mobile number.
@@ -546,11 +1188,12 @@ async def get_onboarding_status(mobile_number: str):
         logger.error(f"Error in get_onboarding_status: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@app.delete("/onboarding/{mobile_number}")
+@router.delete("/onboarding/{mobile_number}")
 async def deactivate_mobile(mobile_number: str):
     """
     Deactivate a mobile number from onboarding system.
     """
+    await admit('onboarding')
     try:
         pool = await get_db_pool()
         
@@ -563,6 +1206,7 @@ async def deactivate_mobile(mobile_number: str):
             if result == "UPDATE 0":
                 raise HTTPException(status_code=404, detail="Mobile number not found")
         
+        active_onboarding.discard(mobile_number)
         return {"message": "Mobile number deactivated successfully"}
         
     except HTTPException:
@@ -571,17 +1215,291 @@ async def deactivate_mobile(mobile_number: str):
         logger.error(f"Error in deactivate_mobile: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@app.get("/health")
+@router.get("/results/{mobile_number}/events")
+async def result_events(mobile_number: str):
+    """
+    Server-Sent Events stream of validation results for SMS from this mobile number,
+    pushed as soon as each verdict is committed (see checks/result_feed.py).
+    """
+    if not MOBILE_NUMBER_PATTERN.match(mobile_number):
+        raise HTTPException(status_code=400, detail="Invalid mobile number format")
+    
+    async def generate():
+        with result_hub.subscribe(mobile_number) as queue:
+            yield ': subscribed\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), RESULT_FEED_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'  # keeps proxies from closing an idle stream
+                    continue
+                yield f"event: result\nid: {event['uuid']}\ndata: {json.dumps(event)}\n\n"
+    
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@router.websocket("/results/{mobile_number}/ws")
+async def result_websocket(websocket: WebSocket, mobile_number: str):
+    """WebSocket variant of the result feed: one JSON message per validation result."""
+    if not MOBILE_NUMBER_PATTERN.match(mobile_number):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    with result_hub.subscribe(mobile_number) as queue:
+        # Watch the client side so a closed socket unsubscribes without waiting for the next event
+        receive = asyncio.ensure_future(websocket.receive_text())
+        get = None
+        try:
+            while True:
+                get = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({receive, get}, return_when=asyncio.FIRST_COMPLETED)
+                if receive in done:
+                    if receive.exception() is not None:
+                        break  # disconnected
+                    receive = asyncio.ensure_future(websocket.receive_text())  # client messages are ignored
+                if get in done:
+                    await websocket.send_json(get.result())
+                else:
+                    get.cancel()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            receive.cancel()
+            if get is not None:
+                get.cancel()
+
+@router.get("/results/stats")
+async def result_feed_stats():
+    """Subscribers and published/delivered/dropped event counts of this process's result feed."""
+    return result_hub.stats()
+
+@router.get("/dead_letter")
+async def list_dead_letters(limit: int = 100, offset: int = 0, include_replayed: bool = False):
+    """
+    List messages in the dead letter queue, newest first.
+    """
+    try:
+        pool = await get_db_pool()
+        limit = max(1, min(limit, 1000))
+        
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT uuid, sender_number, sms_message, received_timestamp, error, failed_stage,
+                       retry_count, dead_lettered_at, replayed_at
+                FROM dead_letter_sms
+                WHERE $1 OR replayed_at IS NULL
+                ORDER BY dead_lettered_at DESC
+                LIMIT $2 OFFSET $3
+            """, include_replayed, limit, max(0, offset))
+            pending = await conn.fetchval("SELECT COUNT(*) FROM dead_letter_sms WHERE replayed_at IS NULL")
+        
+        return {
+            "pending": pending,
+            "messages": [dict(row, uuid=str(row['uuid'])) for row in rows]
+        }
+        
+    except Exception as e:
+        logger.error(f"Error in list_dead_letters: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+async def replay_dead_letter_messages(uuids: List[str]) -> List[str]:
+    """
+    Queue dead-lettered messages for the validator: the old verdict is taken out of the
+    rollup and the message is reset to 'pending', which the batch processor picks up
+    (see process_replay_queue). A dead-lettered message committed no count, so the
+    replay takes its blacklist count like a first attempt.
+    Returns the uuids queued.
+    """
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            replayed = await conn.fetch("""
+                UPDATE dead_letter_sms SET replayed_at = NOW()
+                WHERE uuid = ANY($1::uuid[]) AND replayed_at IS NULL
+                RETURNING uuid
+            """, uuids)
+            replay_uuids = [row['uuid'] for row in replayed]
+            await stats_rollup.retract(conn, replay_uuids)
+            await conn.execute("""
+                UPDATE sms_monitor
+                SET overall_status = 'pending', failed_at_check = NULL, processing_completed_at = NULL, retry_count = 0
+                WHERE uuid = ANY($1::uuid[])
+            """, replay_uuids)
+    return [str(replay_uuid) for replay_uuid in replay_uuids]
+
+@router.post("/dead_letter/{sms_uuid}/replay")
+async def replay_dead_letter(sms_uuid: str):
+    """
+    Queue a single dead-lettered message for replay by the validator.
+    """
+    try:
+        uuid.UUID(sms_uuid)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid uuid")
+    
+    try:
+        if not await replay_dead_letter_messages([sms_uuid]):
+            raise HTTPException(status_code=404, detail="Message not found in dead letter queue")
+        return {"uuid": sms_uuid, "overall_status": "pending"}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in replay_dead_letter: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.post("/dead_letter/replay")
+async def replay_all_dead_letters(limit: int = 100):
+    """
+    Queue the oldest pending dead-lettered messages (up to `limit`) for replay by the validator.
+    """
+    try:
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT uuid FROM dead_letter_sms WHERE replayed_at IS NULL
+                ORDER BY dead_lettered_at LIMIT $1
+            """, max(1, min(limit, 1000)))
+        
+        queued = await replay_dead_letter_messages([str(row['uuid']) for row in rows])
+        return {"replayed": len(queued), "results": {sms_uuid: "pending" for sms_uuid in queued}}
+        
+    except Exception as e:
+        logger.error(f"Error in replay_all_dead_letters: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/stats")
+async def validation_stats(granularity: str = 'hour', since: Optional[datetime] = None,
+                           until: Optional[datetime] = None, group_by: str = 'overall_status,failed_at_check,country_code',
+                           overall_status: Optional[str] = None, failed_at_check: Optional[str] = None,
+                           country_code: Optional[str] = None):
+    """
+    Time series of processed messages from the sms_stats_rollup counters.
+    Defaults to the last 24 hours (hour) or 60 minutes (minute), split by every dimension.
+    """
+    if granularity not in stats_rollup.GRANULARITIES:
+        raise HTTPException(status_code=400, detail="granularity must be minute or hour")
+    until = until or datetime.now(timezone.utc)
+    if until.tzinfo is None:
+        until = until.replace(tzinfo=timezone.utc)
+    since = since or until - stats_rollup.DEFAULT_WINDOW[granularity]
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    dimensions = [name.strip() for name in group_by.split(',') if name.strip()]
+    
+    try:
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            series = await stats_rollup.query_series(
+                conn, granularity, since, until, dimensions,
+                overall_status=overall_status, failed_at_check=failed_at_check, country_code=country_code
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in validation_stats: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    
+    return {
+        "granularity": granularity,
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "group_by": dimensions,
+        "series": series,
+    }
+
+@router.get("/export")
+async def export_results(source: str = 'monitor', format: str = 'ndjson', after: Optional[str] = None,
+                         since: Optional[datetime] = None, until: Optional[datetime] = None, limit: int = 0):
+    """
+    Stream validation results as NDJSON or CSV, in uuid order. Resume an
+    interrupted export by passing the last uuid received as `after`.
+    See checks/export.py for sources and paging.
+    """
+    if source not in EXPORT_SOURCES:
+        raise HTTPException(status_code=400, detail=f"source must be one of {', '.join(EXPORT_SOURCES)}")
+    if format not in ('ndjson', 'csv'):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    if after:
+        try:
+            uuid.UUID(after)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid uuid in after")
+    since = since.replace(tzinfo=timezone.utc) if since and since.tzinfo is None else since
+    until = until.replace(tzinfo=timezone.utc) if until and until.tzinfo is None else until
+    columns = EXPORT_SOURCES[source]['columns']
+    pool = await get_export_pool()
+    
+    async def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if format == 'csv':
+            writer.writerow(columns)
+        exported = 0
+        try:
+            async for rows in iter_export_chunks(pool, source, after, since, until, max(0, limit),
+                                                 EXPORT_PAGE_SIZE, EXPORT_FETCH_SIZE):
+                if format == 'csv':
+                    writer.writerows([export_value(row[column]) for column in columns] for row in rows)
+                else:
+                    for row in rows:
+                        buffer.write(json.dumps({column: export_value(row[column]) for column in columns}) + '\n')
+                exported += len(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        except Exception as e:
+            # Headers are already sent; the client sees a truncated stream and resumes from its last uuid
+            logger.error(f"Export of {source} failed after {exported} rows: {e}")
+            raise
+        if buffer.tell():
+            yield buffer.getvalue()  # CSV header of an empty export
+    
+    media_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(generate(), media_type=media_type)
+
+@router.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@router.get("/pool/stats")
+async def pool_stats():
+    """Size, utilization and acquire wait times of each database pool."""
+    return {"pools": pool_manager.stats()}
+
+@router.get("/admission/stats")
+async def admission_stats():
+    """Backlog, lag, in-flight requests and rejections seen by this process's admission control."""
+    return admission.stats()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return '\n'.join(pool_manager.prometheus_lines() + admission.prometheus_lines()) + '\n'
+
 # Import validation functions
+from checks.admission import admission
+from checks.batch_context import BatchContext, current_batch, current_overrides
+from checks.batch_row import BatchRow
+from checks.clock import Clock, system_clock
+from checks.db_pool import PoolManager
+from checks import stats_rollup
+from checks.export import EXPORT_SOURCES, export_value, iter_export_chunks
+from checks.result_feed import result_hub
+from checks.validation_plan import PipelineCompiler, ValidationPlan
 from checks.blacklist_check import validate_blacklist_check
-from checks.duplicate_check import validate_duplicate_check
+from checks.duplicate_check import (
+    validate_duplicate_check, validated_numbers, remember_validated_number, cache_validated_numbers
+)
 from checks.foreign_number_check import validate_foreign_number_check
-from checks.header_hash_check import validate_header_hash_check
+from checks.header_hash_check import validate_header_hash_check, fetch_header_hash_settings
 from checks.mobile_check import validate_mobile_check
 from checks.time_window_check import validate_time_window_check
+from checks.onboarding_cache import active_onboarding
+from checks.onboarding_hash import compute_onboarding_hash, get_key_ring
+from checks.mobile_utils import MOBILE_NUMBER_PATTERN, normalize_mobile_number
+
+pool_manager = PoolManager(POSTGRES_CONFIG)
 
 # Explicit function mapping dictionary to prevent code injection
 VALIDATION_FUNCTIONS = {
@@ -592,3 +1510,47 @@ VALIDATION_FUNCTIONS = {
     'mobile': validate_mobile_check,
     'time_window': validate_time_window_check
 }
+
+# Turns check_sequence / check_enabled / check_overrides into per-country plans. Checks that change
+# state when they run (blacklist takes a count_sms increment) declare it with a `side_effects`
+# attribute; undeclared checks are treated as side-effecting. They never run speculatively, and
+# their results are kept on the claim so retrying a message never repeats them; the state change
+# itself is written back with the verdicts in one transaction.
+pipeline_compiler = PipelineCompiler(VALIDATION_FUNCTIONS, CHECK_NAMES)
+
+def create_app() -> FastAPI:
+    """
+    Build the FastAPI application. Configures logging and registers the routes;
+    connections and warmups start in the startup event, in the background.
+    """
+    if SERVER_ROLE not in ('all', 'ingest', 'validator'):
+        raise RuntimeError(f"Unknown SMS_SERVER_ROLE {SERVER_ROLE!r}; expected all, ingest or validator")
+    # The batch pipeline follows one last_processed_uuid checkpoint, so it must run in exactly one process
+    if SERVER_ROLE != 'ingest' and int(os.getenv('WEB_CONCURRENCY') or 1) > 1:
+        raise RuntimeError(f"SMS_SERVER_ROLE={SERVER_ROLE} runs the batch processor and needs a single worker; "
+                           "use SMS_SERVER_ROLE=ingest for multi-worker HTTP serving")
+    configure_logging()
+    application = FastAPI()
+    application.include_router(router)
+    application.add_event_handler("startup", startup_event)
+    application.add_event_handler("shutdown", shutdown_event)
+    return application
+
+_app = None
+
+def __getattr__(name):
+    # `uvicorn sms_server:app` builds the application on first access, so a bare
+    # `import sms_server` (tools, benchmarks) has no side effects
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+if __name__ == '__main__':
+    # `python sms_server.py`: same as `uvicorn sms_server:app`, with the worker count
+    # taken from WEB_CONCURRENCY (ingest role only, see SERVER_ROLE above)
+    import uvicorn
+    uvicorn.run('sms_server:app', host='0.0.0.0', port=int(os.getenv('PORT', 8080)),
+                workers=int(os.getenv('WEB_CONCURRENCY') or 1))
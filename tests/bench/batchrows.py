@@ -0,0 +1,157 @@
+"""
+Per-batch CPU and memory of decoding input_sms rows for the batch pipeline.
+
+Compares the previous path (dict(record), str(uuid), a Pydantic model per row,
+checks probing fields with hasattr) with BatchRow.from_record and direct field
+reads. Records are stood in by dicts holding the same Python types asyncpg
+returns (uuid.UUID, aware datetime, str/None).
+
+Reported per batch size:
+- `us_per_batch`: decode plus the field reads the six checks make per message
+- `retained_bytes_per_row`: memory held by the decoded batch (tracemalloc)
+- `peak_bytes_per_row`: peak allocation while decoding
+
+The Pydantic path needs pydantic (installed with the server requirements); it
+is skipped when unavailable.
+
+Usage (from the repository root):
+    python -m tests.bench.batchrows --batch-sizes 20 500 5000 --repeat 200
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from checks.batch_row import BatchRow
+
+try:
+    from pydantic import BaseModel
+except ImportError:  # pragma: no cover - depends on the environment
+    BaseModel = None
+
+if BaseModel is not None:
+    class LegacyBatchSMSData(BaseModel):
+        """The Pydantic model batch rows used to be decoded into."""
+        uuid: str
+        sender_number: str
+        sms_message: str
+        received_timestamp: datetime
+        country_code: Optional[str] = None
+        local_mobile: Optional[str] = None
+
+
+def build_records(count: int):
+    now = datetime.now(timezone.utc)
+    return [{
+        'uuid': uuid.UUID(int=i + 1),
+        'sender_number': f"+91{9000000000 + i}",
+        'sms_message': f"ONBOARD:{i:064x}",
+        'received_timestamp': now - timedelta(seconds=i),
+        'country_code': '91',
+        'local_mobile': str(9000000000 + i),
+    } for i in range(count)]
+
+
+def legacy_decode(records):
+    batch = []
+    for record in records:
+        row_dict = dict(record)
+        row_dict['uuid'] = str(row_dict['uuid'])
+        batch.append(LegacyBatchSMSData(**row_dict))
+    return batch
+
+
+def legacy_reads(batch):
+    # The hasattr chains the checks used: blacklist, duplicate, foreign_number, header_hash, mobile, time_window
+    for sms in batch:
+        _ = sms.country_code if hasattr(sms, 'country_code') and sms.country_code else "91"
+        _ = sms.local_mobile if hasattr(sms, 'local_mobile') and sms.local_mobile else sms.sender_number
+        _ = sms.local_mobile if hasattr(sms, 'local_mobile') and sms.local_mobile else sms.sender_number
+        _ = sms.country_code if hasattr(sms, 'country_code') and sms.country_code else None
+        _ = sms.local_mobile if hasattr(sms, 'local_mobile') and sms.local_mobile else None
+        _ = sms.local_mobile if hasattr(sms, 'local_mobile') and sms.local_mobile else None
+        _ = sms.local_mobile if hasattr(sms, 'local_mobile') and sms.local_mobile else None
+        _ = sms.sms_message, sms.received_timestamp, sms.uuid
+
+
+def row_decode(records):
+    return [BatchRow.from_record(record) for record in records]
+
+
+def row_reads(batch):
+    for sms in batch:
+        _ = sms.country_code or "91"
+        _ = sms.local_mobile or sms.sender_number
+        _ = sms.local_mobile or sms.sender_number
+        _ = sms.country_code
+        _ = sms.local_mobile
+        _ = sms.local_mobile
+        _ = sms.local_mobile
+        _ = sms.sms_message, sms.received_timestamp, sms.uuid
+
+
+def measure(decode, reads, records, repeat: int) -> dict:
+    decode(records)  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        reads(decode(records))
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    batch = decode(records)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del batch
+    return {
+        'us_per_batch': round(elapsed / repeat * 1e6, 1),
+        'us_per_row': round(elapsed / repeat / len(records) * 1e6, 3),
+        'retained_bytes_per_row': round(retained / len(records), 1),
+        'peak_bytes_per_row': round(peak / len(records), 1),
+    }
+
+
+def run(batch_sizes, repeat: int) -> dict:
+    paths = {'batch_row': (row_decode, row_reads)}
+    if BaseModel is not None:
+        paths = {'pydantic': (legacy_decode, legacy_reads), **paths}
+    results = {}
+    for size in batch_sizes:
+        records = build_records(size)
+        results[str(size)] = {name: measure(decode, reads, records, repeat)
+                              for name, (decode, reads) in paths.items()}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch row decode benchmark")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[20, 500, 5000])
+    parser.add_argument('--repeat', type=int, default=200, help="Batches decoded per measurement")
+    parser.add_argument('--json', action='store_true', help="Emit machine-readable JSON")
+    args = parser.parse_args(argv)
+
+    results = run(args.batch_sizes, args.repeat)
+    if BaseModel is None:
+        sys.stderr.write("pydantic not installed: only the BatchRow path was measured\n")
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return
+
+    print(f"{'batch':>7}  {'path':<10}{'us/batch':>12}{'us/row':>10}{'retained B/row':>16}{'peak B/row':>12}")
+    for size, paths in results.items():
+        for name, r in paths.items():
+            print(f"{size:>7}  {name:<10}{r['us_per_batch']:>12}{r['us_per_row']:>10}"
+                  f"{r['retained_bytes_per_row']:>16}{r['peak_bytes_per_row']:>12}")
+
+
+if __name__ == '__main__':
+    main()
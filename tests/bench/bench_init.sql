@@ -0,0 +1,6 @@
+-- Benchmark-only additions on top of schema.sql
+CREATE EXTENSION IF NOT EXISTS pg_stat_statements;
+
+INSERT INTO system_settings (setting_key, setting_value)
+VALUES ('permitted_headers', 'ONBOARD'), ('batch_timeout', '2.0')
+ON CONFLICT (setting_key) DO NOTHING;
@@ -0,0 +1,134 @@
+"""
+Cold-start benchmark for the SMS server.
+
+Starts `uvicorn sms_server:app` as a fresh process, repeatedly, and measures
+from process spawn to:
+
+- `import`: `import sms_server` plus `create_app()` (measured in a separate interpreter)
+- `listening`: first answer from GET /health
+- `first_sms`: first 200 from POST /sms/receive, i.e. the first SMS actually stored
+
+`first_sms` is what matters for pod scale-out and restarts: the gap to
+`listening` is time spent opening the database pool and anything else the
+first request has to wait for.
+
+Usage (from the repository root, with the stand-in Postgres and Redis from
+tests/bench/docker-compose.yml running; stop its sms_server service first):
+    POSTGRES_HOST=localhost POSTGRES_PORT=5432 POSTGRES_USER=sms_user POSTGRES_PASSWORD=bench \\
+        python -m tests.bench.coldstart --runs 5 --role ingest
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from .common import summarize
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+IMPORT_PROBE = (
+    "import time; started = time.perf_counter(); "
+    "import sms_server; sms_server.create_app(); "
+    "print(time.perf_counter() - started)"
+)
+
+
+def measure_import(env) -> float:
+    """Seconds to import sms_server and build the app in a fresh interpreter."""
+    output = subprocess.run([sys.executable, '-c', IMPORT_PROBE], cwd=REPO_ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def wait_until(probe, process, deadline: float, interval: float) -> float:
+    """Call probe() until it returns True; return the monotonic time it first did."""
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"sms_server exited with code {process.returncode} during startup")
+        if probe():
+            return time.monotonic()
+        time.sleep(interval)
+    raise TimeoutError("sms_server did not become ready in time")
+
+
+def measure_start(args, env) -> dict:
+    """Spawn one server process; return seconds to listening and to the first stored SMS."""
+    client = httpx.Client(base_url=f"http://127.0.0.1:{args.port}", timeout=args.request_timeout)
+    payload = {
+        'sender_number': args.sender,
+        'sms_message': 'COLDSTART benchmark',
+        'received_timestamp': datetime.now(timezone.utc).isoformat(),
+    }
+
+    def listening():
+        try:
+            client.get('/health')
+            return True
+        except httpx.HTTPError:
+            return False
+
+    def accepted():
+        try:
+            return client.post('/sms/receive', json=payload).status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'sms_server:app', '--host', '127.0.0.1', '--port', str(args.port)],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = started + args.timeout
+        listening_at = wait_until(listening, process, deadline, args.poll_interval)
+        first_sms_at = wait_until(accepted, process, deadline, args.poll_interval)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        client.close()
+    return {'listening': listening_at - started, 'first_sms': first_sms_at - started}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SMS server cold-start benchmark")
+    parser.add_argument('--runs', type=int, default=5, help="Server starts to measure")
+    parser.add_argument('--port', type=int, default=18080, help="Port for the spawned server")
+    parser.add_argument('--role', choices=['all', 'ingest', 'validator'], default='ingest',
+                        help="SMS_SERVER_ROLE of the spawned server")
+    parser.add_argument('--sender', default='+919000000000', help="Sender number of the probe SMS")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Seconds allowed per start")
+    parser.add_argument('--poll-interval', type=float, default=0.01, help="Seconds between readiness probes")
+    parser.add_argument('--request-timeout', type=float, default=5.0, help="HTTP timeout in seconds")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, SMS_SERVER_ROLE=args.role, WEB_CONCURRENCY='1')
+    env.setdefault('LOG_DIR', '/tmp/sms_logs')
+
+    imports, listening, first_sms = [], [], []
+    for _ in range(args.runs):
+        imports.append(measure_import(env))
+        result = measure_start(args, env)
+        listening.append(result['listening'])
+        first_sms.append(result['first_sms'])
+
+    report = {
+        'config': vars(args),
+        'import': summarize(imports),
+        'listening': summarize(listening),
+        'first_sms': summarize(first_sms),
+    }
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Shared helpers for the SMS Bridge benchmark harness: CSV sources, synthetic
+sender mixes and latency summaries.
+"""
+import csv
+import math
+import random
+from datetime import datetime, timezone
+
+REQUIRED_COLUMNS = ['sender_number', 'sms_message', 'received_timestamp']
+
+
+def read_sms_rows(path: str):
+    """
+    Yield SMS rows from a CSV file in the tests/sample_sms_data.csv format.
+    Rows are streamed, so arbitrarily large captures can be used.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        missing = [col for col in REQUIRED_COLUMNS if col not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"{path} is missing required columns: {', '.join(missing)}")
+        for row in reader:
+            yield {col: row[col] for col in REQUIRED_COLUMNS}
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse an ISO timestamp (with or without trailing Z) into an aware datetime."""
+    value = value.strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+class SenderMix:
+    """
+    Deterministic sender-cardinality mix.
+
+    `senders` distinct synthetic numbers share the traffic; `hot_senders` of
+    them receive `hot_fraction` of all messages, which reproduces the
+    flood/spam pattern that stresses the blacklist counters.
+    """
+
+    def __init__(self, senders: int, hot_senders: int = 0, hot_fraction: float = 0.0,
+                 country_code: str = "91", seed: int = 42):
+        if senders < 1:
+            raise ValueError("senders must be >= 1")
+        self.rng = random.Random(seed)
+        self.country_code = country_code
+        self.numbers = [f"+{country_code}{9000000000 + i}" for i in range(senders)]
+        self.hot = self.numbers[:max(0, min(hot_senders, senders))]
+        self.cold = self.numbers[len(self.hot):] or self.numbers
+        self.hot_fraction = hot_fraction if self.hot else 0.0
+
+    def local_number(self, number: str) -> str:
+        """Strip the +<country_code> prefix from a generated number."""
+        return number[len(self.country_code) + 1:]
+
+    def next_sender(self) -> str:
+        if self.hot_fraction and self.rng.random() < self.hot_fraction:
+            return self.rng.choice(self.hot)
+        return self.rng.choice(self.cold)
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float('nan')
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(values, unit: str = 'ms', scale: float = 1000.0) -> dict:
+    """Summarize latencies given in seconds as p50/p90/p99/max in `unit`."""
+    ordered = sorted(values)
+    return {
+        'count': len(ordered),
+        f'p50_{unit}': round(percentile(ordered, 50) * scale, 3) if ordered else None,
+        f'p90_{unit}': round(percentile(ordered, 90) * scale, 3) if ordered else None,
+        f'p99_{unit}': round(percentile(ordered, 99) * scale, 3) if ordered else None,
+        f'max_{unit}': round(ordered[-1] * scale, 3) if ordered else None,
+    }
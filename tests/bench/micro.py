@@ -0,0 +1,166 @@
+"""
+Micro-benchmarks for mobile number normalization and each validation check.
+
+Runs every check against the in-memory stand-ins so the numbers reflect the
+per-message Python cost and the number of database/Redis round-trips, not
+network latency.
+
+Usage (from the repository root):
+    python -m tests.bench.micro --iterations 20000
+    python -m tests.bench.micro --json > bench_output.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from .standins import InMemoryDatabase, InMemoryPool, InMemoryRedis
+
+ONBOARDED_MOBILE = "9699511296"
+SALT = "0123456789abcdef"
+# Messages from a single sender validated per flood_batch op
+FLOOD_BATCH_SIZE = 20
+
+
+def build_fixture():
+    """In-memory database with one onboarded sender and a matching SMS."""
+    db = InMemoryDatabase()
+    header = db.settings['permitted_headers'].split(',')[0].strip()
+    onboarding_hash = hashlib.sha256(f"{header}{ONBOARDED_MOBILE}{SALT}".encode('utf-8')).hexdigest()
+    now = datetime.now(timezone.utc)
+    db.add_onboarding(ONBOARDED_MOBILE, onboarding_hash, SALT, request_timestamp=now - timedelta(minutes=5))
+    # Keep the counter far below the threshold for the whole run
+    db.settings['blacklist_threshold'] = str(10 ** 9)
+    sms = SimpleNamespace(
+        uuid="00000000-0000-0000-0000-000000000001",
+        sender_number=f"+91{ONBOARDED_MOBILE}",
+        sms_message=f"{header}:{onboarding_hash}",
+        received_timestamp=now,
+        country_code="91",
+        local_mobile=ONBOARDED_MOBILE,
+    )
+    return db, sms
+
+
+def build_hmac_fixture():
+    """Same sender, but onboarded with the stateless 'hmac' hash scheme."""
+    from checks.onboarding_hash import KeyRing, issue_onboarding_hash
+    import checks.onboarding_hash as onboarding_hash
+
+    db, sms = build_fixture()
+    db.settings['hash_scheme'] = 'hmac'
+    onboarding_hash._key_ring = KeyRing({1: b'benchmark-secret'})
+    header = db.settings['permitted_headers'].split(',')[0].strip()
+    request_timestamp = db.onboarding[ONBOARDED_MOBILE]['request_timestamp']
+    token = issue_onboarding_hash(ONBOARDED_MOBILE, header, epoch=int(request_timestamp.timestamp()))
+    db.onboarding[ONBOARDED_MOBILE]['hash'] = token
+    sms.sms_message = f"{header}:{token}"
+    return db, sms
+
+
+async def validate_flood_batch(messages, pool, check_funcs, batched: bool):
+    """Run every check over a batch from one sender, with or without a BatchContext."""
+    from checks.batch_context import BatchContext, current_batch
+
+    token = None
+    if batched:
+        batch = BatchContext(pool)
+        await batch.prefetch(messages)
+        token = current_batch.set(batch)
+    try:
+        for message in messages:
+            for check in check_funcs:
+                if await check(message, pool) == 2:
+                    break
+    finally:
+        if token is not None:
+            current_batch.reset(token)
+
+
+async def time_coroutine(make_call, iterations: int, db: InMemoryDatabase, redis_standin: InMemoryRedis):
+    """Await make_call() `iterations` times; return timing and round-trip counts."""
+    await make_call()  # warm caches and imports
+    queries_before = db.query_count
+    redis_before = redis_standin.command_count
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await make_call()
+    elapsed = time.perf_counter() - start
+    return {
+        'iterations': iterations,
+        'us_per_op': round(elapsed / iterations * 1e6, 3),
+        'ops_per_sec': round(iterations / elapsed, 1) if elapsed else None,
+        'db_queries_per_op': round((db.query_count - queries_before) / iterations, 3),
+        'redis_commands_per_op': round((redis_standin.command_count - redis_before) / iterations, 3),
+    }
+
+
+async def run_benchmarks(iterations: int, only=None):
+    from checks import duplicate_check
+    from checks.mobile_utils import normalize_mobile_number
+    from checks.blacklist_check import validate_blacklist_check
+    from checks.duplicate_check import validate_duplicate_check
+    from checks.foreign_number_check import validate_foreign_number_check
+    from checks.header_hash_check import validate_header_hash_check
+    from checks.mobile_check import validate_mobile_check
+    from checks.time_window_check import validate_time_window_check
+
+    db, sms = build_fixture()
+    pool = InMemoryPool(db)
+    hmac_db, hmac_sms = build_hmac_fixture()
+    hmac_pool = InMemoryPool(hmac_db)
+    redis_standin = InMemoryRedis()
+    duplicate_check.redis_client = redis_standin
+    all_checks = [validate_blacklist_check, validate_duplicate_check, validate_foreign_number_check,
+                  validate_header_hash_check, validate_mobile_check, validate_time_window_check]
+    flood = [SimpleNamespace(**{**vars(sms), 'uuid': f"00000000-0000-0000-0001-{i:012d}"})
+             for i in range(FLOOD_BATCH_SIZE)]
+
+    cases = {
+        'normalize_mobile_number': lambda: normalize_mobile_number(sms.sender_number, pool),
+        'blacklist_check': lambda: validate_blacklist_check(sms, pool),
+        'duplicate_check': lambda: validate_duplicate_check(sms, pool),
+        'foreign_number_check': lambda: validate_foreign_number_check(sms, pool),
+        'header_hash_check': lambda: validate_header_hash_check(sms, pool),
+        'header_hash_check_hmac': lambda: validate_header_hash_check(hmac_sms, hmac_pool),
+        'mobile_check': lambda: validate_mobile_check(sms, pool),
+        'time_window_check': lambda: validate_time_window_check(sms, pool),
+        f'flood_batch_{FLOOD_BATCH_SIZE}_sequential': lambda: validate_flood_batch(flood, pool, all_checks, False),
+        f'flood_batch_{FLOOD_BATCH_SIZE}_batched': lambda: validate_flood_batch(flood, pool, all_checks, True),
+    }
+
+    results = {}
+    for name, make_call in cases.items():
+        if only and name not in only:
+            continue
+        case_db = hmac_db if name.endswith('_hmac') else db
+        results[name] = await time_coroutine(make_call, iterations, case_db, redis_standin)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SMS Bridge check micro-benchmarks")
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--only', nargs='*', help="Run only the named benchmarks")
+    parser.add_argument('--json', action='store_true', help="Emit machine-readable JSON")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run_benchmarks(args.iterations, args.only))
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return
+
+    print(f"{'benchmark':<30}{'us/op':>10}{'ops/s':>12}{'db q/op':>10}{'redis/op':>10}")
+    for name, r in results.items():
+        print(f"{name:<30}{r['us_per_op']:>10}{r['ops_per_sec']:>12}"
+              f"{r['db_queries_per_op']:>10}{r['redis_commands_per_op']:>10}")
+
+
+if __name__ == '__main__':
+    main()
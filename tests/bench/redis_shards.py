@@ -0,0 +1,158 @@
+"""
+Multi-node check of the sharded Redis layer (checks/redis_store.py).
+
+Caches `--numbers` validated numbers through checks.duplicate_check exactly as
+the bridge does (pipelined cache_validated_numbers, then per-number exists
+lookups) on a ShardedRedis over several nodes, and reports:
+
+- correctness: every cached number is found, and numbers never cached are not
+- spread: keys per node (min/max and the max/mean ratio)
+- rebalancing: share of keys that move to another node when one node is added
+- result feed: an event published through checks.result_feed arrives on the
+  pub/sub node (`redis_store.pubsub_node`) and nowhere else
+
+By default the nodes are in-memory stand-ins (standins.InMemoryRedis). Pass
+`--nodes` to run against real instances, e.g. the `redis-shard-*` services of
+docker-compose.yml (`docker compose -f tests/bench/docker-compose.yml --profile shards up -d`):
+    python -m tests.bench.redis_shards --nodes localhost:6381,localhost:6382,localhost:6383
+Pass `--cluster` with any seed node to run the same checks on a Redis Cluster
+(REDIS_CLUSTER=true); spread is then reported per cluster node and
+rebalancing is left to slot migration:
+    python -m tests.bench.redis_shards --cluster localhost:7000
+
+Exits non-zero if a correctness check fails.
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timezone
+
+from .standins import InMemoryRedis
+
+
+def build_nodes(args):
+    from checks.redis_store import parse_nodes
+    if args.nodes:
+        import redis
+        addresses = parse_nodes(args.nodes)
+        nodes = [redis.StrictRedis(host=host, port=port) for host, port in addresses]
+        names = [f"{host}:{port}" for host, port in addresses]
+    else:
+        nodes = [InMemoryRedis() for _ in range(args.shards)]
+        names = [f"standin-{i}:6379" for i in range(args.shards)]
+    return nodes, names
+
+
+def check_result_feed(client, nodes) -> bool:
+    """Publish one event through the result hub and confirm it reaches the pub/sub node."""
+    from checks.redis_store import pubsub_node
+    from checks.result_feed import RESULT_CHANNEL, result_hub
+
+    event = {'uuid': 'redis-shards-probe', 'local_mobile': '9000000000', 'overall_status': 'valid'}
+    if nodes is not None and isinstance(nodes[0], InMemoryRedis):
+        before = [len(node.published) for node in nodes]
+        result_hub.publish([event])
+        published = [len(node.published) - count for node, count in zip(nodes, before)]
+        return published[0] == 1 and sum(published[1:]) == 0
+
+    pubsub = pubsub_node(client).pubsub(ignore_subscribe_messages=True)
+    try:
+        pubsub.subscribe(RESULT_CHANNEL)
+        pubsub.get_message(timeout=1.0)  # subscription confirmation
+        result_hub.publish([event])
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=1.0)
+            if message is not None and json.loads(message['data'])['event'] == event:
+                return True
+        return False
+    finally:
+        pubsub.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded Redis layer check")
+    parser.add_argument('--numbers', type=int, default=100000, help="Validated numbers to cache")
+    parser.add_argument('--shards', type=int, default=4, help="In-memory nodes (without --nodes)")
+    parser.add_argument('--nodes', help="Comma-separated host:port list of real Redis instances")
+    parser.add_argument('--cluster', help="host:port of any Redis Cluster node")
+    args = parser.parse_args(argv)
+
+    from checks import duplicate_check
+    from checks.redis_store import HashRing, ShardedRedis, parse_nodes
+
+    if args.cluster:
+        from redis.cluster import RedisCluster
+        host, port = parse_nodes(args.cluster)[0]
+        client = RedisCluster(host=host, port=port)
+        nodes = sharded = None
+    else:
+        nodes, names = build_nodes(args)
+        client = sharded = ShardedRedis(nodes, names)
+    duplicate_check.redis_client = client
+
+    now = datetime.now(timezone.utc)
+    numbers = [str(9000000000 + i) for i in range(args.numbers)]
+    started = time.perf_counter()
+    written = duplicate_check.cache_validated_numbers(((number, now) for number in numbers), now)
+    write_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    found = sum(1 for number in numbers
+                if duplicate_check.get_redis_client().exists(duplicate_check.OUT_SMS_KEY_PREFIX + number))
+    absent = [str(8000000000 + i) for i in range(min(args.numbers, 10000))]
+    false_hits = sum(1 for number in absent
+                     if duplicate_check.get_redis_client().exists(duplicate_check.OUT_SMS_KEY_PREFIX + number))
+    read_seconds = time.perf_counter() - started
+
+    keys = [duplicate_check.OUT_SMS_KEY_PREFIX + number for number in numbers]
+    if args.cluster:
+        by_node = {}
+        for key in keys:
+            name = client.get_node_from_key(key).name
+            by_node[name] = by_node.get(name, 0) + 1
+        per_node = list(by_node.values())
+    else:
+        per_node = [0] * len(nodes)
+        for key in keys:
+            per_node[sharded.ring.node_for(key)] += 1
+    mean = len(keys) / len(per_node)
+
+    feed_ok = check_result_feed(client, nodes)
+
+    report = {
+        'nodes': len(per_node),
+        'numbers': args.numbers,
+        'written': written,
+        'found': found,
+        'false_hits': false_hits,
+        'keys_per_node': per_node,
+        'max_over_mean': round(max(per_node) / mean, 3),
+        'min_over_mean': round(min(per_node) / mean, 3),
+        'result_feed': feed_ok,
+        'write_seconds': round(write_seconds, 3),
+        'read_seconds': round(read_seconds, 3),
+    }
+    if not args.cluster:
+        grown = HashRing(names + [f"added-node:{len(names)}"])
+        moved = sum(1 for key in keys if grown.node_for(key) != sharded.ring.node_for(key))
+        report['moved_on_add'] = round(moved / len(keys), 4)
+        report['ideal_moved_on_add'] = round(1 / (len(nodes) + 1), 4)
+
+    if args.nodes or args.cluster:
+        for start in range(0, len(keys), 1000):
+            client.delete(*keys[start:start + 1000])
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+    ok = written == args.numbers and found == args.numbers and false_hits == 0
+    if not ok:
+        sys.stderr.write("sharded Redis layer returned wrong membership results\n")
+    if not feed_ok:
+        sys.stderr.write("result feed event did not arrive on the pub/sub node\n")
+    return 0 if ok and feed_ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
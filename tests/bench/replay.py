@@ -0,0 +1,227 @@
+"""
+Timestamp-ordered replay that preserves the original inter-arrival timing.
+
+Rows from a capture (sample_sms_data.csv format) are sent to POST /sms/receive
+at their original offsets from the first row, divided by a speed factor
+(1x, 10x, 100x ...). Sends are driven by a hashed timer wheel on the asyncio
+loop, and the lag between each row's scheduled and actual send time is
+recorded, so batching behaviour (batch_timeout, blacklist counters) can be
+studied under realistic bursts.
+
+Usage (from the repository root):
+    python -m tests.bench.replay --csv capture.csv --url http://localhost:8080 --speed 10
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import math
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from .common import parse_timestamp, read_sms_rows, summarize
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel driven by a single ticker coroutine.
+
+    Timers are bucketed into `slots` buckets of `tick` seconds each; a timer
+    further away than one revolution stays in its bucket until its absolute
+    tick comes round. Scheduling and expiry are O(1) per timer.
+    """
+
+    def __init__(self, tick: float = 0.005, slots: int = 1024):
+        self.tick = tick
+        self.slots = slots
+        self.buckets = [[] for _ in range(slots)]
+        self.pending = 0
+        self.loop = None
+        self.origin = None
+        self.current_tick = 0
+        self._wakeup = None
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.origin = self.loop.time()
+        self._wakeup = asyncio.Event()
+
+    def _tick_for(self, deadline: float) -> int:
+        return max(self.current_tick, math.ceil((deadline - self.origin) / self.tick))
+
+    def schedule(self, deadline: float, callback, *args):
+        """Run callback(*args, scheduled_at) at loop time `deadline` (rounded up to the tick)."""
+        if self.pending == 0:
+            # Skip the ticks that elapsed while the wheel was idle
+            self.current_tick = max(self.current_tick, int((self.loop.time() - self.origin) / self.tick))
+        target = self._tick_for(deadline)
+        self.buckets[target % self.slots].append((target, deadline, callback, args))
+        self.pending += 1
+        self._wakeup.set()
+
+    @property
+    def horizon(self) -> float:
+        """Loop time up to which timers can be scheduled without a second revolution."""
+        # current_tick stands still while the wheel is idle, so measure from the loop clock too
+        now_tick = int((self.loop.time() - self.origin) / self.tick)
+        return self.origin + (max(self.current_tick, now_tick) + self.slots) * self.tick
+
+    async def run(self, stop: asyncio.Event):
+        while not (stop.is_set() and self.pending == 0):
+            if self.pending == 0:
+                self._wakeup.clear()
+                waiter = asyncio.ensure_future(self._wakeup.wait())
+                stopper = asyncio.ensure_future(stop.wait())
+                await asyncio.wait({waiter, stopper}, return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                stopper.cancel()
+                continue
+
+            next_boundary = self.origin + (self.current_tick + 1) * self.tick
+            delay = next_boundary - self.loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            now_tick = int((self.loop.time() - self.origin) / self.tick)
+            while self.current_tick <= now_tick:
+                bucket = self.buckets[self.current_tick % self.slots]
+                if bucket:
+                    keep = []
+                    for entry in bucket:
+                        target, deadline, callback, args = entry
+                        if target <= self.current_tick:
+                            self.pending -= 1
+                            callback(*args, deadline)
+                        else:
+                            keep.append(entry)
+                    self.buckets[self.current_tick % self.slots] = keep
+                self.current_tick += 1
+
+
+def ordered_rows(rows, reorder_window: int):
+    """
+    Yield rows ordered by received_timestamp using a bounded heap, so captures
+    that are only approximately sorted can be streamed without a full sort.
+    """
+    heap = []
+    for seq, row in enumerate(rows):
+        heapq.heappush(heap, (parse_timestamp(row['received_timestamp']), seq, row))
+        if len(heap) > reorder_window:
+            yield heapq.heappop(heap)
+    while heap:
+        yield heapq.heappop(heap)
+
+
+class ReplayStats:
+    def __init__(self):
+        self.lags = []
+        self.latencies = []
+        self.status_counts = {}
+        self.errors = 0
+
+
+async def replay(args):
+    stats = ReplayStats()
+    wheel = TimerWheel(tick=args.tick)
+    stop = asyncio.Event()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    in_flight = set()
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+
+        async def send(payload, scheduled_at):
+            async with semaphore:
+                started = wheel.loop.time()
+                stats.lags.append(started - scheduled_at)
+                try:
+                    response = await client.post('/sms/receive', json=payload)
+                    stats.latencies.append(wheel.loop.time() - started)
+                    stats.status_counts[response.status_code] = stats.status_counts.get(response.status_code, 0) + 1
+                except httpx.HTTPError:
+                    stats.errors += 1
+
+        def fire(payload, scheduled_at):
+            task = asyncio.create_task(send(payload, scheduled_at))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        wheel.start()
+        ticker = asyncio.create_task(wheel.run(stop))
+        run_start_wall = datetime.now(timezone.utc)
+        first_ts = None
+        scheduled = 0
+
+        for original_ts, _, row in ordered_rows(read_sms_rows(args.csv), args.reorder_window):
+            if first_ts is None:
+                first_ts = original_ts
+            offset = (original_ts - first_ts).total_seconds() / args.speed
+            deadline = wheel.origin + offset
+
+            # Only keep one wheel revolution of timers outstanding
+            while deadline >= wheel.horizon:
+                await asyncio.sleep(wheel.tick * wheel.slots / 4)
+
+            if args.timestamps == 'shifted':
+                sent_ts = datetime.fromtimestamp(run_start_wall.timestamp() + offset, tz=timezone.utc)
+            else:
+                sent_ts = original_ts
+            payload = {
+                'sender_number': row['sender_number'],
+                'sms_message': row['sms_message'],
+                'received_timestamp': sent_ts.isoformat(),
+            }
+            wheel.schedule(deadline, fire, payload)
+            scheduled += 1
+            if args.limit and scheduled >= args.limit:
+                break
+
+        stop.set()
+        await ticker
+        if in_flight:
+            await asyncio.gather(*in_flight)
+        elapsed = wheel.loop.time() - wheel.origin
+
+    accepted = stats.status_counts.get(200, 0)
+    return {
+        'config': vars(args),
+        'scheduled': scheduled,
+        'accepted': accepted,
+        'status_counts': {str(k): v for k, v in sorted(stats.status_counts.items())},
+        'transport_errors': stats.errors,
+        'seconds': round(elapsed, 3),
+        'throughput_per_sec': round(accepted / elapsed, 1) if elapsed else None,
+        'schedule_lag': summarize(stats.lags),
+        'http_latency': summarize(stats.latencies),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay an SMS capture preserving inter-arrival times")
+    parser.add_argument('--csv', required=True, help="Capture in sample_sms_data.csv format")
+    parser.add_argument('--url', default='http://localhost:8080', help="SMS Bridge base URL")
+    parser.add_argument('--speed', type=float, default=1.0, help="Time compression factor (10 = ten times faster)")
+    parser.add_argument('--timestamps', choices=['shifted', 'original'], default='shifted',
+                        help="Send received_timestamp shifted to the replay clock or as captured")
+    parser.add_argument('--concurrency', type=int, default=64, help="Maximum in-flight requests")
+    parser.add_argument('--tick', type=float, default=0.005, help="Timer wheel resolution in seconds")
+    parser.add_argument('--reorder-window', type=int, default=10000,
+                        help="Rows buffered to fix up slightly out-of-order captures")
+    parser.add_argument('--limit', type=int, default=0, help="Stop after this many rows (0 = all)")
+    parser.add_argument('--timeout', type=float, default=10.0, help="HTTP timeout in seconds")
+    args = parser.parse_args(argv)
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+
+    started = time.perf_counter()
+    report = asyncio.run(replay(args))
+    report['wall_seconds'] = round(time.perf_counter() - started, 3)
+    json.dump(report, sys.stdout, indent=2, default=str)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
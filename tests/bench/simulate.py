@@ -0,0 +1,445 @@
+"""
+Deterministic simulation of the batch processor in virtual time.
+
+Runs the real `sms_server.batch_processor` on an event loop whose clock jumps
+straight to the next timer whenever every task is waiting. Everything below the
+processor is real too: claim, prefetch, checks and write-back. Postgres and
+Redis are in-memory stand-ins. A synthetic arrival trace inserts messages into
+input_sms at their virtual arrival times. A batching policy (batch_size,
+batch_timeout, poll interval) that would take hours of wall time to observe
+therefore runs in seconds, and the same trace and seed always give the same
+numbers.
+
+Each database call costs `--db-latency-ms` of virtual time; Python CPU time is
+not simulated. Every sender is onboarded with a valid hash and the time window
+covers the whole trace, so messages run the full check sequence (repeat senders
+still fail the duplicate check). Reported per policy:
+- `queue_delay`: arrival -> batch claimed (time spent waiting in input_sms)
+- `latency`: arrival -> verdict written
+- `batch_fill`: batches run and mean messages per batch relative to batch_size
+- `db_calls_per_message`: every stand-in query, polls included, per message
+- `polls`: input_sms reads; `clock_sleeps`: waits through the processor clock
+
+Traces: `steady` (fixed spacing), `poisson` (exponential gaps) and `burst`
+(`--burst-size` messages at once, bursts at Poisson times), all at `--rate`
+messages/s for `--duration` seconds; or `--csv` to use the received_timestamp
+gaps of a capture (sample_sms_data.csv format) divided by `--speed`.
+
+Usage (from the repository root):
+    python -m tests.bench.simulate --trace poisson --rate 20 --duration 600 \\
+        --batch-sizes 20 100 --timeouts 0.5 2 5
+    python -m tests.bench.simulate --csv capture.csv --speed 10 --batch-sizes 50 --timeouts 1 --json
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import random
+import selectors
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+from checks.clock import Clock
+
+from .common import SenderMix, parse_timestamp, read_sms_rows, summarize
+from .standins import InMemoryConnection, InMemoryDatabase, InMemoryRedis, _normalize
+
+SALT = "0123456789abcdef"
+FINAL_STATUSES = ('valid', 'invalid', 'dead_letter')
+CHECK_COLUMNS = ('blacklist_check', 'duplicate_check', 'foreign_number_check', 'header_hash_check',
+                 'mobile_check', 'time_window_check')
+# Virtual seconds the processor may take to drain the queue after the last arrival
+DRAIN_LIMIT = 3600.0
+
+
+class VirtualClock(Clock):
+    """
+    Clock of the simulation loop. Sleeping is a plain asyncio.sleep: the loop
+    moves `seconds` forward to the next timer instead of waiting for it.
+    """
+
+    def __init__(self, start: datetime):
+        self.start = start
+        self.seconds = 0.0
+        self.sleeps = 0
+
+    def monotonic(self) -> float:
+        return self.seconds
+
+    def wall(self) -> datetime:
+        """Virtual UTC time, for timestamps written by the simulation."""
+        return self.start + timedelta(seconds=self.seconds)
+
+    async def sleep(self, seconds: float):
+        self.sleeps += 1
+        await asyncio.sleep(seconds)
+
+
+class _AdvancingSelector(selectors.DefaultSelector):
+    """Selector that advances the virtual clock by the timeout instead of blocking."""
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError("simulation stalled: no task is runnable and no timer is pending")
+        if timeout > 0:
+            self.clock.seconds += timeout
+        return super().select(0)
+
+
+class SimulationLoop(asyncio.SelectorEventLoop):
+    """Event loop whose time() is the virtual clock."""
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        super().__init__(selector=_AdvancingSelector(clock))
+
+    def time(self) -> float:
+        return self.clock.seconds
+
+
+class SimulationDatabase(InMemoryDatabase):
+    """
+    The check stand-in plus the input_sms, sms_monitor and out_sms queries the
+    batch processor issues, recording when each message was claimed and finished.
+    """
+
+    def __init__(self, clock: VirtualClock, expected: int, settings: dict = None):
+        super().__init__(settings)
+        self.clock = clock
+        self.expected = expected
+        self.input_keys = []   # uuid.UUID, ascending
+        self.input_rows = []
+        self.monitor = {}      # uuid str -> sms_monitor row
+        self.arrived = {}      # uuid str -> virtual seconds
+        self.claimed = {}
+        self.completed = {}
+        self.batches = []
+        self.polls = 0
+        self.done = asyncio.Event()
+
+    def add_message(self, row: dict):
+        # Arrivals get increasing uuids, so appending keeps input_sms in uuid order
+        self.input_keys.append(row['uuid'])
+        self.input_rows.append(row)
+        self.arrived[str(row['uuid'])] = self.clock.monotonic()
+
+    def _complete(self, sms_uuid: str, row: dict):
+        self.monitor.setdefault(sms_uuid, {}).update(row)
+        self.completed.setdefault(sms_uuid, self.clock.monotonic())
+        if len(self.completed) >= self.expected:
+            self.done.set()
+
+    def dispatch(self, query: str, args: tuple):
+        sql = _normalize(query)
+
+        if sql.startswith("SELECT uuid, sender_number, sms_message, received_timestamp, country_code, local_mobile "
+                          "FROM input_sms WHERE uuid > $1::uuid"):
+            self.query_count += 1
+            self.polls += 1
+            start = bisect.bisect_right(self.input_keys, uuid.UUID(str(args[0])))
+            return self.input_rows[start:start + args[1]]
+
+        if sql.startswith("SELECT i.uuid, i.sender_number, i.sms_message, i.received_timestamp, i.country_code, "
+                          "i.local_mobile FROM sms_monitor m JOIN dead_letter_sms d"):
+            # process_replay_queue: a simulation never replays dead letters
+            self.query_count += 1
+            return []
+
+        if sql.startswith("UPDATE system_settings SET setting_value = $1 WHERE setting_key = 'last_processed_uuid'"):
+            self.query_count += 1
+            self.settings['last_processed_uuid'] = args[0]
+            return []
+
+        if sql.startswith("INSERT INTO system_settings (setting_key, setting_value) VALUES ('batch_timeout', '2.0')"):
+            self.query_count += 1
+            self.settings['batch_timeout'] = '2.0'
+            return []
+
+        if sql.startswith("INSERT INTO sms_monitor (uuid, overall_status, processing_started_at, batch_id"):
+            # claim_batch
+            self.query_count += 1
+            self.batches.append(len(args[0]))
+            rows = []
+            for sms_uuid, country_code, local_mobile in zip(args[0], args[2], args[3]):
+                row = self.monitor.get(sms_uuid)
+                if row is None:
+                    row = self.monitor[sms_uuid] = {'overall_status': 'processing', 'retry_count': 0,
+                                                    'country_code': country_code, 'local_mobile': local_mobile,
+                                                    **dict.fromkeys(CHECK_COLUMNS)}
+                elif row['overall_status'] not in FINAL_STATUSES:
+                    row['retry_count'] += 1
+                self.claimed.setdefault(sms_uuid, self.clock.monotonic())
+                rows.append({'uuid': sms_uuid, **{key: row.get(key) for key in
+                                                  ('overall_status', 'retry_count') + CHECK_COLUMNS}})
+            return rows
+
+        if sql.startswith("INSERT INTO sms_monitor (uuid, overall_status, failed_at_check, processing_completed_at, "
+                          "blacklist_check"):
+            # write_back_verdicts (executemany: one round-trip)
+            self.query_count += 1
+            for values in args[0]:
+                self._complete(values[0], {'overall_status': values[1], 'failed_at_check': values[2],
+                                           **dict(zip(CHECK_COLUMNS, values[3:9]))})
+            return []
+
+        if sql.startswith("INSERT INTO sms_monitor (uuid, overall_status, failed_at_check, processing_completed_at, "
+                          "retry_count)"):
+            # dead_letter_message
+            self.query_count += 1
+            self._complete(args[0], {'overall_status': 'dead_letter', 'failed_at_check': args[1],
+                                     'retry_count': args[2]})
+            return []
+
+        if sql.startswith("INSERT INTO dead_letter_sms"):
+            self.query_count += 1
+            return []
+
+        if sql.startswith("WITH final AS ("):
+            # stats_rollup.record / retract: counted, not aggregated
+            self.query_count += 1
+            return []
+
+        if sql.startswith("INSERT INTO count_sms (sender_number, message_count, country_code, local_mobile) "
+                          "SELECT * FROM unnest"):
+            self.query_count += 1
+            for sender, increment in zip(args[0], args[1]):
+                self.counts[sender] = self.counts.get(sender, 0) + increment
+            return []
+
+        if sql.startswith("INSERT INTO blacklist_sms (sender_number, country_code, local_mobile) SELECT * FROM unnest"):
+            self.query_count += 1
+            self.blacklist.update(args[0])
+            return []
+
+        if sql.startswith("INSERT INTO out_sms (uuid, sender_number, sms_message, country_code, local_mobile) "
+                          "SELECT * FROM unnest"):
+            self.query_count += 1
+            inserted = []
+            for sms_uuid, sender, message, country_code, local_mobile in zip(*args):
+                if sms_uuid not in self.out_sms:
+                    self.out_sms[sms_uuid] = {'sender_number': sender, 'local_mobile': local_mobile,
+                                              'forwarded_timestamp': self.clock.wall()}
+                    inserted.append({'uuid': sms_uuid})
+            return inserted
+
+        return super().dispatch(query, args)
+
+
+class SimulatedConnection(InMemoryConnection):
+    """Stand-in connection where every round-trip costs `latency` virtual seconds."""
+
+    def __init__(self, db: SimulationDatabase, latency: float):
+        super().__init__(db)
+        self.latency = latency
+
+    async def fetch(self, query, *args):
+        await asyncio.sleep(self.latency)
+        return await super().fetch(query, *args)
+
+    async def fetchrow(self, query, *args):
+        await asyncio.sleep(self.latency)
+        return await super().fetchrow(query, *args)
+
+    async def fetchval(self, query, *args):
+        await asyncio.sleep(self.latency)
+        return await super().fetchval(query, *args)
+
+    async def execute(self, query, *args):
+        await asyncio.sleep(self.latency)
+        return await super().execute(query, *args)
+
+    async def executemany(self, query, args):
+        await asyncio.sleep(self.latency)
+        return await super().executemany(query, args)
+
+
+class SimulationPools:
+    """Stands in for sms_server.pool_manager: every named pool is the simulated database."""
+
+    def __init__(self, db: SimulationDatabase, latency: float):
+        self.db = db
+        self.latency = latency
+
+    async def get(self, name: str):
+        return self
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield SimulatedConnection(self.db, self.latency)
+
+
+def build_trace(args) -> list:
+    """Arrival offsets in seconds, ascending."""
+    rng = random.Random(args.seed)
+    if args.csv:
+        stamps = sorted(parse_timestamp(row['received_timestamp']) for row in read_sms_rows(args.csv))
+        return [(stamp - stamps[0]).total_seconds() / args.speed for stamp in stamps]
+    if args.trace == 'steady':
+        return [i / args.rate for i in range(int(args.rate * args.duration))]
+    offsets = []
+    t = 0.0
+    if args.trace == 'poisson':
+        while True:
+            t += rng.expovariate(args.rate)
+            if t >= args.duration:
+                return offsets
+            offsets.append(t)
+    # burst
+    while True:
+        t += rng.expovariate(args.rate / args.burst_size)
+        if t >= args.duration:
+            return offsets
+        offsets.extend(t + i * 0.001 for i in range(args.burst_size))
+
+
+def build_database(clock: VirtualClock, offsets: list, args):
+    """Onboard the trace's senders and decide sender and body of every arrival."""
+    db = SimulationDatabase(clock, len(offsets))
+    db.settings['batch_timeout'] = str(args.batch_timeout)
+    db.settings['batch_size'] = str(args.batch_size)
+    db.settings['validation_time_window'] = str(int((offsets[-1] if offsets else 0) + DRAIN_LIMIT + 120))
+    header = db.settings['permitted_headers'].split(',')[0].strip()
+    mix = SenderMix(args.senders, args.hot_senders, args.hot_fraction, seed=args.seed)
+    onboarded_at = clock.wall() - timedelta(minutes=1)
+    messages = {}
+    for number in mix.numbers:
+        local = mix.local_number(number)
+        onboarding_hash = hashlib.sha256(f"{header}{local}{SALT}".encode('utf-8')).hexdigest()
+        db.add_onboarding(local, onboarding_hash, SALT, request_timestamp=onboarded_at)
+        messages[number] = f"{header}:{onboarding_hash}"
+    arrivals = []
+    for i, offset in enumerate(offsets):
+        number = mix.next_sender()
+        arrivals.append((offset, uuid.UUID(int=i + 1), number, mix.local_number(number), messages[number]))
+    return db, arrivals, mix.country_code
+
+
+async def feed(clock: VirtualClock, db: SimulationDatabase, arrivals: list, country_code: str):
+    """Insert each arrival into input_sms at its virtual time."""
+    for offset, sms_uuid, number, local, message in arrivals:
+        if offset > clock.monotonic():
+            await asyncio.sleep(offset - clock.monotonic())
+        db.add_message({'uuid': sms_uuid, 'sender_number': number, 'sms_message': message,
+                        'received_timestamp': clock.wall(), 'country_code': country_code,
+                        'local_mobile': local})
+
+
+async def simulate(clock: VirtualClock, db: SimulationDatabase, arrivals: list, country_code: str, args) -> dict:
+    import sms_server
+    from checks import duplicate_check
+
+    # Fresh process state per policy: stand-in pools and Redis, empty duplicate filter, no cloud forwarding
+    sms_server.pool_manager = SimulationPools(db, args.db_latency_ms / 1000.0)
+    sms_server.API_KEY = ''
+    sms_server.BATCH_POLL_INTERVAL = args.poll_interval
+    duplicate_check.redis_client = InMemoryRedis()
+    duplicate_check.validated_numbers = duplicate_check.ValidatedNumberFilter()
+
+    processor = asyncio.ensure_future(sms_server.batch_processor(clock=clock))
+    started = time.perf_counter()
+    try:
+        await feed(clock, db, arrivals, country_code)
+        if arrivals:
+            await asyncio.wait_for(db.done.wait(), DRAIN_LIMIT)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        processor.cancel()
+        await asyncio.gather(processor, return_exceptions=True)
+    real_seconds = time.perf_counter() - started
+
+    finished = [sms_uuid for sms_uuid in db.arrived if sms_uuid in db.completed]
+    statuses = {}
+    for sms_uuid in finished:
+        status = db.monitor[sms_uuid]['overall_status']
+        statuses[status] = statuses.get(status, 0) + 1
+    messages = len(db.arrived)
+    return {
+        'batch_size': args.batch_size,
+        'batch_timeout': args.batch_timeout,
+        'messages': messages,
+        'unfinished': messages - len(finished),
+        'statuses': statuses,
+        'queue_delay': summarize([db.claimed[u] - db.arrived[u] for u in finished]),
+        'latency': summarize([db.completed[u] - db.arrived[u] for u in finished]),
+        'batch_fill': {
+            'batches': len(db.batches),
+            'mean_size': round(sum(db.batches) / len(db.batches), 2) if db.batches else 0,
+            'mean_fill': round(sum(db.batches) / len(db.batches) / args.batch_size, 3) if db.batches else 0,
+            'full_batches': sum(1 for size in db.batches if size >= args.batch_size),
+        },
+        'db_calls_per_message': round(db.query_count / messages, 2) if messages else None,
+        'polls': db.polls,
+        'clock_sleeps': clock.sleeps,
+        'virtual_seconds': round(clock.monotonic(), 3),
+        'real_seconds': round(real_seconds, 3),
+    }
+
+
+def run_policy(offsets: list, args) -> dict:
+    clock = VirtualClock(datetime(2024, 1, 1, tzinfo=timezone.utc))
+    loop = SimulationLoop(clock)
+    asyncio.set_event_loop(loop)
+    try:
+        db, arrivals, country_code = build_database(clock, offsets, args)
+        return loop.run_until_complete(simulate(clock, db, arrivals, country_code, args))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch processor simulation in virtual time")
+    parser.add_argument('--trace', choices=['steady', 'poisson', 'burst'], default='poisson')
+    parser.add_argument('--rate', type=float, default=20.0, help="Mean arrivals per second")
+    parser.add_argument('--duration', type=float, default=600.0, help="Trace length in virtual seconds")
+    parser.add_argument('--burst-size', type=int, default=50, help="Messages per burst (--trace burst)")
+    parser.add_argument('--csv', help="Use the arrival gaps of a capture instead of a synthetic trace")
+    parser.add_argument('--speed', type=float, default=1.0, help="Time compression of the --csv capture")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[20])
+    parser.add_argument('--timeouts', type=float, nargs='+', default=[2.0], help="batch_timeout values (s)")
+    parser.add_argument('--poll-interval', type=float, default=0.1, help="Polls while a partial batch waits (s)")
+    parser.add_argument('--db-latency-ms', type=float, default=1.0, help="Virtual cost of each database call")
+    parser.add_argument('--senders', type=int, default=10000)
+    parser.add_argument('--hot-senders', type=int, default=0)
+    parser.add_argument('--hot-fraction', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', action='store_true', help="Emit machine-readable JSON")
+    args = parser.parse_args(argv)
+
+    # Processor errors (e.g. a query the stand-in does not know) are logged, not raised
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    offsets = build_trace(args)
+    results = []
+    for batch_size in args.batch_sizes:
+        for batch_timeout in args.timeouts:
+            args.batch_size, args.batch_timeout = batch_size, batch_timeout
+            results.append(run_policy(offsets, args))
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return
+
+    print(f"{len(offsets)} arrivals over {offsets[-1] if offsets else 0:.1f}s virtual time")
+    print(f"{'size':>6}{'timeout':>9}{'batches':>9}{'fill':>7}{'wait p50':>10}{'wait p99':>10}"
+          f"{'done p99':>10}{'db/msg':>8}{'polls':>8}{'real s':>8}")
+    for r in results:
+        print(f"{r['batch_size']:>6}{r['batch_timeout']:>9}{r['batch_fill']['batches']:>9}"
+              f"{r['batch_fill']['mean_fill']:>7}{r['queue_delay']['p50_ms']:>10}{r['queue_delay']['p99_ms']:>10}"
+              f"{r['latency']['p99_ms']:>10}{r['db_calls_per_message']:>8}{r['polls']:>8}{r['real_seconds']:>8}")
+        if r['unfinished']:
+            print(f"{'':>6}{r['unfinished']} messages not finished within {DRAIN_LIMIT:.0f}s after the last arrival")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+In-memory stand-ins for the asyncpg pool and the Redis client.
+
+They answer the queries the validation checks issue with plain dictionaries,
+so micro-benchmarks measure the Python cost of the checks themselves and
+count how many database round-trips each one needs. Any query the stand-in
+does not understand raises NotImplementedError with the SQL text, so drift
+between the checks and the stand-in is caught immediately.
+"""
+import os
+import re
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+SCHEMA_FILE = os.path.join(os.path.dirname(__file__), '..', '..', 'schema.sql')
+
+
+def load_default_settings(schema_path: str = SCHEMA_FILE) -> dict:
+    """Read the seeded system_settings values straight from schema.sql."""
+    settings = {}
+    with open(schema_path, encoding='utf-8') as f:
+        schema = f.read()
+    for key, value in re.findall(r"^\s*\('(\w+)',\s*'(.*)'\),?\s*$", schema, re.MULTILINE):
+        settings[key] = value
+    for value, key in re.findall(
+        r"UPDATE system_settings\s+SET setting_value = '(.*?)'\s+WHERE setting_key = '(\w+)'", schema
+    ):
+        settings[key] = value
+    settings.setdefault('permitted_headers', 'ONBOARD')
+    return settings
+
+
+def _normalize(query: str) -> str:
+    return ' '.join(query.split())
+
+
+class InMemoryDatabase:
+    """Tables used by the checks, kept as dictionaries."""
+
+    def __init__(self, settings: dict = None):
+        self.settings = dict(settings if settings is not None else load_default_settings())
+        self.onboarding = {}   # mobile_number -> row dict
+        self.counts = {}       # sender_number -> message_count
+        self.blacklist = set()
+        self.out_sms = {}      # uuid -> row dict
+        self.query_count = 0
+
+    def add_onboarding(self, mobile_number: str, hash_value: str, salt: str = '',
+                       request_timestamp: datetime = None, is_active: bool = True):
+        self.onboarding[mobile_number] = {
+            'mobile_number': mobile_number,
+            'hash': hash_value,
+            'salt': salt,
+            'request_timestamp': request_timestamp or datetime.now(timezone.utc),
+            'is_active': is_active,
+        }
+
+    def _active_onboarding(self, mobile_number):
+        row = self.onboarding.get(mobile_number)
+        return row if row and row['is_active'] else None
+
+    def dispatch(self, query: str, args: tuple):
+        self.query_count += 1
+        sql = _normalize(query)
+
+        match = re.match(r"SELECT setting_value FROM system_settings WHERE setting_key = (?:\$1|'(\w+)')$", sql)
+        if match:
+            return [{'setting_value': self.settings.get(match.group(1) or args[0])}]
+
+        if sql.startswith("SELECT setting_key, setting_value FROM system_settings WHERE setting_key = ANY($1"):
+            return [{'setting_key': k, 'setting_value': self.settings[k]} for k in args[0] if k in self.settings]
+
+        if sql == "SELECT setting_key, setting_value FROM system_settings":
+            return [{'setting_key': k, 'setting_value': v} for k, v in self.settings.items()]
+
+        if sql.startswith("SELECT mobile_number, hash, request_timestamp FROM onboarding_mobile WHERE mobile_number = ANY($1"):
+            rows = (self._active_onboarding(m) for m in args[0])
+            return [{'mobile_number': r['mobile_number'], 'hash': r['hash'], 'request_timestamp': r['request_timestamp']}
+                    for r in rows if r]
+
+        if sql.startswith("SELECT hash, request_timestamp FROM onboarding_mobile WHERE mobile_number = $1 AND is_active = true"):
+            row = self._active_onboarding(args[0])
+            return [{'hash': row['hash'], 'request_timestamp': row['request_timestamp']}] if row else []
+
+        if sql.startswith("SELECT sender_number, message_count FROM count_sms WHERE sender_number = ANY($1"):
+            return [{'sender_number': n, 'message_count': self.counts[n]} for n in args[0] if n in self.counts]
+
+        if sql.startswith("SELECT message_count FROM count_sms WHERE sender_number = $1"):
+            return [{'message_count': self.counts[args[0]]}] if args[0] in self.counts else []
+
+        if sql.startswith("SELECT hash FROM onboarding_mobile WHERE mobile_number = $1 AND is_active = true"):
+            row = self._active_onboarding(args[0])
+            return [{'hash': row['hash']}] if row else []
+
+        if sql.startswith("SELECT request_timestamp FROM onboarding_mobile WHERE mobile_number = $1 AND is_active = true"):
+            row = self._active_onboarding(args[0])
+            return [{'request_timestamp': row['request_timestamp']}] if row else []
+
+        if sql.startswith("SELECT mobile_number, request_timestamp FROM onboarding_mobile WHERE is_active = true"):
+            since = args[0] if args else None
+            return [{'mobile_number': m, 'request_timestamp': row['request_timestamp']}
+                    for m, row in self.onboarding.items()
+                    if row['is_active'] and (since is None or row['request_timestamp'] > since)]
+
+        if sql.startswith("SELECT EXISTS(SELECT 1 FROM onboarding_mobile WHERE mobile_number = $1 AND is_active = true)"):
+            return [{'exists': self._active_onboarding(args[0]) is not None}]
+
+        if sql.startswith("SELECT COALESCE(local_mobile, sender_number) AS number"):
+            # Duplicate filter load/sync; rows carry a forwarded_timestamp
+            latest = {}
+            for row in self.out_sms.values():
+                number = row.get('local_mobile') or row['sender_number']
+                if args and isinstance(args[0], datetime) and row['forwarded_timestamp'] <= args[0]:
+                    continue
+                if number not in latest or row['forwarded_timestamp'] > latest[number]:
+                    latest[number] = row['forwarded_timestamp']
+            return [{'number': n, 'forwarded_timestamp': ts} for n, ts in latest.items()]
+
+        if sql.startswith("INSERT INTO count_sms"):
+            sender = args[0]
+            self.counts[sender] = self.counts.get(sender, 0) + 1
+            return [{'message_count': self.counts[sender]}]
+
+        if sql.startswith("INSERT INTO blacklist_sms"):
+            self.blacklist.add(args[0])
+            return []
+
+        raise NotImplementedError(f"In-memory stand-in does not support query: {sql}")
+
+
+class InMemoryConnection:
+    def __init__(self, db: InMemoryDatabase):
+        self.db = db
+
+    async def fetch(self, query, *args):
+        return self.db.dispatch(query, args)
+
+    async def fetchrow(self, query, *args):
+        rows = self.db.dispatch(query, args)
+        return rows[0] if rows else None
+
+    async def fetchval(self, query, *args):
+        rows = self.db.dispatch(query, args)
+        if not rows:
+            return None
+        return next(iter(rows[0].values()))
+
+    async def execute(self, query, *args):
+        self.db.dispatch(query, args)
+        return "OK"
+
+    async def executemany(self, query, args):
+        # One round-trip for the whole argument list, as with asyncpg
+        self.db.dispatch(query, (list(args),))
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+class InMemoryPool:
+    """Drop-in for the parts of asyncpg.Pool the checks use."""
+
+    def __init__(self, db: InMemoryDatabase = None):
+        self.db = db or InMemoryDatabase()
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield InMemoryConnection(self.db)
+
+
+class InMemoryRedis:
+    """Key and set commands used for duplicate tracking, with a call counter (TTLs are ignored)."""
+
+    def __init__(self):
+        self.sets = {}
+        self.values = {}
+        self.published = []    # (channel, message)
+        self.command_count = 0
+
+    def set(self, key, value, ex=None):
+        self.command_count += 1
+        self.values[key] = value
+        return True
+
+    def exists(self, *keys):
+        self.command_count += 1
+        return sum(1 for key in keys if key in self.values)
+
+    def sadd(self, key, *members):
+        self.command_count += 1
+        target = self.sets.setdefault(key, set())
+        before = len(target)
+        target.update(str(m) for m in members)
+        return len(target) - before
+
+    def sismember(self, key, member):
+        self.command_count += 1
+        return str(member) in self.sets.get(key, ())
+
+    def scard(self, key):
+        self.command_count += 1
+        return len(self.sets.get(key, ()))
+
+    def delete(self, *keys):
+        self.command_count += 1
+        return sum(1 for key in keys if self.values.pop(key, None) is not None)
+
+    def publish(self, channel, message):
+        self.command_count += 1
+        self.published.append((channel, message))
+        return 0
+
+    def pipeline(self, transaction=False):
+        return InMemoryPipeline(self)
+
+
+class InMemoryPipeline:
+    """Queues InMemoryRedis commands and runs them on execute()."""
+
+    def __init__(self, redis_standin: InMemoryRedis):
+        self.redis = redis_standin
+        self.commands = []
+
+    def __getattr__(self, command):
+        def queue(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        results = [getattr(self.redis, command)(*args, **kwargs) for command, args, kwargs in self.commands]
+        self.commands = []
+        return results
@@ -1,10 +1,14 @@
 import os
 import json
+import time
 import pandas as pd
 import requests
 import hashlib
+import heapq
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
-from flask import Flask, request, render_template, jsonify, redirect, url_for, flash
+from flask import Flask, request, render_template, jsonify, redirect, url_for, flash, Response, stream_with_context
+from requests.adapters import HTTPAdapter
 from werkzeug.utils import secure_filename
 
 app = Flask(__name__)
@@ -14,14 +18,104 @@ app.secret_key = 'sms_bridge_test_secret_key'
 SMS_BRIDGE_URL = os.getenv('SMS_BRIDGE_URL', 'http://localhost:30080')
 UPLOAD_FOLDER = '/app/uploads'
 ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv'}
+REQUIRED_COLUMNS = ['sender_number', 'sms_message', 'received_timestamp']
+
+# Bulk replay tuning
+REPLAY_CHUNK_SIZE = int(os.getenv('REPLAY_CHUNK_SIZE', 1000))
+REPLAY_CONCURRENCY = int(os.getenv('REPLAY_CONCURRENCY', 16))
+REPLAY_MAX_CONCURRENCY = 128
+RESULTS_DISPLAY_LIMIT = int(os.getenv('RESULTS_DISPLAY_LIMIT', 1000))
+PROGRESS_INTERVAL_ROWS = 500
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Shared HTTP session so requests to the SMS Bridge reuse pooled keep-alive connections
+http_session = requests.Session()
+http_session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=REPLAY_MAX_CONCURRENCY))
+http_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=REPLAY_MAX_CONCURRENCY))
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def iter_file_rows(filepath, chunk_size=REPLAY_CHUNK_SIZE):
+    """
+    Stream SMS rows from a CSV or Excel file without loading the whole sheet.
+    Yields (row_number, row_dict) with 1-based row numbers.
+    Raises ValueError if the required columns are missing.
+    """
+    if filepath.endswith('.xls'):
+        # Legacy .xls cannot be read incrementally
+        df = pd.read_excel(filepath, dtype=str)
+        if not all(col in df.columns for col in REQUIRED_COLUMNS):
+            raise ValueError(f'File must contain columns: {", ".join(REQUIRED_COLUMNS)}')
+        for index, record in enumerate(df[REQUIRED_COLUMNS].itertuples(index=False), start=1):
+            yield index, dict(zip(REQUIRED_COLUMNS, record))
+    elif filepath.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        workbook = load_workbook(filepath, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(col).strip() if col is not None else '' for col in next(rows, ())]
+            missing = [col for col in REQUIRED_COLUMNS if col not in header]
+            if missing:
+                raise ValueError(f'File must contain columns: {", ".join(REQUIRED_COLUMNS)}')
+            positions = {col: header.index(col) for col in REQUIRED_COLUMNS}
+            for index, values in enumerate(rows, start=1):
+                yield index, {col: values[pos] for col, pos in positions.items()}
+        finally:
+            workbook.close()
+    else:
+        row_number = 0
+        for chunk in pd.read_csv(filepath, chunksize=chunk_size, dtype=str):
+            if not all(col in chunk.columns for col in REQUIRED_COLUMNS):
+                raise ValueError(f'File must contain columns: {", ".join(REQUIRED_COLUMNS)}')
+            for record in chunk[REQUIRED_COLUMNS].itertuples(index=False):
+                row_number += 1
+                yield row_number, dict(zip(REQUIRED_COLUMNS, record))
+
+def replay_rows(rows, concurrency=REPLAY_CONCURRENCY):
+    """
+    Send rows to the SMS Bridge with up to `concurrency` requests in flight.
+    Consumes `rows` lazily and yields one result dict per row as it completes,
+    so memory stays bounded regardless of file size.
+    """
+    concurrency = max(1, min(int(concurrency), REPLAY_MAX_CONCURRENCY))
+
+    def send(row_number, row):
+        result = send_sms_to_bridge(
+            str(row['sender_number']),
+            str(row['sms_message']),
+            str(row['received_timestamp'])
+        )
+        return {
+            'row': row_number,
+            'sender_number': row['sender_number'],
+            'success': result['success'],
+            'response': result.get('response', result.get('error'))
+        }
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+        for row_number, row in rows:
+            pending.add(executor.submit(send, row_number, row))
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+def save_upload(file):
+    """Save an uploaded file and return its path, or None if the file is not acceptable."""
+    if not file or file.filename == '' or not allowed_file(file.filename):
+        return None
+    filename = secure_filename(file.filename)
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    file.save(filepath)
+    return filepath
+
 def send_sms_to_bridge(sender_number, sms_message, received_timestamp):
     """Send SMS to the SMS Bridge server"""
     try:
@@ -31,7 +125,7 @@ def send_sms_to_bridge(sender_number, sms_message, received_timestamp):
             "received_timestamp": received_timestamp
         }
         
-        response = requests.post(
+        response = http_session.post(
             f"{SMS_BRIDGE_URL}/sms/receive",
             json=payload,
             headers={'Content-Type': 'application/json'},
@@ -56,7 +150,7 @@ def register_mobile_onboarding(mobile_number):
             "mobile_number": mobile_number
         }
         
-        response = requests.post(
+        response = http_session.post(
             f"{SMS_BRIDGE_URL}/onboarding/register",
             json=payload,
             headers={'Content-Type': 'application/json'},
@@ -74,10 +168,35 @@ def register_mobile_onboarding(mobile_number):
             'error': str(e)
         }
 
+def read_mobile_numbers(filepath):
+    """Mobile numbers from the `mobile_number` column (else the first column) of an uploaded file."""
+    if filepath.endswith('.csv'):
+        df = pd.read_csv(filepath, dtype=str)
+    else:
+        df = pd.read_excel(filepath, dtype=str)
+    column = 'mobile_number' if 'mobile_number' in df.columns else df.columns[0]
+    return [str(number).strip() for number in df[column].dropna()]
+
+def register_mobiles_bulk(mobile_numbers):
+    """Register many mobile numbers in one call; yields the bridge's NDJSON lines as they arrive"""
+    response = http_session.post(
+        f"{SMS_BRIDGE_URL}/onboarding/register/bulk",
+        json={"mobile_numbers": mobile_numbers},
+        stream=True,
+        timeout=(10, 600)
+    )
+    with response:
+        if response.status_code != 200:
+            yield json.dumps({'type': 'error', 'status_code': response.status_code, 'error': response.text})
+            return
+        for line in response.iter_lines(decode_unicode=True):
+            if line:
+                yield line
+
 def get_onboarding_status(mobile_number):
     """Get onboarding status for mobile number"""
     try:
-        response = requests.get(
+        response = http_session.get(
             f"{SMS_BRIDGE_URL}/onboarding/status/{mobile_number}",
             timeout=10
         )
@@ -134,6 +253,56 @@ def register_mobile():
         flash(f'Failed to register mobile: {error_msg}', 'error')
         return redirect(url_for('onboarding'))
 
+@app.route('/register_bulk', methods=['POST'])
+def register_bulk():
+    """
+    Bulk onboarding from an uploaded file of mobile numbers.
+    Streams the bridge's NDJSON back: one 'result' per number with its HEADER:hash message, then a 'summary'.
+    """
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({'success': False, 'error': 'No file selected'}), 400
+    
+    filepath = save_upload(request.files['file'])
+    if not filepath:
+        return jsonify({'success': False, 'error': 'Invalid file type. Upload Excel (.xlsx, .xls) or CSV files only.'}), 400
+    
+    try:
+        mobile_numbers = read_mobile_numbers(filepath)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Error reading file: {str(e)}'}), 400
+    
+    def generate():
+        try:
+            for line in register_mobiles_bulk(mobile_numbers):
+                yield line + '\n'
+        except Exception as e:
+            yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/results_stream/<mobile_number>')
+def results_stream(mobile_number):
+    """Relay the SMS Bridge's Server-Sent Events result feed for one mobile number to the browser"""
+    try:
+        response = http_session.get(
+            f"{SMS_BRIDGE_URL}/results/{mobile_number}/events",
+            stream=True,
+            timeout=(10, None)
+        )
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 502
+    if response.status_code != 200:
+        response.close()
+        return jsonify({'success': False, 'error': response.text}), response.status_code
+    
+    def generate():
+        with response:
+            for chunk in response.iter_content(chunk_size=None):
+                yield chunk
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/check_status', methods=['POST'])
 def check_onboarding_status():
     """Check onboarding status for mobile number"""
@@ -183,75 +352,99 @@ def send_single_sms():
 @app.route('/upload_file', methods=['POST'])
 def upload_file():
     """Upload and process Excel/CSV file with SMS data"""
-    if 'file' not in request.files:
+    if 'file' not in request.files or request.files['file'].filename == '':
         flash('No file selected', 'error')
         return redirect(url_for('index'))
     
-    file = request.files['file']
-    if file.filename == '':
-        flash('No file selected', 'error')
+    filepath = save_upload(request.files['file'])
+    if not filepath:
+        flash('Invalid file type. Please upload Excel (.xlsx, .xls) or CSV files only.', 'error')
         return redirect(url_for('index'))
+    filename = os.path.basename(filepath)
     
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+    try:
+        concurrency = int(request.form.get('concurrency', REPLAY_CONCURRENCY))
+        
+        # Rows are streamed from the file and sent concurrently, so results arrive in
+        # completion order; the RESULTS_DISPLAY_LIMIT lowest row numbers are kept for
+        # display (a max-heap on the row number)
+        kept = []
+        total_rows = 0
+        success_count = 0
+        error_count = 0
+        
+        for result in replay_rows(iter_file_rows(filepath), concurrency):
+            total_rows += 1
+            if result['success']:
+                success_count += 1
+            else:
+                error_count += 1
+            if len(kept) < RESULTS_DISPLAY_LIMIT:
+                heapq.heappush(kept, (-result['row'], result))
+            elif result['row'] < -kept[0][0]:
+                heapq.heapreplace(kept, (-result['row'], result))
+        
+        results = sorted((result for _, result in kept), key=lambda r: r['row'])
+        session_results = {
+            'filename': filename,
+            'total_rows': total_rows,
+            'success_count': success_count,
+            'error_count': error_count,
+            'results': results
+        }
+        
+        flash(f'File processed: {success_count} successful, {error_count} failed out of {total_rows} total', 'info')
+        if total_rows > len(results):
+            flash(f'Showing the first {len(results)} results; use streaming replay for large files', 'info')
+        return render_template('results.html', results=session_results)
         
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('index'))
+    except Exception as e:
+        flash(f'Error processing file: {str(e)}', 'error')
+        return redirect(url_for('index'))
+
+@app.route('/replay_file', methods=['POST'])
+def replay_file():
+    """
+    Streaming bulk replay for large captures.
+    Streams NDJSON lines: one 'result' per row, periodic 'progress' lines and a final 'summary'.
+    """
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({'success': False, 'error': 'No file selected'}), 400
+    
+    filepath = save_upload(request.files['file'])
+    if not filepath:
+        return jsonify({'success': False, 'error': 'Invalid file type. Upload Excel (.xlsx, .xls) or CSV files only.'}), 400
+    
+    try:
+        concurrency = int(request.form.get('concurrency', REPLAY_CONCURRENCY))
+        only_errors = request.form.get('only_errors', 'false').lower() == 'true'
+    except ValueError:
+        return jsonify({'success': False, 'error': 'concurrency must be an integer'}), 400
+    
+    def generate():
+        started = time.monotonic()
+        stats = {'type': 'progress', 'sent': 0, 'success_count': 0, 'error_count': 0}
         try:
-            # Read the file based on extension
-            if filename.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(filepath)
-            elif filename.endswith('.csv'):
-                df = pd.read_csv(filepath)
-            
-            # Validate required columns
-            required_columns = ['sender_number', 'sms_message', 'received_timestamp']
-            if not all(col in df.columns for col in required_columns):
-                flash(f'File must contain columns: {", ".join(required_columns)}', 'error')
-                return redirect(url_for('index'))
-            
-            # Process each row
-            results = []
-            success_count = 0
-            error_count = 0
-            
-            for index, row in df.iterrows():
-                result = send_sms_to_bridge(
-                    str(row['sender_number']),
-                    str(row['sms_message']),
-                    str(row['received_timestamp'])
-                )
-                
-                results.append({
-                    'row': index + 1,
-                    'sender_number': row['sender_number'],
-                    'success': result['success'],
-                    'response': result.get('response', result.get('error'))
-                })
-                
-                if result['success']:
-                    success_count += 1
-                else:
-                    error_count += 1
-            
-            # Store results in session for display
-            session_results = {
-                'filename': filename,
-                'total_rows': len(df),
-                'success_count': success_count,
-                'error_count': error_count,
-                'results': results
-            }
-            
-            flash(f'File processed: {success_count} successful, {error_count} failed out of {len(df)} total', 'info')
-            return render_template('results.html', results=session_results)
-            
+            for result in replay_rows(iter_file_rows(filepath), concurrency):
+                stats['sent'] += 1
+                stats['success_count' if result['success'] else 'error_count'] += 1
+                if not (only_errors and result['success']):
+                    yield json.dumps({'type': 'result', **result}, default=str) + '\n'
+                if stats['sent'] % PROGRESS_INTERVAL_ROWS == 0:
+                    elapsed = time.monotonic() - started
+                    stats['rows_per_sec'] = round(stats['sent'] / elapsed, 1) if elapsed else None
+                    yield json.dumps(stats) + '\n'
         except Exception as e:
-            flash(f'Error processing file: {str(e)}', 'error')
-            return redirect(url_for('index'))
-    else:
-        flash('Invalid file type. Please upload Excel (.xlsx, .xls) or CSV files only.', 'error')
-        return redirect(url_for('index'))
+            yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'
+        elapsed = time.monotonic() - started
+        summary = dict(stats, type='summary', filename=os.path.basename(filepath), seconds=round(elapsed, 3))
+        summary['rows_per_sec'] = round(stats['sent'] / elapsed, 1) if elapsed else None
+        yield json.dumps(summary) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/health')
 def health_check():
@@ -0,0 +1,77 @@
+"""
+Result feed WebSocket endpoint, served in process through Starlette's TestClient.
+
+Run from the repository root: python -m pytest tests/test_result_feed.py
+"""
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import sms_server
+from checks import result_feed
+from checks.result_feed import ResultHub, RESULT_CHANNEL
+from tests.bench.standins import InMemoryRedis
+
+
+@pytest.fixture
+def redis_standin(monkeypatch):
+    standin = InMemoryRedis()
+    monkeypatch.setattr(result_feed, 'get_redis_client', lambda: standin)
+    return standin
+
+
+@pytest.fixture
+def hub(monkeypatch, redis_standin):
+    hub = ResultHub(reconnect_delay=0.1)
+    monkeypatch.setattr(sms_server, 'result_hub', hub)
+    yield hub
+    hub.stop()
+
+
+@pytest.fixture
+def client():
+    # Only the routes: the app's startup events would open the database pool
+    app = FastAPI()
+    app.include_router(sms_server.router)
+    return TestClient(app)
+
+
+def wait_for_subscriber(hub: ResultHub, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not hub.subscribers:
+        assert time.monotonic() < deadline, "WebSocket never subscribed to the result feed"
+        time.sleep(0.01)
+
+
+def test_websocket_receives_results_for_its_number(hub, client, redis_standin):
+    event = {'uuid': '00000000-0000-0000-0000-000000000001', 'local_mobile': '9876543210',
+             'country_code': '91', 'overall_status': 'valid', 'failed_at_check': None}
+    other = dict(event, uuid='00000000-0000-0000-0000-000000000002', local_mobile='9123456789')
+
+    with client.websocket_connect('/results/9876543210/ws') as websocket:
+        wait_for_subscriber(hub)
+        # publish() runs on the server's event loop, as it does in the batch processor
+        websocket.portal.call(hub.publish, [other, event])
+        assert websocket.receive_json() == event
+
+    assert [channel for channel, _ in redis_standin.published] == [RESULT_CHANNEL, RESULT_CHANNEL]
+    assert hub.stats()['delivered'] == 1
+
+
+def test_websocket_unsubscribes_on_disconnect(hub, client):
+    with client.websocket_connect('/results/9876543210/ws'):
+        wait_for_subscriber(hub)
+    deadline = time.monotonic() + 2.0
+    while hub.subscribers:
+        assert time.monotonic() < deadline, "closed WebSocket still subscribed"
+        time.sleep(0.01)
+
+
+def test_websocket_rejects_invalid_number(hub, client):
+    from starlette.websockets import WebSocketDisconnect
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect('/results/not-a-number/ws'):
+            pass
+    assert closed.value.code == 1008